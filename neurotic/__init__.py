@@ -98,6 +98,20 @@ global_config = {
     'app': {
         'auto_check_for_updates': True,
     },
+    'downloads': {
+        # limits on simultaneous downloads
+        'max_concurrent_downloads': 8,
+        'max_connections_per_host': 4,
+
+        # retrying after temporary errors, with the delay in seconds doubling
+        # after each retry
+        'max_retries': 5,
+        'retry_delay': 1,
+
+        # downloading large files in several parts at once
+        'segments_per_file': 4,
+        'min_segment_size_mb': 32,
+    },
 }
 
 # keep a copy of the original config before it is modified
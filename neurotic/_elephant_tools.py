@@ -44,8 +44,11 @@ eliminate dependency on that package. Original code that builds on this work
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
+import os
 import warnings
+import concurrent.futures
 import numpy as np
+import scipy.fft
 import scipy.signal
 import scipy.special
 import quantities as pq
@@ -760,7 +763,9 @@ def rauc(signal, baseline=None, bin_duration=None, t_start=None, t_stop=None):
     baseline : string or quantities.Quantity
         A factor to subtract from the signal before rectification. If `'mean'`
         or `'median'`, the mean or median value of the entire signal is
-        subtracted on a channel-by-channel basis.
+        subtracted on a channel-by-channel basis. The median is exact unless
+        the signal is very long, in which case it is estimated in bounded
+        memory (see :func:`signal_median`).
         Default: None
     t_start, t_stop : quantities.Quantity
         Times to start and end the algorithm. The signal is cropped using
@@ -790,55 +795,397 @@ def rauc(signal, baseline=None, bin_duration=None, t_start=None, t_stop=None):
         If `baseline` is not None, `'mean'`, `'median'`, or a Quantity.
     '''
 
+    data, baseline, sig_t_start = _rauc_data(signal, baseline, t_start, t_stop)
+    samples_per_bin = _rauc_samples_per_bin(signal, bin_duration, data.shape[0])
+
+    # rectify and integrate over each bin
+    rauc = _rauc_bins(data, samples_per_bin,
+                      signal.sampling_period.magnitude, baseline)
+
+    return _rauc_output(rauc, signal.units * signal.sampling_period.units,
+                        signal.sampling_period, sig_t_start, samples_per_bin)
+
+def cumulative_rauc(signal, baseline=None, t_start=None, t_stop=None,
+                    base_bin_duration=None, max_block_elements=2**20):
+    '''
+    Calculate the cumulative rectified area under the curve (RAUC) for an
+    AnalogSignal.
+
+    The rectified signal is integrated once, from the start of the signal up to
+    the first and last sample of every bin of duration `base_bin_duration`.
+    The RAUC for that bin duration or any multiple of it can then be found
+    using :func:`rauc_from_cumulative`, which differences the cumulative
+    integral at the bin edges in time proportional to the number of bins
+    without revisiting the signal. Only two values per base bin and channel
+    are kept, so memory use is proportional to the number of base bins.
+
+    Parameters
+    ----------
+    signal : neo.AnalogSignal
+        The signal to integrate. If `signal` contains more than one channel,
+        each is integrated separately.
+    baseline : string or quantities.Quantity
+        See :func:`rauc`.
+        Default: None
+    t_start, t_stop : quantities.Quantity
+        See :func:`rauc`.
+        Default: None
+    base_bin_duration : quantities.Quantity
+        The shortest bin duration for which RAUCs can be found. If None, the
+        integral is kept for every sample, so that RAUCs can be found for any
+        bin duration.
+        Default: None
+
+    Returns
+    -------
+    neo.AnalogSignal
+        The cumulative integral of the rectified signal at the first sample of
+        each base bin, with the same number of channels as the input signal
+        and a sampling period equal to the base bin duration. The integral at
+        the last sample of each base bin is stored in the `rauc_ends`
+        annotation, and the area between the final sample and zero, needed
+        for a final bin padded with zeros, in the `rauc_tail` annotation.
+
+    Raises
+    ------
+    TypeError
+        If the input signal is not a neo.AnalogSignal.
+    TypeError
+        If `baseline` is not None, `'mean'`, `'median'`, or a Quantity.
+    TypeError
+        If `base_bin_duration` is not None or a Quantity.
+    '''
+
+    data, baseline, sig_t_start = _rauc_data(signal, baseline, t_start, t_stop)
+
+    n_samples, n_channels = data.shape
+    dx = signal.sampling_period.magnitude
+
+    if base_bin_duration is None:
+        samples_per_bin = 1
+    else:
+        samples_per_bin = max(_rauc_samples_per_bin(signal, base_bin_duration, n_samples), 1)
+    n_bins = -(-n_samples // samples_per_bin)
+    bin_starts = np.arange(n_bins) * samples_per_bin
+    bin_ends = np.minimum(bin_starts + samples_per_bin - 1, n_samples - 1)
+
+    # starts[k] and ends[k] are the trapezoid rule integrals of the rectified
+    # signal from the first sample to the first and last samples of bin k,
+    # which are the same if bins are one sample long
+    starts = np.empty((n_bins, n_channels))
+    ends = starts if samples_per_bin == 1 else np.empty((n_bins, n_channels))
+    tail = np.zeros(n_channels)
+    carry = np.zeros(n_channels)
+    block_rows = max(max_block_elements // max(n_channels, 1), 1)
+    for start in range(0, n_samples, block_rows):
+        stop = min(start + block_rows, n_samples)
+        y = data[start:stop]
+        if baseline is not None:
+            y = y - baseline
+        y = np.abs(y)
+        if start == 0:
+            first = y[0].copy()
+        prefix = carry + np.cumsum(y, axis=0)
+        carry = prefix[-1]
+        integral = dx * (prefix - (first + y) / 2)
+        for edges, values in [(bin_starts, starts), (bin_ends, ends)]:
+            i, j = np.searchsorted(edges, [start, stop])
+            values[i:j] = integral[edges[i:j] - start]
+        tail = dx * y[-1] / 2
+
+    integral_sig = neo.AnalogSignal(
+        starts,
+        units=signal.units * signal.sampling_period.units,
+        t_start=sig_t_start,
+        sampling_period=samples_per_bin * signal.sampling_period,
+        rauc_ends=ends,
+        rauc_tail=tail,
+        rauc_n_samples=n_samples,
+        rauc_sampling_period=signal.sampling_period)
+    return integral_sig
+
+def rauc_from_cumulative(integral, bin_duration=None):
+    '''
+    Calculate the rectified area under the curve (RAUC) from the output of
+    :func:`cumulative_rauc`.
+
+    The result is the same as that of :func:`rauc` for the same
+    `bin_duration`, up to floating point rounding, if `bin_duration` is a
+    multiple of the base bin duration of `integral`. Otherwise, it is rounded
+    to the nearest multiple.
+
+    Parameters
+    ----------
+    integral : neo.AnalogSignal
+        A cumulative integral returned by :func:`cumulative_rauc`.
+    bin_duration : quantities.Quantity
+        See :func:`rauc`.
+        Default: None
+
+    Returns
+    -------
+    quantities.Quantity or neo.AnalogSignal
+        See :func:`rauc`.
+
+    Raises
+    ------
+    TypeError
+        If `bin_duration` is not None or a Quantity.
+    '''
+
+    n_bins, n_channels = integral.shape
+    n_samples = integral.annotations['rauc_n_samples']
+    sampling_period = integral.annotations['rauc_sampling_period']
+    samples_per_base_bin = int(np.round((integral.sampling_period / sampling_period).simplified.magnitude))
+
+    # the number of base bins in each bin
+    bins_per_bin = _rauc_samples_per_bin(integral, bin_duration, n_bins)
+    bins_per_bin = max(bins_per_bin, 1)
+    if bin_duration is None:
+        samples_per_bin = max(n_samples, 1)
+    else:
+        samples_per_bin = bins_per_bin * samples_per_base_bin
+
+    if n_bins > 0:
+        starts = np.arange(0, n_bins, bins_per_bin)
+        ends = np.minimum(starts + bins_per_bin - 1, n_bins - 1)
+        rauc = integral.annotations['rauc_ends'][ends] - integral.magnitude[starts]
+        if n_samples % samples_per_bin:
+            # the final bin is padded with zeros
+            rauc[-1] += integral.annotations['rauc_tail']
+    else:
+        rauc = np.zeros((1, n_channels))
+
+    return _rauc_output(rauc, integral.units, sampling_period,
+                        integral.t_start, samples_per_bin)
+
+class StreamingQuantile(object):
+    '''
+    Estimate quantiles of multichannel data fed in chunks, using bounded
+    memory.
+
+    Samples are counted in a histogram with `n_bins` bins for each channel.
+    The histogram range starts at the range of the first chunk and is doubled
+    as needed to cover later chunks by merging adjacent bins, so memory use
+    does not depend on the amount of data. Each estimated quantile is within
+    one bin width (:attr:`error`) of the true value. Non-finite samples are
+    ignored.
+
+    Chunks may come from any source, such as consecutive slices of an
+    in-memory signal or chunks read from a :mod:`neo.rawio` reader, as long
+    as each has shape (samples, channels) with the same number of channels.
+
+    Parameters
+    ----------
+    n_bins : int
+        The number of histogram bins for each channel. Must be even.
+        Default: 4096
+    '''
+
+    def __init__(self, n_bins=4096):
+        if n_bins < 2 or n_bins % 2:
+            raise ValueError('n_bins must be a positive even number: {}'.format(n_bins))
+
+        self.n_bins = n_bins
+        self.counts = None
+        self.lower = None
+        self.width = None
+
+    @property
+    def error(self):
+        '''
+        The maximum error of estimated quantiles for each channel.
+        '''
+        return self.width
+
+    def update(self, chunk):
+        '''
+        Add the samples in `chunk` to the histogram.
+        '''
+
+        chunk = np.asarray(chunk, dtype=float)
+        if chunk.ndim == 1:
+            chunk = chunk[:, np.newaxis]
+        finite = np.isfinite(chunk)
+        if not finite.any():
+            return
+
+        with warnings.catch_warnings():
+            # channels without finite samples in this chunk produce NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            chunk_min = np.nanmin(np.where(finite, chunk, np.nan), axis=0)
+            chunk_max = np.nanmax(np.where(finite, chunk, np.nan), axis=0)
+
+        if self.counts is None:
+            self.counts = np.zeros((chunk.shape[1], self.n_bins), dtype=np.int64)
+            self.lower = np.where(np.isfinite(chunk_min), chunk_min, 0)
+            span = np.where(np.isfinite(chunk_max), chunk_max - self.lower, 0)
+            self.width = np.maximum(span / (self.n_bins - 1),
+                                    np.maximum(np.abs(self.lower), 1) * 1e-12)
+        else:
+            self._expand(chunk_min, chunk_max)
+
+        indexes = np.floor((chunk - self.lower) / self.width)
+        indexes = np.clip(indexes[finite], 0, self.n_bins - 1).astype(np.intp)
+        channels = np.nonzero(finite)[1]
+        self.counts += np.bincount(
+            channels * self.n_bins + indexes,
+            minlength=self.counts.size).reshape(self.counts.shape)
+
+    def _expand(self, chunk_min, chunk_max):
+        # double the width of bins until the histogram range covers the new
+        # samples, growing downward or upward as needed
+        half = self.n_bins // 2
+        for c in range(self.counts.shape[0]):
+            while (chunk_min[c] < self.lower[c] or
+                   chunk_max[c] >= self.lower[c] + self.n_bins * self.width[c]):
+                merged = self.counts[c].reshape(half, 2).sum(axis=1)
+                self.counts[c] = 0
+                if chunk_min[c] < self.lower[c]:
+                    self.counts[c, half:] = merged
+                    self.lower[c] -= self.n_bins * self.width[c]
+                else:
+                    self.counts[c, :half] = merged
+                self.width[c] *= 2
+
+    def quantile(self, q):
+        '''
+        Return the estimated `q`-th quantile (0 <= q <= 1) of each channel.
+        '''
+
+        if self.counts is None:
+            raise ValueError('No samples have been added')
+
+        cumulative = np.cumsum(self.counts, axis=1)
+        target = q * cumulative[:, -1]
+        rows = np.arange(self.counts.shape[0])
+
+        # interpolate within the bin containing the target sample
+        index = np.argmax(cumulative >= np.maximum(target, 1)[:, np.newaxis], axis=1)
+        count = self.counts[rows, index]
+        before = cumulative[rows, index] - count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.clip((target - before) / count, 0, 1)
+        value = self.lower + (index + fraction) * self.width
+
+        # channels without finite samples
+        value[cumulative[:, -1] == 0] = np.nan
+        return value
+
+    def median(self):
+        '''
+        Return the estimated median of each channel.
+        '''
+        return self.quantile(0.5)
+
+def streaming_median(signal, max_block_elements=2**20):
+    '''
+    Estimate the median of each channel of an AnalogSignal in bounded memory
+    using :class:`StreamingQuantile`, without copying or sorting the signal.
+
+    Returns a Quantity with the units of the signal.
+    '''
+
+    data = signal.magnitude
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+
+    estimator = StreamingQuantile()
+    block_rows = max(max_block_elements // max(data.shape[1], 1), 1)
+    for start in range(0, data.shape[0], block_rows):
+        estimator.update(data[start:start + block_rows])
+
+    return estimator.median() * signal.units
+
+def signal_median(signal, max_exact_elements=2**24):
+    '''
+    Return the median of each channel of an AnalogSignal as a Quantity with
+    the units of the signal.
+
+    The median is found exactly with :func:`numpy.median`, which copies the
+    signal, if the signal has at most `max_exact_elements` samples across all
+    channels. The median of a larger signal is estimated in bounded memory
+    using :func:`streaming_median`, accurate to within about 1/2000 of the
+    range of the signal.
+    '''
+
+    if signal.size > max_exact_elements:
+        return streaming_median(signal)
+
+    data = signal.magnitude
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    return np.median(data, axis=0) * signal.units
+
+def _rauc_data(signal, baseline=None, t_start=None, t_stop=None):
+    '''
+    Return a (samples x channels) view of the signal data cropped to
+    `t_start` and `t_stop`, the baseline to subtract from it as an array or
+    None, and the time of the first sample in the view.
+    '''
+
     if not isinstance(signal, neo.AnalogSignal):
         raise TypeError('Input signal is not a neo.AnalogSignal!')
 
+    # work on a (samples x channels) view of the data; no copy of the full
+    # signal is made below
+    data = signal.magnitude
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+
     if baseline is None:
         pass
     elif baseline == 'mean':
         # subtract mean from each channel
-        signal = signal - signal.mean(axis=0)
+        baseline = data.mean(axis=0)
     elif baseline == 'median':
         # subtract median from each channel
-        signal = signal - np.median(signal.as_quantity(), axis=0)
+        baseline = signal_median(signal).magnitude
     elif isinstance(baseline, pq.Quantity):
         # subtract arbitrary baseline
-        signal = signal - baseline
+        baseline = baseline.rescale(signal.units).magnitude
     else:
         raise TypeError(
             'baseline must be None, \'mean\', \'median\', '
             'or a Quantity: {}'.format(baseline))
 
-    # slice the signal after subtracting baseline
-    signal = signal.time_slice(t_start, t_stop)
+    # slice the signal after computing the baseline
+    i, j = _time_slice_indices(signal, t_start, t_stop)
+    data = data[i:j]
+    t_start = signal.t_start + i * signal.sampling_period
+
+    return data, baseline, t_start
+
+def _rauc_samples_per_bin(signal, bin_duration, n_samples):
+    '''
+    Return the number of samples in each bin of duration `bin_duration`, or
+    `n_samples` if `bin_duration` is None.
+    '''
 
     if bin_duration is not None:
-        # from bin duration, determine samples per bin and number of bins
+        # from bin duration, determine samples per bin
         if isinstance(bin_duration, pq.Quantity):
-            samples_per_bin = int(np.round(
+            return int(np.round(
                 bin_duration.rescale('s')/signal.sampling_period.rescale('s')))
-            n_bins = int(np.ceil(signal.shape[0]/samples_per_bin))
         else:
             raise TypeError(
                 'bin_duration must be a Quantity: {}'.format(bin_duration))
     else:
         # all samples in one bin
-        samples_per_bin = signal.shape[0]
-        n_bins = 1
+        return n_samples
 
-    # store the actual bin duration
-    bin_duration = samples_per_bin * signal.sampling_period
+def _rauc_output(rauc, units, sampling_period, t_start, samples_per_bin):
+    '''
+    Return binned RAUC values as a Quantity if there is only one bin, or
+    otherwise as an AnalogSignal with times corresponding to bin centers.
+    '''
 
-    # reshape into equal size bins, padding the end with zeros if necessary
-    n_channels = signal.shape[1]
-    sig_binned = signal.as_quantity().copy()
-    sig_binned.resize(n_bins * samples_per_bin, n_channels, refcheck=False)
-    sig_binned = sig_binned.reshape(n_bins, samples_per_bin, n_channels)
+    # store the actual bin duration
+    bin_duration = samples_per_bin * sampling_period
 
-    # rectify and integrate over each bin
-    rauc = np.trapz(np.abs(sig_binned), dx=signal.sampling_period, axis=1)
+    rauc = rauc * units
 
-    if n_bins == 1:
+    if rauc.shape[0] == 1:
         # return a single value for each channel
         return rauc.squeeze()
 
@@ -846,10 +1193,84 @@ def rauc(signal, baseline=None, bin_duration=None, t_start=None, t_stop=None):
         # return an AnalogSignal with times corresponding to center of each bin
         rauc_sig = neo.AnalogSignal(
             rauc,
-            t_start=signal.t_start.rescale(bin_duration.units)+bin_duration/2,
+            t_start=t_start.rescale(bin_duration.units)+bin_duration/2,
             sampling_period=bin_duration)
         return rauc_sig
 
+def _time_slice_indices(signal, t_start=None, t_stop=None):
+    '''
+    Return the sample indices ``(i, j)`` that
+    ``signal.time_slice(t_start, t_stop)`` would select, without copying the
+    signal.
+    '''
+
+    if t_start is None:
+        i = 0
+        t_start = 0 * pq.s
+    else:
+        i = int(signal.time_index(t_start))
+
+    if t_stop is None:
+        j = len(signal)
+    else:
+        delta = (t_stop - t_start) * signal.sampling_rate
+        j = i + int(np.rint(delta.simplified.magnitude))
+
+    if (i < 0) or (j > len(signal)):
+        raise ValueError('t_start, t_stop have to be within the analog '
+                         'signal duration')
+
+    return i, j
+
+def _rauc_bins(data, samples_per_bin, dx, baseline=None,
+               max_block_elements=2**20):
+    '''
+    Integrate the rectified data within consecutive bins using the trapezoid
+    rule.
+
+    `data` is a 2D array with shape (samples, channels), and `baseline` is
+    None or a scalar or vector (one value per channel) subtracted before
+    rectification. All channels are integrated at once. Samples are rectified
+    in blocks of at most `max_block_elements` values, so the memory needed
+    beyond the returned (bins, channels) array stays bounded regardless of
+    the signal length.
+
+    If `samples_per_bin` does not divide evenly into the number of samples,
+    the final bin is integrated as though it were padded with zeros after
+    baseline removal.
+    '''
+
+    n_samples, n_channels = data.shape
+    samples_per_bin = max(int(samples_per_bin), 1)
+    n_bins = max(int(np.ceil(n_samples / samples_per_bin)), 1)
+    n_full_bins = n_samples // samples_per_bin
+
+    def rectify(x):
+        if baseline is not None:
+            x = x - baseline
+        return np.abs(x)
+
+    # sum the rectified samples within each bin, one block of rows at a time
+    sums = np.zeros((n_bins, n_channels))
+    block_rows = max(max_block_elements // max(n_channels, 1), 1)
+    for start in range(0, n_samples, block_rows):
+        stop = min(start + block_rows, n_samples)
+        first_bin = start // samples_per_bin
+        last_bin = (stop - 1) // samples_per_bin
+        bin_starts = np.arange(first_bin, last_bin + 1) * samples_per_bin
+        bin_starts[0] = start
+        sums[first_bin:last_bin + 1] += np.add.reduceat(
+            rectify(data[start:stop]), bin_starts - start, axis=0)
+
+    # the trapezoid rule counts the first and last sample of each bin by half
+    ends = np.zeros((n_bins, n_channels))
+    if n_samples > 0:
+        ends += rectify(data[::samples_per_bin])
+        # samples padding a ragged final bin would be zero
+        ends[:n_full_bins] += rectify(data[samples_per_bin-1::samples_per_bin])
+
+    return dx * (sums - ends / 2)
+
 ###############################################################################
 # elephant.spike_train_generation
 
@@ -1084,7 +1505,7 @@ def instantaneous_rate(spiketrain, sampling_period, kernel='auto',
 
     if kernel == 'auto':
         kernel_width = sskernel(spiketrain.magnitude, tin=None,
-                                bootstrap=True)['optw']
+                                bootstrap=False)['optw']
         if kernel_width is None:
             raise ValueError(
                 "Unable to calculate optimal kernel width for "
@@ -1131,14 +1552,14 @@ def instantaneous_rate(spiketrain, sampling_period, kernel='auto',
     else:
         t_stop = t_stop.rescale(spiketrain.units)
 
-    time_vector = np.zeros(int((t_stop - t_start)) + 1)
+    n_samples = int((t_stop - t_start)) + 1
 
     spikes_slice = spiketrain.time_slice(t_start, t_stop) \
         if len(spiketrain) else np.array([])
 
-    for spike in spikes_slice:
-        index = int((spike - t_start))
-        time_vector[index] += 1
+    # bin index of each spike, with the bin width equal to the sampling period
+    spike_indices = np.asarray(
+        np.asarray(spikes_slice, dtype=float) - t_start.magnitude).astype(int)
 
     if cutoff < kernel.min_cutoff:
         cutoff = kernel.min_cutoff
@@ -1149,24 +1570,36 @@ def instantaneous_rate(spiketrain, sampling_period, kernel='auto',
                       cutoff * kernel.sigma.rescale(units).magnitude +
                       sampling_period.rescale(units).magnitude,
                       sampling_period.rescale(units).magnitude) * units
+    median_index = kernel.median_index(t_arr)
+
+    # number of output samples and the offset of the first output sample
+    # within the full convolution
+    if not trim:
+        n_out = n_samples - 1
+        offset = median_index
+    else:
+        n_out = n_samples - 1 - t_arr.size
+        offset = 2 * median_index
+
+    if _has_recursive_form(kernel):
+        # exponential and alpha kernels can be convolved with the spike train
+        # using an IIR recursion, which avoids a large FFT
+        r = _recursive_rate(spike_indices, kernel, t_arr, offset, n_out)
+    else:
+        time_vector = np.bincount(spike_indices, minlength=n_samples).astype(float)
+        r = scipy.signal.fftconvolve(time_vector,
+                                     kernel(t_arr).rescale(pq.Hz).magnitude, 'full')
+        r = r[offset:offset + max(n_out, 0)]
 
-    r = scipy.signal.fftconvolve(time_vector,
-                                 kernel(t_arr).rescale(pq.Hz).magnitude, 'full')
     if np.any(r < 0):
         # warnings.warn("Instantaneous firing rate approximation contains "
         #               "negative values, possibly caused due to machine "
         #               "precision errors.")
         r = r.clip(0, None)  # replace negative values with 0
 
-    if not trim:
-        r = r[kernel.median_index(t_arr):-(kernel(t_arr).size -
-                                           kernel.median_index(t_arr))]
-    elif trim:
-        r = r[2 * kernel.median_index(t_arr):-2 * (kernel(t_arr).size -
-                                                   kernel.median_index(t_arr))]
-        t_start += kernel.median_index(t_arr) * spiketrain.units
-        t_stop -= (kernel(t_arr).size -
-                   kernel.median_index(t_arr)) * spiketrain.units
+    if trim:
+        t_start += median_index * spiketrain.units
+        t_stop -= (t_arr.size - median_index) * spiketrain.units
 
     rate = neo.AnalogSignal(signal=r.reshape(r.size, 1),
                             sampling_period=sampling_period,
@@ -1174,6 +1607,79 @@ def instantaneous_rate(spiketrain, sampling_period, kernel='auto',
 
     return rate
 
+def _has_recursive_form(kernel):
+    """
+    Return True if convolution with ``kernel`` can be computed by
+    :func:`_recursive_rate`. This is the case for the non-inverted exponential
+    and alpha kernels (including :class:`CausalAlphaKernel`), which are zero
+    for negative times and decay exponentially for positive times.
+    """
+    return isinstance(kernel, (ExponentialKernel, AlphaKernel)) and \
+        not kernel.invert
+
+def _recursive_rate(spike_indices, kernel, t_arr, offset, n_out):
+    """
+    Convolve a binned spike train with an exponential or alpha kernel using an
+    IIR recursion instead of an FFT.
+
+    This produces the same result as slicing ``n_out`` samples beginning at
+    ``offset`` from the full convolution of the spike counts with the kernel
+    sampled at ``t_arr``, as is done in :func:`instantaneous_rate`, including
+    truncation of the kernel at the end of ``t_arr``. Only arrays the size of
+    the output are allocated, and the cost is O(spikes + output samples)
+    regardless of the kernel width.
+
+    The sampled kernel has the form ``(a0 + a1*n) * rho**n`` for ``n >= 0``
+    samples after its first non-negative time, where ``a1 = 0`` for the
+    exponential kernel. Both terms are computed with :func:`scipy.signal.lfilter`
+    (which also accepts initial conditions, so the recursion could be continued
+    chunk by chunk), and the contribution of spikes older than the kernel
+    cutoff is subtracted using a copy of the output delayed by the kernel
+    length.
+    """
+    n_out = max(n_out, 0)
+
+    sigma = kernel.sigma.rescale(t_arr.units).magnitude
+    step = t_arr.magnitude[1] - t_arr.magnitude[0] if t_arr.size > 1 else 1.0
+    if isinstance(kernel, AlphaKernel):
+        rho = np.exp(-np.sqrt(2.) * step / sigma)
+    else:
+        rho = np.exp(-step / sigma)
+
+    # index of the first non-negative kernel time and the number of nonzero
+    # kernel samples after it
+    first = int(np.searchsorted(t_arr.magnitude, 0))
+    length = t_arr.size - first
+
+    # coefficients of the sampled kernel, taken from the kernel itself so that
+    # the result matches direct convolution
+    k = kernel(t_arr[first:first + 2]).rescale(pq.Hz).magnitude
+    a0 = k[0] if k.size > 0 else 0.
+    a1 = k[1] / rho - k[0] if isinstance(kernel, AlphaKernel) and k.size > 1 else 0.
+
+    # output sample i corresponds to position p = shift + i of the recursion
+    shift = offset - first
+    n_y = max(shift + n_out, 0)
+    counts = np.bincount(spike_indices[spike_indices < n_y],
+                         minlength=n_y).astype(float)
+
+    # e[p] = sum_n rho**n * counts[p-n]
+    e = scipy.signal.lfilter([1.], [1., -rho], counts)
+    y = a0 * e
+    if a1 != 0:
+        # sum_n n * rho**n * counts[p-n]
+        y += a1 * scipy.signal.lfilter([0., rho], [1., -2. * rho, rho**2], counts)
+
+    # remove the contribution of spikes beyond the kernel cutoff
+    if length < n_y:
+        y[length:] -= rho**length * (y[:-length] + a1 * length * e[:-length])
+
+    positions = shift + np.arange(n_out)
+    r = np.zeros(n_out)
+    valid = positions >= 0
+    r[valid] = y[positions[valid]]
+    return r
+
 def nextpow2(x):
     """ Return the smallest integral power of 2 that >= x """
     n = 2
@@ -1204,16 +1710,64 @@ def fftkernel(x, w):
     Ported to Python: Subhasis Ray, NCBS. Tue Jun 10 10:42:38 IST 2014
 
     """
-    L = len(x)
-    Lmax = L + 3 * w
-    n = nextpow2(Lmax)
-    X = np.fft.fft(x, n)
-    f = np.arange(0, n, 1.0) / n
-    f = np.concatenate((-f[:int(n / 2)], f[int(n / 2):0:-1]))
-    K = np.exp(-0.5 * (w * 2 * np.pi * f)**2)
-    y = np.fft.ifft(X * K, n)
-    y = y[:L].copy()
-    return y
+    return _GaussianSmoother(x).smooth([w])[0]
+
+class _GaussianSmoother(object):
+    """
+    Apply the Gauss kernel smoother of :func:`fftkernel` to one signal (or a
+    stack of signals of equal length) for many bandwidths.
+
+    The FFT of the signal is computed once for each FFT length that is needed
+    and cached, and all bandwidths sharing an FFT length are smoothed together
+    in a single batched inverse FFT, which :mod:`scipy.fft` may spread over
+    ``workers`` threads. Results are identical to calling :func:`fftkernel`
+    separately for each bandwidth.
+    """
+
+    # upper bound on the number of complex elements in one batched FFT
+    max_batch_elements = 2**22
+
+    def __init__(self, x, workers=None):
+        self.x = np.atleast_2d(x)
+        self.L = self.x.shape[-1]
+        self.workers = workers
+        self._X = {}
+        self._f = {}
+
+    def _spectrum(self, n):
+        if n not in self._X:
+            self._X[n] = scipy.fft.fft(self.x, n, axis=-1, workers=self.workers)
+            f = np.arange(0, n, 1.0) / n
+            self._f[n] = np.concatenate((-f[:int(n / 2)], f[int(n / 2):0:-1]))
+        return self._X[n], self._f[n]
+
+    def smooth(self, w):
+        """
+        Smooth with each bandwidth in ``w`` (in units of the sampling
+        resolution of ``x``). For a single signal, the result has shape
+        ``(len(w), len(x))``; for a stack of signals, a single bandwidth must
+        be given and the result has the shape of the stack.
+        """
+        w = np.asarray(w, dtype=float)
+        if self.x.shape[0] > 1:
+            X, f = self._spectrum(nextpow2(self.L + 3 * w[0]))
+            return self._ifft(X * np.exp(-0.5 * (w[0] * 2 * np.pi * f)**2))
+
+        y = np.empty((len(w), self.L), dtype=complex)
+        n_per_w = np.array([nextpow2(self.L + 3 * w_) for w_ in w], dtype=int)
+        for n in np.unique(n_per_w):
+            X, f = self._spectrum(n)
+            indices = np.nonzero(n_per_w == n)[0]
+            batch_size = max(1, self.max_batch_elements // n)
+            for i in range(0, len(indices), batch_size):
+                batch = indices[i:i + batch_size]
+                K = np.exp(-0.5 * (w[batch, np.newaxis] * 2 * np.pi * f)**2)
+                y[batch] = self._ifft(X * K)
+        return y
+
+    def _ifft(self, Y):
+        n = Y.shape[-1]
+        return scipy.fft.ifft(Y, n, axis=-1, workers=self.workers)[..., :self.L]
 
 def logexp(x):
     if x < 1e2:
@@ -1236,16 +1790,27 @@ def cost_function(x, N, w, dt):
     Cn(w) = sum_{i,j} int k(x - x_i) k(x - x_j) dx - 2 sum_{i~=j} k(x_i - x_j)
 
      """
-    yh = np.abs(fftkernel(x, w / dt))  # density
+    C, yh = _cost_functions(_GaussianSmoother(x), N, [w], dt)
+    return C[0], yh[0]
+
+def _cost_functions(smoother, N, w, dt):
+    """
+    Evaluate :func:`cost_function` for every bandwidth in ``w`` at once,
+    reusing the histogram FFT cached by ``smoother``. Returns an array of costs
+    and an array of densities with one row per bandwidth.
+    """
+    w = np.asarray(w, dtype=float)
+    x = smoother.x[0]
+    yh = np.abs(smoother.smooth(w / dt))  # density
     # formula for density
-    C = np.sum(yh ** 2) * dt - 2 * np.sum(yh * x) * \
+    C = np.sum(yh ** 2, axis=1) * dt - 2 * np.sum(yh * x, axis=1) * \
         dt + 2 / np.sqrt(2 * np.pi) / w / N
     C = C * N * N
     # formula for rate
     # C = dt*sum( yh.^2 - 2*yh.*y_hist + 2/sqrt(2*pi)/w*y_hist )
     return C, yh
 
-def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
+def sskernel(spiketimes, tin=None, w=None, bootstrap=False, workers=None):
     """
 
     Calculates optimal fixed kernel bandwidth.
@@ -1260,6 +1825,10 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
     bootstrap (optional): whether to calculate the 95% confidence
     interval. (default False)
 
+    workers (optional): maximum number of threads used for batched FFTs and
+    for bootstrap resampling. If None, the number of CPUs is used for
+    bootstrap resampling. (default None)
+
     Returns
 
     A dictionary containing the following key value pairs:
@@ -1305,20 +1874,21 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
         else:
             t = tin
     dt = np.min(np.diff(tin))
-    yhist, bins = np.histogram(spiketimes, np.r_[t - dt / 2, t[-1] + dt / 2])
+    edges = np.r_[t - dt / 2, t[-1] + dt / 2]
+    yhist, bins = np.histogram(spiketimes, edges)
     N = np.sum(yhist)
     yhist = yhist / (N * dt)  # density
+    smoother = _GaussianSmoother(yhist, workers=workers)
     optw = None
     y = None
     if w is not None:
-        C = np.zeros(len(w))
-        Cmin = np.inf
-        for k, w_ in enumerate(w):
-            C[k], yh = cost_function(yhist, N, w_, dt)
-            if C[k] < Cmin:
-                Cmin = C[k]
-                optw = w_
-                y = yh
+        # evaluate the whole grid of bandwidths in batches
+        C, yh = _cost_functions(smoother, N, w, dt)
+        C_finite = np.where(np.isnan(C), np.inf, C)
+        if np.any(C_finite < np.inf):
+            k = np.argmin(C_finite)
+            optw = w[k]
+            y = yh[k]
     else:
         # Golden section search on a log-exp scale
         wmin = 2 * dt
@@ -1332,8 +1902,8 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
         b = ilogexp(wmax)
         c1 = (phi - 1) * a + (2 - phi) * b
         c2 = (2 - phi) * a + (phi - 1) * b
-        f1, y1 = cost_function(yhist, N, logexp(c1), dt)
-        f2, y2 = cost_function(yhist, N, logexp(c2), dt)
+        (f1, f2), (y1, y2) = _cost_functions(
+            smoother, N, [logexp(c1), logexp(c2)], dt)
         k = 0
         while (np.abs(b - a) > (tolerance * (np.abs(c1) + np.abs(c2))))\
                 and (k < imax):
@@ -1342,7 +1912,7 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
                 c2 = c1
                 c1 = (phi - 1) * a + (2 - phi) * b
                 f2 = f1
-                f1, y1 = cost_function(yhist, N, logexp(c1), dt)
+                (f1,), (y1,) = _cost_functions(smoother, N, [logexp(c1)], dt)
                 w[k] = logexp(c1)
                 C[k] = f1
                 optw = logexp(c1)
@@ -1352,7 +1922,7 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
                 c1 = c2
                 c2 = (2 - phi) * a + (phi - 1) * b
                 f1 = f2
-                f2, y2 = cost_function(yhist, N, logexp(c2), dt)
+                (f2,), (y2,) = _cost_functions(smoother, N, [logexp(c2)], dt)
                 w[k] = logexp(c2)
                 C[k] = f2
                 optw = logexp(c2)
@@ -1364,15 +1934,8 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
     # If bootstrap is requested, and an optimal kernel was found
     if bootstrap and optw:
         nbs = 1000
-        yb = np.zeros((nbs, len(tin)))
-        for ii in range(nbs):
-            idx = np.floor(np.random.rand(N) * N).astype(int)
-            xb = spiketimes[idx]
-            y_histb, bins = np.histogram(
-                xb, np.r_[t - dt / 2, t[-1] + dt / 2]) / dt / N
-            yb_buf = fftkernel(y_histb, optw / dt).real
-            yb_buf = yb_buf / np.sum(yb_buf * dt)
-            yb[ii, :] = np.interp(tin, t, yb_buf)
+        yb = _bootstrap_densities(spiketimes, edges, N, t, tin, dt, optw,
+                                  nbs, workers)
         ybsort = np.sort(yb, axis=0)
         y95b = ybsort[np.floor(0.05 * nbs).astype(int), :]
         y95u = ybsort[np.floor(0.95 * nbs).astype(int), :]
@@ -1388,6 +1951,54 @@ def sskernel(spiketimes, tin=None, w=None, bootstrap=False):
             'confb95': confb95,
             'yb': yb}
 
+def _bootstrap_densities(spiketimes, edges, N, t, tin, dt, optw, nbs, workers=None):
+    """
+    Compute ``nbs`` bootstrap density estimates for :func:`sskernel`.
+
+    Each resample draws ``N`` spikes with replacement. Resamples are processed
+    in chunks on a thread pool; within a chunk, histograms are built with a
+    single :func:`numpy.bincount` using bin indices computed once for the
+    original spikes, and all histograms are smoothed with one batched FFT.
+    """
+    n_bins = len(edges) - 1
+
+    # bin index of each spike, following np.histogram's convention that the
+    # last bin includes its right edge (out-of-range spikes are never drawn
+    # since they fall outside every bin)
+    spike_bins = np.searchsorted(edges, spiketimes, side='right') - 1
+    spike_bins[spiketimes == edges[-1]] = n_bins - 1
+    spike_bins[(spiketimes < edges[0]) | (spiketimes > edges[-1])] = n_bins
+
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+
+    # spread resamples evenly over the workers, but bound the size of the
+    # (resamples x spikes) index array built for each chunk
+    max_chunk_elements = 2**22
+    chunk_size = int(np.ceil(nbs / workers))
+    chunk_size = max(1, min(chunk_size, max_chunk_elements // max(int(N), 1)))
+    chunks = [(i, min(chunk_size, nbs - i)) for i in range(0, nbs, chunk_size)]
+    seeds = np.random.SeedSequence(np.random.randint(2**31)).spawn(len(chunks))
+
+    yb = np.zeros((nbs, len(tin)))
+
+    def resample(chunk, seed):
+        start, size = chunk
+        rng = np.random.default_rng(seed)
+        idx = rng.integers(0, int(N), size=(size, int(N)))
+        bins = spike_bins[idx] + (n_bins + 1) * np.arange(size)[:, np.newaxis]
+        counts = np.bincount(bins.ravel(), minlength=size * (n_bins + 1))
+        y_histb = counts.reshape(size, n_bins + 1)[:, :n_bins] / dt / N
+        yb_buf = _GaussianSmoother(y_histb).smooth([optw / dt]).real
+        yb_buf = yb_buf / np.sum(yb_buf * dt, axis=1, keepdims=True)
+        for i in range(size):
+            yb[start + i, :] = np.interp(tin, t, yb_buf[i])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(resample, chunks, seeds))
+
+    return yb
+
 def _check_consistency_of_spiketrainlist(spiketrainlist, t_start=None, t_stop=None):
     for spiketrain in spiketrainlist:
         if not isinstance(spiketrain, SpikeTrain):
@@ -6,5 +6,8 @@
 from ..datasets.ftpauth import *
 from ..datasets.gdrive import *
 from ..datasets.download import *
+from ..datasets.manifest import *
 from ..datasets.metadata import *
+from ..datasets.epochs import *
 from ..datasets.data import *
+from ..datasets.annotationindex import *
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+The :mod:`neurotic.datasets.annotationindex` module implements a class for
+querying the annotations of many datasets at once.
+
+.. autoclass:: AnnotationIndex
+   :members:
+"""
+
+import os
+import sqlite3
+import pandas as pd
+
+from .. import neurotic_dir
+from ..datasets.metadata import _abs_path
+from ..datasets.data import _read_table, _table_cache_key
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    id            INTEGER PRIMARY KEY,
+    metadata_file TEXT NOT NULL,
+    dataset       TEXT NOT NULL,
+    file_key      TEXT NOT NULL,
+    path          TEXT NOT NULL,
+    version       TEXT NOT NULL,
+    UNIQUE (metadata_file, dataset, file_key)
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    file_id  INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    type     TEXT NOT NULL,
+    label    TEXT NOT NULL,
+    start    REAL NOT NULL,
+    stop     REAL NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS annotations_type_duration ON annotations (type, duration);
+CREATE INDEX IF NOT EXISTS annotations_type_start ON annotations (type, start);
+CREATE INDEX IF NOT EXISTS annotations_start ON annotations (start);
+CREATE INDEX IF NOT EXISTS annotations_duration ON annotations (duration);
+CREATE INDEX IF NOT EXISTS annotations_label ON annotations (label);
+CREATE INDEX IF NOT EXISTS annotations_file_id ON annotations (file_id);
+"""
+
+class AnnotationIndex():
+    """
+    A searchable index of the epochs in the ``annotations_file`` and
+    ``epoch_encoder_file`` of every dataset in a :class:`MetadataSelector
+    <neurotic.datasets.metadata.MetadataSelector>`.
+
+    The index is stored in a SQLite database, by default in the *neurotic*
+    user directory, which may be shared by many metadata files. When the index
+    is created, and whenever :meth:`update` is called, only files that changed
+    since they were last indexed are read again, and only local files are
+    read, so nothing is downloaded. Queries never touch the data files.
+
+    >>> index = neurotic.AnnotationIndex(neurotic.MetadataSelector('metadata.yml'))
+    >>> index.query(type='B8 activity', min_duration=2)
+    """
+
+    def __init__(self, metadata, database=None):
+        """
+        Initialize a new AnnotationIndex.
+        """
+
+        if database is None:
+            database = os.path.join(neurotic_dir, 'cache', 'annotations.sqlite')
+            os.makedirs(os.path.dirname(database), exist_ok=True)
+
+        self.metadata = metadata
+        self.database = database
+
+        self._connection = sqlite3.connect(database)
+        self._connection.execute('PRAGMA foreign_keys = ON')
+        with self._connection:
+            self._connection.executescript(_schema)
+
+        self.update()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._connection.close()
+
+    def update(self):
+        """
+        Index files that were added or changed since they were last indexed,
+        and forget files and datasets that no longer exist.
+        """
+
+        metadata_file = os.path.abspath(self.metadata.file)
+
+        indexed = {
+            (dataset, file_key): (file_id, path, version)
+            for file_id, dataset, file_key, path, version in self._connection.execute(
+                'SELECT id, dataset, file_key, path, version FROM files WHERE metadata_file = ?',
+                (metadata_file,))
+        }
+
+        changed = False
+        current = set()
+        for dataset, metadata in self.metadata.all_metadata.items():
+            for file_key in ['annotations_file', 'epoch_encoder_file']:
+                path = _abs_path(metadata, file_key)
+                if path is None or not os.path.exists(path):
+                    continue
+                current.add((dataset, file_key))
+
+                version = ','.join(map(str, _table_cache_key(path, file_key).tolist()))
+                old = indexed.get((dataset, file_key), None)
+                if old is not None and old[1:] == (path, version):
+                    continue
+
+                logger.debug(f'Indexing {file_key} for "{dataset}"')
+                table = _read_table(metadata, file_key)
+                with self._connection:
+                    if old is not None:
+                        self._connection.execute('DELETE FROM files WHERE id = ?', (old[0],))
+                    file_id = self._connection.execute(
+                        'INSERT INTO files (metadata_file, dataset, file_key, path, version) VALUES (?, ?, ?, ?, ?)',
+                        (metadata_file, dataset, file_key, path, version)).lastrowid
+                    self._connection.executemany(
+                        'INSERT INTO annotations (file_id, type, label, start, stop, duration) VALUES (?, ?, ?, ?, ?, ?)',
+                        _table_rows(file_id, table))
+                changed = True
+
+        with self._connection:
+            for key in indexed.keys() - current:
+                self._connection.execute('DELETE FROM files WHERE id = ?', (indexed[key][0],))
+                changed = True
+
+        if changed:
+            # gather statistics that help choose the best index for queries
+            self._connection.execute('ANALYZE')
+
+    def query(self, type=None, label=None, t_start=None, t_stop=None, min_duration=None, max_duration=None, datasets=None):
+        """
+        Return a dataframe of the epochs matching all of the given criteria,
+        sorted by dataset and start time.
+
+        ``type``, ``label``, and ``datasets`` may each be a string or a list
+        of strings, any of which may match. Epochs are matched by time if they
+        overlap the range from ``t_start`` to ``t_stop`` (in seconds), and by
+        duration if it is at least ``min_duration`` and at most
+        ``max_duration`` (in seconds).
+        """
+
+        conditions = ['files.metadata_file = ?']
+        params = [os.path.abspath(self.metadata.file)]
+
+        for column, values in [('annotations.type', type), ('annotations.label', label), ('files.dataset', datasets)]:
+            if values is not None:
+                if isinstance(values, str):
+                    values = [values]
+                conditions.append(f'{column} IN ({", ".join("?" * len(values))})')
+                params += list(values)
+
+        # an epoch can overlap the range only if it starts less than the
+        # longest duration before the range, which lets the start index narrow
+        # the search
+        if t_start is not None:
+            conditions.append('annotations.start >= ? - (SELECT max(duration) FROM annotations)')
+            params.append(float(t_start))
+
+        for condition, value in [('annotations.stop >= ?', t_start),
+                                 ('annotations.start <= ?', t_stop),
+                                 ('annotations.duration >= ?', min_duration),
+                                 ('annotations.duration <= ?', max_duration)]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(float(value))
+
+        # CROSS JOIN makes SQLite search the annotations first, using their
+        # indexes, rather than scanning every annotation of the metadata file
+        rows = self._connection.execute(
+            'SELECT files.dataset, annotations.start, annotations.stop, annotations.duration, annotations.type, annotations.label '
+            'FROM annotations CROSS JOIN files ON annotations.file_id = files.id '
+            f'WHERE {" AND ".join(conditions)} '
+            'ORDER BY files.dataset, annotations.start, annotations.duration',
+            params).fetchall()
+
+        return pd.DataFrame(rows, columns=['Dataset', 'Start (s)', 'End (s)', 'Duration (s)', 'Type', 'Label'])
+
+
+def _table_rows(file_id, table):
+    """
+    Yield rows for the annotations table of the database from a table returned
+    by :func:`_read_table <neurotic.datasets.data._read_table>`.
+    """
+
+    start = table['start'].tolist()
+    duration = table['duration'].tolist()
+    label = table['label'].tolist()
+    for i, type_name in enumerate(table['types'].tolist()):
+        for j in range(table['offsets'][i], table['offsets'][i+1]):
+            yield (file_id, type_name, label[j], start[j], start[j] + duration[j], duration[j])
@@ -6,15 +6,21 @@ dataset from selected metadata.
 .. autofunction:: load_dataset
 """
 
+import os
+import csv
+import hashlib
 import datetime
 import inspect
+import collections
 from packaging import version
 import numpy as np
 import pandas as pd
 import quantities as pq
 import neo
 
+from .. import neurotic_dir
 from ..datasets.metadata import _abs_path
+from ..datasets.epochs import EpochIndex, EpochChannelIndex, evaluate_epoch_expression
 from .. import _elephant_tools
 
 import logging
@@ -46,10 +52,12 @@ def load_dataset(metadata, blk=None, lazy=False, signal_group_mode='split-all',
     signal.
     """
 
+    read_from_data_file = False
     if blk is None:
         if metadata.get('data_file', None) is not None:
             # read in the electrophysiology data
             blk = _read_data_file(metadata, lazy, signal_group_mode)
+            read_from_data_file = True
         else:
             # create an empty Block
             blk = neo.Block()
@@ -71,35 +79,35 @@ def load_dataset(metadata, blk=None, lazy=False, signal_group_mode='split-all',
     if not lazy:
         blk = _apply_filters(metadata, blk)
 
-    # copy events into epochs and vice versa
-    epochs_from_events = [neo.Epoch(name=ev.name, times=ev.times, labels=ev.labels, durations=np.zeros_like(ev.times)) for ev in blk.segments[0].events]
-    events_from_epochs = [neo.Event(name=ep.name, times=ep.times, labels=ep.labels) for ep in blk.segments[0].epochs]
+    # add events as epochs and vice versa, sharing their times and labels
+    epochs_from_events = [_epoch_view_of_event(ev) for ev in blk.segments[0].events]
+    events_from_epochs = [_event_view_of_epoch(ep) for ep in blk.segments[0].epochs]
     if not filter_events_from_epochs:
         blk.segments[0].epochs += epochs_from_events
     blk.segments[0].events += events_from_epochs
 
     # read in annotations
-    annotations_dataframe = _read_annotations_file(metadata)
-    blk.segments[0].epochs += _create_neo_epochs_from_dataframe(annotations_dataframe, metadata, _abs_path(metadata, 'annotations_file'), filter_events_from_epochs)
-    blk.segments[0].events += _create_neo_events_from_dataframe(annotations_dataframe, metadata, _abs_path(metadata, 'annotations_file'))
+    annotations_table = _read_table(metadata, 'annotations_file')
+    blk.segments[0].epochs += _create_neo_epochs_from_table(annotations_table, _abs_path(metadata, 'annotations_file'), filter_events_from_epochs)
+    blk.segments[0].events += _create_neo_events_from_table(annotations_table, _abs_path(metadata, 'annotations_file'))
 
     # read in epoch encoder file
-    epoch_encoder_dataframe = _read_epoch_encoder_file(metadata)
-    blk.segments[0].epochs += _create_neo_epochs_from_dataframe(epoch_encoder_dataframe, metadata, _abs_path(metadata, 'epoch_encoder_file'), filter_events_from_epochs)
-    blk.segments[0].events += _create_neo_events_from_dataframe(epoch_encoder_dataframe, metadata, _abs_path(metadata, 'epoch_encoder_file'))
+    epoch_encoder_table = _read_table(metadata, 'epoch_encoder_file')
+    blk.segments[0].epochs += _create_neo_epochs_from_table(epoch_encoder_table, _abs_path(metadata, 'epoch_encoder_file'), filter_events_from_epochs)
+    blk.segments[0].events += _create_neo_events_from_table(epoch_encoder_table, _abs_path(metadata, 'epoch_encoder_file'))
 
     # classify spikes by amplitude if not using lazy loading of signals
     if not lazy:
         blk.segments[0].spiketrains.extend(_run_amplitude_discriminators(metadata, blk))
 
     # read in spikes identified by spike sorting using tridesclous
-    spikes_dataframe = _read_spikes_file(metadata, blk)
-    if spikes_dataframe is not None:
+    spikes = _read_spikes_file(metadata, blk)
+    if spikes is not None:
         if blk.segments[0].analogsignals:
             t_start = blk.segments[0].analogsignals[0].t_start                 # assuming all AnalogSignals start at the same time
             t_stop = blk.segments[0].analogsignals[0].t_stop                   # assuming all AnalogSignals start at the same time
             sampling_period = blk.segments[0].analogsignals[0].sampling_period # assuming all AnalogSignals have the same sampling rate
-            blk.segments[0].spiketrains.extend(_create_neo_spike_trains_from_dataframe(spikes_dataframe, metadata, t_start, t_stop, sampling_period))
+            blk.segments[0].spiketrains.extend(_create_neo_spike_trains_from_spikes(spikes, metadata, t_start, t_stop, sampling_period))
         else:
             logger.warning('Ignoring tridesclous_file because the sampling rate and start time could not be inferred from analog signals')
 
@@ -120,20 +128,71 @@ def load_dataset(metadata, blk=None, lazy=False, signal_group_mode='split-all',
     # using lazy loading of signals
     if not lazy and metadata.get('rauc_bin_duration', None) is not None:
         for sig in blk.segments[0].analogsignals:
-            rauc_sig = _elephant_tools.rauc(
+            # keep the cumulative integral at the edges of each bin so that
+            # the RAUC can be recomputed quickly for multiples of the bin
+            # duration
+            rauc_integral = _elephant_tools.cumulative_rauc(
                 signal=sig,
-                baseline=metadata.get('rauc_baseline', None),
+                baseline=_rauc_baseline(metadata, sig, read_from_data_file),
+                base_bin_duration=metadata['rauc_bin_duration']*pq.s,
+            )
+            rauc_sig = _elephant_tools.rauc_from_cumulative(
+                integral=rauc_integral,
                 bin_duration=metadata['rauc_bin_duration']*pq.s,
             )
             rauc_sig.name = sig.name + ' RAUC'
             sig.annotate(
                 rauc_sig=rauc_sig,
+                rauc_integral=rauc_integral,
                 rauc_baseline=metadata.get('rauc_baseline', None),
                 rauc_bin_duration=metadata['rauc_bin_duration']*pq.s,
             )
 
     return blk
 
+# median RAUC baselines for individual channels, keyed by the data file, its
+# size and modification time, how it was read, and the filters applied to the
+# channel, with the least recently used dropped beyond _rauc_median_cache_size
+_rauc_median_cache = collections.OrderedDict()
+_rauc_median_cache_size = 256
+
+def _rauc_baseline(metadata, sig, read_from_data_file=False):
+    """
+    Return the ``rauc_baseline`` given in ``metadata`` for the signal ``sig``.
+
+    Medians are found using :func:`neurotic._elephant_tools.signal_median`,
+    which estimates the medians of very long signals in bounded memory. If
+    ``sig`` was read from the ``data_file``, its median is cached so that
+    reloading the dataset does not require another pass through the signal.
+    """
+
+    baseline = metadata.get('rauc_baseline', None)
+    if baseline != 'median':
+        return baseline
+
+    if not read_from_data_file:
+        return _elephant_tools.signal_median(sig)
+
+    stat = os.stat(_abs_path(metadata, 'data_file'))
+    filters = [sig_filter for sig_filter in metadata.get('filters', None) or [] if sig_filter['channel'] == sig.name]
+    key = (
+        _abs_path(metadata, 'data_file'),
+        stat.st_size,
+        stat.st_mtime_ns,
+        repr(metadata.get('io_class', None)),
+        repr(metadata.get('io_args', None)),
+        sig.name,
+        repr(filters),
+    )
+
+    if key in _rauc_median_cache:
+        _rauc_median_cache.move_to_end(key)
+    else:
+        _rauc_median_cache[key] = _elephant_tools.signal_median(sig)
+        while len(_rauc_median_cache) > _rauc_median_cache_size:
+            _rauc_median_cache.popitem(last=False)
+    return _rauc_median_cache[key]
+
 def _get_io(metadata):
     """
     Return a :mod:`neo.io` object for reading the ``data_file`` in
@@ -274,10 +333,204 @@ def _read_data_file(metadata, lazy=False, signal_group_mode='split-all'):
 
     return blk
 
-def _read_annotations_file(metadata):
+def _epoch_view_of_event(event):
+    """
+    Return a zero-duration Neo :class:`Epoch <neo.core.Epoch>` that shares the
+    times and labels arrays of the Neo :class:`Event <neo.core.Event>`
+    ``event``. The durations are a read-only broadcast of a single zero.
+    """
+
+    epoch = event.view(neo.Epoch)
+    epoch._durations = pq.Quantity(np.broadcast_to(np.zeros(1, dtype=event.dtype), event.shape), event.units)
+    epoch.annotations = dict(event.annotations)
+    epoch.segment = None
+    return epoch
+
+def _event_view_of_epoch(epoch):
+    """
+    Return a Neo :class:`Event <neo.core.Event>` that shares the times and
+    labels arrays of the Neo :class:`Epoch <neo.core.Epoch>` ``epoch``.
+    """
+
+    event = epoch.view(neo.Event)
+    event.annotations = dict(epoch.annotations)
+    event.segment = None
+    return event
+
+# increment when the format of cached tables changes
+_table_cache_version = 2
+
+# total size of cached tables in bytes beyond which the least recently used
+# are deleted
+_table_cache_max_bytes = 256 * 1024**2
+
+def _read_table(metadata, file_key):
+    """
+    Read the ``annotations_file`` or ``epoch_encoder_file`` in ``metadata``,
+    selected by ``file_key``, and return a table of validated and sorted
+    columns grouped by type, or None if the file is not given.
+
+    The table is a dictionary of arrays:
+
+        * ``types``: the sorted unique types
+        * ``offsets``: rows for ``types[i]`` are ``offsets[i]:offsets[i+1]``
+        * ``start``, ``duration``, ``label``: values for each row
+
+    Tables are cached in a binary file in the *neurotic* user directory and
+    keyed on the size and modification time of the CSV file (and of the
+    epoch encoder journal, if any), so that the CSV only needs to be parsed
+    again when it changes.
+    """
+
+    if metadata.get(file_key, None) is None:
+        return None
+
+    file = _abs_path(metadata, file_key)
+    key = _table_cache_key(file, file_key)
+    cache_file = _table_cache_file(file)
+
+    table = _load_table_cache(cache_file, key)
+    if table is None:
+        if file_key == 'annotations_file':
+            table = _read_annotations_file(metadata)
+        elif file_key == 'epoch_encoder_file':
+            table = _dataframe_to_table(_read_epoch_encoder_file(metadata))
+        else:
+            raise ValueError(f'Unrecognized file key for a table: {file_key}')
+        _save_table_cache(cache_file, key, table)
+
+    return table
+
+def _dataframe_to_table(dataframe):
+    """
+    Group the rows of a dataframe returned by :func:`_read_epoch_encoder_file`
+    by type, preserving their order within each type, and return a table as
+    described in :func:`_read_table`.
+    """
+
+    type_column = dataframe['Type'].to_numpy(dtype=str)
+    types, inverse = np.unique(type_column, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+
+    return {
+        'types':    types,
+        'offsets':  np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=len(types)))]),
+        'start':    dataframe['Start (s)'].to_numpy(dtype=float)[order],
+        'duration': dataframe['Duration (s)'].to_numpy(dtype=float)[order],
+        'label':    dataframe['Label'].to_numpy(dtype=str)[order],
+    }
+
+def _table_cache_file(file):
+    """
+    Return the path to the cached table for a CSV file.
+    """
+
+    digest = hashlib.sha1(os.path.abspath(file).encode('utf-8')).hexdigest()
+    return os.path.join(neurotic_dir, 'cache', 'tables', digest + '.npz')
+
+def _table_cache_key(file, file_key):
+    """
+    Return an array identifying the current version of a CSV file, and of its
+    journal if it is an epoch encoder file.
+    """
+
+    stat = os.stat(file)
+    key = [_table_cache_version, stat.st_size, stat.st_mtime_ns]
+
+    if file_key == 'epoch_encoder_file':
+        journal_file = _epoch_encoder_journal_file(file)
+        if os.path.exists(journal_file):
+            journal_stat = os.stat(journal_file)
+            key += [journal_stat.st_size, journal_stat.st_mtime_ns]
+        else:
+            key += [-1, -1]
+
+    return np.array(key, dtype=np.int64)
+
+def _load_table_cache(cache_file, key):
+    """
+    Return the cached table if it was saved with the given key, or otherwise
+    None.
+    """
+
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        with np.load(cache_file, allow_pickle=False) as npz:
+            if not np.array_equal(npz['key'], key):
+                return None
+            table = {name: npz[name] for name in ['types', 'offsets', 'start', 'duration', 'label']}
+    except Exception as e:
+        logger.debug(f'Ignoring unreadable table cache {cache_file}: {e}')
+        return None
+
+    # mark the table as recently used, since access times are often not
+    # updated by the file system
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+
+    return table
+
+def _save_table_cache(cache_file, key, table):
+    """
+    Save a table to the cache with the given key.
+    """
+
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = cache_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            np.savez(f, key=key, **table)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logger.debug(f'Unable to write table cache {cache_file}: {e}')
+
+    _prune_table_cache(os.path.dirname(cache_file))
+
+def _prune_table_cache(cache_dir):
+    """
+    Delete the least recently used cached tables until their total size is
+    at most ``_table_cache_max_bytes``. Tables for CSV files that were moved
+    or deleted are never used again, so they are eventually deleted.
+    """
+
+    try:
+        entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.npz') and entry.is_file()]
+        stats = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+    except OSError as e:
+        logger.debug(f'Unable to list table cache {cache_dir}: {e}')
+        return
+
+    total = sum(size for _, size, _ in stats)
+    for _, size, path in sorted(stats):
+        if total <= _table_cache_max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError as e:
+            logger.debug(f'Unable to delete cached table {path}: {e}')
+
+# number of rows of the annotations_file parsed at a time
+_annotations_chunk_rows = 100000
+
+# number of line numbers listed when warning about discarded rows
+_discarded_lines_shown = 5
+
+def _read_annotations_file(metadata, chunk_rows=None):
     """
     Read in epochs and events from the ``annotations_file`` in ``metadata`` and
-    return a dataframe.
+    return a table as described in :func:`_read_table`, with rows sorted by
+    start time and duration within each type.
+
+    The file is parsed and validated ``chunk_rows`` rows at a time, and only
+    the columns of the valid rows of each chunk are kept. These are sorted
+    once by type, start time, and duration after the whole file is read.
+    Invalid rows are summarized in a warning with their count and first few
+    line numbers.
     """
 
     if metadata.get('annotations_file', None) is None:
@@ -286,6 +539,9 @@ def _read_annotations_file(metadata):
 
     else:
 
+        if chunk_rows is None:
+            chunk_rows = _annotations_chunk_rows
+
         # data types for each column in the file
         dtypes = {
             'Start (s)': float,
@@ -293,52 +549,78 @@ def _read_annotations_file(metadata):
             'Type':      str,
             'Label':     str,
         }
+        columns = list(dtypes.keys())
 
-        # parse the file and create a dataframe
-        df = pd.read_csv(_abs_path(metadata, 'annotations_file'), dtype = dtypes)
-
-        # increment row labels by 2 so they match the source file
-        # which is 1-indexed and has a header
-        df.index += 2
-
-        # discard entries with missing or negative start times
-        bad_start = df['Start (s)'].isnull() | (df['Start (s)'] < 0)
-        if bad_start.any():
-            logger.warning('These rows will be discarded because their Start '
-                           'times are missing or negative:\n'
-                           f'{df[bad_start]}')
-            df = df[~bad_start]
-
-        # discard entries with end time preceding start time
-        bad_end = df['End (s)'] < df['Start (s)']
-        if bad_end.any():
-            logger.warning('These rows will be discarded because their End '
-                           'times precede their Start times:\n'
-                           f'{df[bad_end]}')
-            df = df[~bad_end]
-
-        # compute durations
-        df.insert(
-            column = 'Duration (s)',
-            value = df['End (s)'] - df['Start (s)'],
-            loc = 2, # insert after 'End (s)'
-        )
+        # count and first few line numbers of discarded rows for each reason
+        discarded = {
+            'their Start times are missing or negative': [0, []],
+            'their End times precede their Start times': [0, []],
+        }
 
-        # replace some NaNs
-        df.fillna({
-            'Duration (s)': 0,
-            'Type': 'Other',
-            'Label': '',
-        }, inplace = True)
+        # columns of the valid rows of each chunk, starting with empty arrays
+        # so that files without rows need no special handling
+        parts = {
+            'types':    [np.empty(0, dtype=str)],
+            'start':    [np.empty(0, dtype=float)],
+            'duration': [np.empty(0, dtype=float)],
+            'label':    [np.empty(0, dtype=str)],
+        }
 
-        # sort entries by time
-        df.sort_values([
-            'Start (s)',
-            'Duration (s)',
-        ], inplace = True)
+        # line number of the first row of the chunk in the source file, which
+        # is 1-indexed and has a header
+        line = 2
+
+        # parse the file a chunk at a time
+        reader = pd.read_csv(_abs_path(metadata, 'annotations_file'), dtype = dtypes, chunksize = chunk_rows)
+        for chunk in reader:
+            chunk = chunk.reindex(columns = columns)
+            lines = np.arange(line, line + len(chunk))
+            line += len(chunk)
+
+            start = chunk['Start (s)'].to_numpy(dtype=float)
+            end = chunk['End (s)'].to_numpy(dtype=float)
+
+            # discard entries with missing or negative start times, and then
+            # entries with end time preceding start time
+            bad_start = np.isnan(start) | (start < 0)
+            bad_end = ~bad_start & (end < start)
+            for reason, bad in zip(discarded, [bad_start, bad_end]):
+                bad_lines = lines[bad]
+                shown = discarded[reason][1]
+                discarded[reason][0] += len(bad_lines)
+                shown += bad_lines[:_discarded_lines_shown - len(shown)].tolist()
+            keep = ~(bad_start | bad_end)
+
+            # compute durations and replace some NaNs
+            start = start[keep]
+            duration = end[keep] - start
+            duration[np.isnan(duration)] = 0
+            parts['types'].append(chunk['Type'].fillna('Other').to_numpy(dtype=str)[keep])
+            parts['start'].append(start)
+            parts['duration'].append(duration)
+            parts['label'].append(chunk['Label'].fillna('').to_numpy(dtype=str)[keep])
+
+        for reason, (count, shown) in discarded.items():
+            if count:
+                logger.warning(f'{count} rows will be discarded because '
+                               f'{reason} (lines {", ".join(map(str, shown))}'
+                               f'{", ..." if count > len(shown) else ""})')
+
+        # sort entries by type and then time
+        types, inverse = np.unique(np.concatenate(parts.pop('types')), return_inverse=True)
+        start = np.concatenate(parts.pop('start'))
+        duration = np.concatenate(parts.pop('duration'))
+        order = np.lexsort((duration, start, inverse))
+        table = {
+            'types':    types,
+            'offsets':  np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=len(types)))]),
+            'start':    start[order],
+            'duration': duration[order],
+            'label':    np.concatenate(parts.pop('label'))[order],
+        }
 
-        # return the dataframe
-        return df
+        # return the table
+        return table
 
 def _read_epoch_encoder_file(metadata):
     """
@@ -366,6 +648,12 @@ def _read_epoch_encoder_file(metadata):
         # which is 1-indexed and has a header
         df.index += 2
 
+        # apply changes saved by the epoch encoder in journaled mode that have
+        # not yet been compacted into the file
+        journal = _read_epoch_encoder_journal(_abs_path(metadata, 'epoch_encoder_file'))
+        if journal:
+            df = _apply_epoch_encoder_journal(df, journal)
+
         # discard entries with missing or negative start times
         bad_start = df['Start (s)'].isnull() | (df['Start (s)'] < 0)
         if bad_start.any():
@@ -411,10 +699,106 @@ def _read_epoch_encoder_file(metadata):
         # return the dataframe
         return df
 
+# columns of the journal of changes written by the epoch encoder in journaled
+# mode
+_epoch_encoder_journal_columns = ['Start (s)', 'End (s)', 'Type', 'Count']
+
+def _epoch_encoder_journal_file(filename):
+    """
+    Return the path to the journal for an epoch encoder file.
+    """
+
+    return filename + '.journal'
+
+def _read_epoch_encoder_journal(filename):
+    """
+    Read the journal for the epoch encoder file ``filename`` and return a
+    dictionary mapping each changed ``(start, end, type)`` to the number of
+    epochs it should have. Later entries override earlier ones, so replaying
+    the journal onto any version of the file it was created from, including
+    one that already contains some of the changes, gives the same result.
+    Malformed entries, such as one left incomplete by a crash, are skipped.
+    """
+
+    journal_file = _epoch_encoder_journal_file(filename)
+    journal = {}
+
+    if os.path.exists(journal_file):
+        with open(journal_file, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None) # skip header
+            for line_number, row in enumerate(reader, start=2):
+                try:
+                    start, end, type_name, count = float(row[0]), float(row[1]), row[2], int(row[3])
+                except (ValueError, IndexError):
+                    logger.warning(f'Skipping malformed line {line_number} in {journal_file}: {row}')
+                    continue
+                journal[(start, end, type_name)] = count
+
+    return journal
+
+def _append_epoch_encoder_journal(filename, changes):
+    """
+    Append ``changes``, a dictionary like that returned by
+    :func:`_read_epoch_encoder_journal`, to the journal for the epoch encoder
+    file ``filename``, and flush them to disk.
+    """
+
+    journal_file = _epoch_encoder_journal_file(filename)
+    new_journal = not os.path.exists(journal_file)
+
+    with open(journal_file, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if new_journal:
+            writer.writerow(_epoch_encoder_journal_columns)
+        for (start, end, type_name), count in changes.items():
+            writer.writerow([repr(float(start)), repr(float(end)), type_name, count])
+        f.flush()
+        os.fsync(f.fileno())
+
+def _apply_epoch_encoder_journal(dataframe, journal):
+    """
+    Apply the changes in ``journal`` to a dataframe read from an epoch encoder
+    file.
+    """
+
+    keys = zip(dataframe['Start (s)'], dataframe['End (s)'], dataframe['Type'])
+    keep = np.array([key not in journal for key in keys], dtype=bool)
+    added = pd.DataFrame(
+        [key for key, count in journal.items() for _ in range(count)],
+        columns = ['Start (s)', 'End (s)', 'Type'],
+    )
+
+    if added.empty:
+        return dataframe[keep]
+    else:
+        return pd.concat([dataframe[keep], added])
+
+# record layout of the spikes.raw files in tridesclous' native DataIO
+# directories
+_tridesclous_spike_dtype = np.dtype([
+    ('index',         'int64'),
+    ('cluster_label', 'int64'),
+    ('channel',       'int64'),
+    ('segment',       'int64'),
+    ('jitter',        'float64'),
+])
+
 def _read_spikes_file(metadata, blk):
     """
-    Read in spikes identified by spike sorting with tridesclous and return a
-    dataframe.
+    Read in spikes identified by spike sorting with tridesclous, merge or drop
+    clusters according to ``tridesclous_merge``, and return a dictionary of
+    arrays.
+
+    The ``tridesclous_file`` may be a CSV file exported by tridesclous, a
+    ``spikes.raw`` file from a tridesclous DataIO directory, or a ``.npy``
+    file containing either a structured array with ``index`` and
+    ``cluster_label`` (or ``label``) fields or an array with two columns.
+    Binary files are memory-mapped rather than read into memory at once.
+
+    In the returned dictionary, ``labels`` contains the sorted unique cluster
+    labels, and the sample indices of the spikes of cluster ``labels[i]`` are
+    ``index[offsets[i]:offsets[i+1]]``, in the order they appear in the file.
     """
 
     if metadata.get('tridesclous_file', None) is None or metadata.get('tridesclous_channels', None) is None:
@@ -423,48 +807,80 @@ def _read_spikes_file(metadata, blk):
 
     else:
 
-        # parse the file and create a dataframe
-        df = pd.read_csv(_abs_path(metadata, 'tridesclous_file'), names = ['index', 'label'])
-
-        # drop clusters with negative labels
-        df = df[df['label'] >= 0]
-
+        filename = _abs_path(metadata, 'tridesclous_file')
+        if filename.endswith('.npy'):
+            spikes = np.load(filename, mmap_mode='r')
+            if spikes.dtype.names is not None:
+                index = spikes['index']
+                label = spikes['cluster_label' if 'cluster_label' in spikes.dtype.names else 'label']
+            else:
+                index, label = spikes[:, 0], spikes[:, 1]
+        elif filename.endswith('.raw'):
+            spikes = np.memmap(filename, dtype=_tridesclous_spike_dtype, mode='r')
+            index, label = spikes['index'], spikes['cluster_label']
+        else:
+            df = pd.read_csv(filename, names = ['index', 'label'], dtype = 'int64')
+            index, label = df['index'].values, df['label'].values
+
+        # map each cluster label to its final label using a lookup table, which
+        # drops clusters with negative labels, and, if clusters are merged, all
+        # clusters not listed
+        label = np.asarray(label, dtype='int64')
+        lookup = np.arange(max(int(label.max()) + 1, 1) if len(label) else 1)
         if metadata.get('tridesclous_merge', None):
             # merge some clusters and drop all others
             new_labels = []
             for clusters_to_merge in metadata['tridesclous_merge']:
                 new_label = clusters_to_merge[0]
                 new_labels.append(new_label)
-                df.loc[df['label'].isin(clusters_to_merge), 'label'] = new_label
-            df = df[df['label'].isin(new_labels)]
-
-        # return the dataframe
-        return df
+                lookup[np.isin(lookup, clusters_to_merge)] = new_label
+            lookup[~np.isin(lookup, new_labels)] = -1
+        label = np.where(label >= 0, lookup[np.maximum(label, 0)], -1)
+
+        # group spikes by label, preserving their order within each cluster
+        keep = np.flatnonzero(label >= 0)
+        order = keep[np.argsort(label[keep], kind='stable')]
+        label = label[order]
+        index = np.asarray(index[order], dtype='int64')
+        offsets = np.r_[0, np.flatnonzero(np.diff(label)) + 1, len(label)]
+
+        # return the arrays
+        return {
+            'labels':  label[offsets[:-1]],
+            'offsets': offsets,
+            'index':   index,
+        }
 
-def _create_neo_epochs_from_dataframe(dataframe, metadata, file_origin, filter_events_from_epochs=False):
+def _create_neo_epochs_from_table(table, file_origin, filter_events_from_epochs=False):
     """
-    Convert the contents of a dataframe into Neo :class:`Epochs
-    <neo.core.Epoch>`.
+    Convert the contents of a table returned by :func:`_read_table` into Neo
+    :class:`Epochs <neo.core.Epoch>`.
     """
 
     epochs_list = []
 
-    if dataframe is not None:
+    if table is not None:
 
-        if filter_events_from_epochs:
-            # keep only rows with a positive duration
-            dataframe = dataframe[dataframe['Duration (s)'] > 0]
+        # create a Neo Epoch for each type
+        for i, type_name in enumerate(table['types']):
+            group = slice(table['offsets'][i], table['offsets'][i+1])
+            times = table['start'][group]
+            durations = table['duration'][group]
+            labels = table['label'][group]
 
-        # group epochs by type
-        for type_name, df in dataframe.groupby('Type'):
+            if filter_events_from_epochs:
+                # keep only rows with a positive duration
+                keep = durations > 0
+                if not keep.any():
+                    continue
+                times, durations, labels = times[keep], durations[keep], labels[keep]
 
-            # create a Neo Epoch for each type
             epoch = neo.Epoch(
-                name = type_name,
+                name = str(type_name),
                 file_origin = file_origin,
-                times = df['Start (s)'].values * pq.s,
-                durations = df['Duration (s)'].values * pq.s,
-                labels = df['Label'].values,
+                times = times * pq.s,
+                durations = durations * pq.s,
+                labels = labels,
             )
 
             epochs_list.append(epoch)
@@ -472,25 +888,25 @@ def _create_neo_epochs_from_dataframe(dataframe, metadata, file_origin, filter_e
     # return the list of Neo Epochs
     return epochs_list
 
-def _create_neo_events_from_dataframe(dataframe, metadata, file_origin):
+def _create_neo_events_from_table(table, file_origin):
     """
-    Convert the contents of a dataframe into Neo :class:`Events
-    <neo.core.Event>`.
+    Convert the contents of a table returned by :func:`_read_table` into Neo
+    :class:`Events <neo.core.Event>`.
     """
 
     events_list = []
 
-    if dataframe is not None:
+    if table is not None:
 
-        # group events by type
-        for type_name, df in dataframe.groupby('Type'):
+        # create a Neo Event for each type
+        for i, type_name in enumerate(table['types']):
+            group = slice(table['offsets'][i], table['offsets'][i+1])
 
-            # create a Neo Event for each type
             event = neo.Event(
-                name = type_name,
+                name = str(type_name),
                 file_origin = file_origin,
-                times = df['Start (s)'].values * pq.s,
-                labels = df['Label'].values,
+                times = table['start'][group] * pq.s,
+                labels = table['label'][group],
             )
 
             events_list.append(event)
@@ -498,27 +914,27 @@ def _create_neo_events_from_dataframe(dataframe, metadata, file_origin):
     # return the list of Neo Events
     return events_list
 
-def _create_neo_spike_trains_from_dataframe(dataframe, metadata, t_start, t_stop, sampling_period):
+def _create_neo_spike_trains_from_spikes(spikes, metadata, t_start, t_stop, sampling_period):
     """
-    Convert the contents of a dataframe into Neo :class:`SpikeTrains
-    <neo.core.SpikeTrain>`.
+    Convert the contents of a dictionary returned by :func:`_read_spikes_file`
+    into Neo :class:`SpikeTrains <neo.core.SpikeTrain>`.
     """
 
     spiketrain_list = []
 
-    if dataframe is not None:
+    if spikes is not None:
 
-        # group spikes by cluster label
-        for spike_label, df in dataframe.groupby('label'):
+        # create a Neo SpikeTrain for each cluster label
+        for i, spike_label in enumerate(spikes['labels'].tolist()):
+            group = slice(spikes['offsets'][i], spikes['offsets'][i+1])
 
             # look up the channels that this unit was found on
             channels = metadata['tridesclous_channels'][spike_label]
 
-            # create a Neo SpikeTrain for each cluster label
             st = neo.SpikeTrain(
                 name = str(spike_label),
                 file_origin = _abs_path(metadata, 'tridesclous_file'),
-                times = t_start + sampling_period * df['index'].values,
+                times = t_start + sampling_period * spikes['index'][group],
                 t_start = t_start,
                 t_stop = t_stop,
             )
@@ -575,7 +991,7 @@ def _run_amplitude_discriminators(metadata, blk):
     if metadata.get('amplitude_discriminators', None) is not None:
 
         signalNameToIndex = {sig.name:i for i, sig in enumerate(blk.segments[0].analogsignals)}
-        epochs = blk.segments[0].epochs
+        epoch_index = EpochIndex(blk)
 
         # classify spikes by amplitude
         for discriminator in metadata['amplitude_discriminators']:
@@ -588,16 +1004,18 @@ def _run_amplitude_discriminators(metadata, blk):
             else:
 
                 sig = blk.segments[0].analogsignals[index]
-                st = _detect_spikes(sig, discriminator, epochs)
+                st = _detect_spikes(sig, discriminator, epoch_index)
                 spiketrain_list.append(st)
 
     return spiketrain_list
 
 
-def _detect_spikes(sig, discriminator, epochs):
+def _detect_spikes(sig, discriminator, epoch_index):
     """
     Detect spikes in the amplitude window given by ``discriminator`` and
-    optionally filter them by coincidence with epochs of a given name.
+    optionally filter them by coincidence with epochs of a given name, looked
+    up in the :class:`EpochIndex <neurotic.datasets.epochs.EpochIndex>`
+    ``epoch_index``.
     """
 
     assert sig.name == discriminator['channel'], 'sig name "{}" does not match amplitude discriminator channel "{}"'.format(sig.name, discriminator['channel'])
@@ -646,18 +1064,21 @@ def _detect_spikes(sig, discriminator, epochs):
 
     if 'epoch' in discriminator:
 
-        time_masks = []
         if isinstance(discriminator['epoch'], str):
-            # search for matching epochs
-            ep = next((ep for ep in epochs if ep.name == discriminator['epoch']), None)
-            if ep is not None:
-                # select spike times that fall within each epoch
-                for t_start, duration in zip(ep.times, ep.durations):
-                    t_stop = t_start + duration
-                    time_masks.append((t_start <= st) & (st < t_stop))
+            if discriminator['epoch'] in epoch_index:
+                # select spike times that fall within any epoch
+                time_mask = epoch_index[discriminator['epoch']].contains(st.times)
             else:
                 # no matching epochs found
-                time_masks.append([False] * len(st))
+                time_mask = np.zeros(len(st), dtype=bool)
+        elif isinstance(discriminator['epoch'], dict):
+            # select spike times that fall within epochs combined from several
+            # channels
+            try:
+                epoch = evaluate_epoch_expression(discriminator['epoch'], epoch_index)
+            except ValueError:
+                raise ValueError('amplitude discriminator epoch could not be handled: {}'.format(discriminator['epoch']))
+            time_mask = EpochChannelIndex(epoch).contains(st.times)
         else:
             # may eventually implement lists of ordered pairs, but
             # for now raise an error
@@ -665,7 +1086,7 @@ def _detect_spikes(sig, discriminator, epochs):
 
         # select the subset of spikes that fall within the epoch
         # windows
-        st = st[np.any(time_masks, axis=0)]
+        st = st[time_mask]
 
         st.annotate(epoch=discriminator['epoch'])
 
@@ -7,19 +7,32 @@ handles various errors and will automatically reprompt the user for login
 credentials if a bad user name or password is given.
 
 The module installs an :class:`urllib.request.HTTPBasicAuthHandler` and a
-:class:`neurotic.datasets.ftpauth.FTPBasicAuthHandler` at import time.
+:class:`neurotic.datasets.ftpauth.FTPBasicAuthHandler` at import time, along
+with HTTP and HTTPS handlers that keep connections open for reuse. Login
+credentials are requested the first time a server refuses a request and are
+then sent with every later request to the server, and connections are reused
+for many files, so that downloading a file usually takes just one request.
 
 .. autofunction:: download
+
+.. autoclass:: DownloadManager
+   :members:
 """
 
 import os
+import re
+import time
 import shutil
+import ftplib
+import threading
+import concurrent.futures
 import urllib
+import http.client
 from getpass import getpass
-import numpy as np
+import yaml
 from tqdm.auto import tqdm
 
-from urllib.request import HTTPBasicAuthHandler, HTTPPasswordMgrWithDefaultRealm
+from urllib.request import HTTPBasicAuthHandler, HTTPPasswordMgrWithPriorAuth, HTTPHandler, HTTPSHandler
 from .. import global_config
 from ..datasets.ftpauth import FTPBasicAuthHandler
 from ..datasets.gdrive import GoogleDriveDownloader
@@ -28,12 +41,150 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class _ConnectionPool():
+    """
+    A thread-safe collection of idle HTTP connections, kept open so that they
+    can be reused for later requests to the same server.
+    """
+
+    max_idle_per_host = 8
+    max_idle_time = 30  # seconds
+
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return an idle connection for ``key``, or None if there is none.
+        """
+
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                connection, released = connections.pop()
+                if time.monotonic() - released < self.max_idle_time:
+                    return connection
+                connection.close()
+        return None
+
+    def put(self, key, connection):
+        """
+        Keep ``connection`` open for reuse.
+        """
+
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, released in connections:
+                connection.close()
+
+
+class _PooledResponse(http.client.HTTPResponse):
+    """
+    An HTTP response that returns its connection to a :class:`_ConnectionPool`
+    when it is closed, if the whole response was read.
+    """
+
+    pool = None
+    pool_key = None
+    connection = None
+
+    def close(self):
+        # http.client closes the response itself once the whole body is
+        # read, so the connection is ready for another request only if that
+        # already happened
+        reusable = self.isclosed() and not self.will_close and not self.length
+        super().close()
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            if reusable:
+                pool.put(self.pool_key, self.connection)
+            else:
+                self.connection.close()
+
+
+class _KeepAliveMixin():
+    """
+    A mixin for :class:`urllib.request.HTTPHandler` and
+    :class:`urllib.request.HTTPSHandler` that reuses connections rather than
+    opening a new one for every request, which is much faster when
+    downloading many small files.
+    """
+
+    pool = None
+
+    def do_open(self, http_class, req, **http_conn_args):
+        if req._tunnel_host:
+            # proxies are not handled
+            return super().do_open(http_class, req, **http_conn_args)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+
+        key = (http_class, req.host, tuple(sorted(http_conn_args.items(), key=lambda item: item[0])))
+        connection = self.pool.get(key)
+        while True:
+            reused = connection is not None
+            if not reused:
+                connection = http_class(req.host, timeout=req.timeout, **http_conn_args)
+                connection.response_class = _PooledResponse
+            try:
+                connection.request(req.get_method(), req.selector, req.data, headers,
+                                   encode_chunked=req.has_header('Transfer-encoding'))
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as err:
+                connection.close()
+                if reused:
+                    # the server closed the idle connection, so try again
+                    # with a new one
+                    connection = None
+                    continue
+                raise urllib.error.URLError(err)
+            except OSError as err:
+                connection.close()
+                raise urllib.error.URLError(err)
+            except:
+                connection.close()
+                raise
+            break
+
+        response.pool, response.pool_key, response.connection = self.pool, key, connection
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+
+class _KeepAliveHTTPHandler(_KeepAliveMixin, HTTPHandler):
+    pass
+
+
+class _KeepAliveHTTPSHandler(_KeepAliveMixin, HTTPSHandler):
+    pass
+
+
 # install HTTP and FTP authentication handlers, the latter of which also adds
-# reliable file size retrieval before downloading
+# reliable file size retrieval before downloading and reuses connections, and
+# HTTP handlers that reuse connections
 _max_bad_login_attempts = 3
-_http_auth_handler = HTTPBasicAuthHandler(HTTPPasswordMgrWithDefaultRealm())
+_connection_pool = _ConnectionPool()
+_KeepAliveMixin.pool = _connection_pool
+_http_auth_handler = HTTPBasicAuthHandler(HTTPPasswordMgrWithPriorAuth())
 _ftp_auth_handler = FTPBasicAuthHandler()
-_opener = urllib.request.build_opener(_http_auth_handler, _ftp_auth_handler)
+_opener = urllib.request.build_opener(_http_auth_handler, _ftp_auth_handler, _KeepAliveHTTPHandler(), _KeepAliveHTTPSHandler())
 urllib.request.install_opener(_opener)
 
 gdrive_downloader = GoogleDriveDownloader(
@@ -43,9 +194,14 @@ gdrive_downloader = GoogleDriveDownloader(
 )
 
 
-def download(url, local_file, overwrite_existing=False, show_progress=True, bytes_per_chunk=1024*8):
+def download(url, local_file, overwrite_existing=False, show_progress=True, bytes_per_chunk=1024*8, progress=None, connection_limit=None):
     """
     Download a file.
+
+    ``progress`` and ``connection_limit`` are used by :class:`DownloadManager`
+    to report the progress of many downloads together, in place of a progress
+    bar for each file, and to limit the connections to each server. They are
+    not used for Google Drive downloads.
     """
     if urllib.parse.urlparse(url).scheme == 'gdrive':
         return gdrive_downloader.download(url, local_file, show_progress=show_progress, bytes_per_chunk=1024*1024*5)
@@ -59,7 +215,7 @@ def download(url, local_file, overwrite_existing=False, show_progress=True, byte
 
     logger.info(f'Downloading {os.path.basename(local_file)}')
     try:
-        _download_with_progress_bar(url, local_file, show_progress=show_progress, bytes_per_chunk=bytes_per_chunk)
+        _download_with_retries(url, local_file, show_progress=show_progress, bytes_per_chunk=bytes_per_chunk, progress=progress, connection_limit=connection_limit)
 
     except urllib.error.HTTPError as e:
 
@@ -117,121 +273,604 @@ def download(url, local_file, overwrite_existing=False, show_progress=True, byte
                 raise error
 
 
-def _download_with_progress_bar(url, local_file, show_progress=True, bytes_per_chunk=1024*8):
+class DownloadManager():
+    """
+    A class for downloading many files concurrently.
+
+    Files are added with :meth:`add`, and downloads begin immediately on a
+    pool of ``max_workers`` threads. At most ``max_connections_per_host``
+    files are downloaded from any one server at a time. Defaults for both
+    are taken from the "downloads" section of the global config. Progress is
+    reported for all files together in a single progress bar.
+
+    >>> with DownloadManager() as manager:
+    ...     manager.add('https://myserver/data.axgx', 'data.axgx')
+    ...     manager.add('https://myserver/video.mp4', 'video.mp4')
+    ...     manager.wait()
+
+    Google Drive files are downloaded one at a time, with their own progress
+    bars.
+    """
+
+    def __init__(self, max_workers=None, max_connections_per_host=None, show_progress=True):
+        """
+        Initialize a new DownloadManager.
+        """
+
+        if max_workers is None:
+            max_workers = global_config['downloads']['max_concurrent_downloads']
+        if max_connections_per_host is None:
+            max_connections_per_host = global_config['downloads']['max_connections_per_host']
+
+        self.max_connections_per_host = max_connections_per_host
+        self.progress = _AggregateProgress(show_progress)
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Download')
+        self._futures = []
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, url, local_file, **kwargs):
+        """
+        Start downloading a file.
+
+        See :func:`download` for possible keyword arguments.
+        """
+        return self.submit(url, download, url, local_file, **kwargs)
+
+    def submit(self, url, function, *args, **kwargs):
+        """
+        Start calling ``function(*args, progress=..., connection_limit=...,
+        **kwargs)``, which downloads from ``url``, counting it against the
+        connection limit for the server. ``function`` must accept the
+        ``progress`` and ``connection_limit`` arguments of :func:`download`
+        and pass them along.
+        """
+
+        future = self._executor.submit(self._run, url, function, args, kwargs)
+        self._futures.append(future)
+        return future
+
+    def wait(self):
+        """
+        Block until every download started so far is finished. If any
+        downloads failed, raise the first error after the others finish.
+        """
+
+        futures, self._futures = self._futures, []
+        concurrent.futures.wait(futures)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def close(self):
+        """
+        Wait for downloads to finish and release resources.
+        """
+
+        self._executor.shutdown(wait=True)
+        self.progress.close()
+
+    def _run(self, url, function, args, kwargs):
+        semaphore = self._host_semaphore(url)
+        with semaphore:
+            # extra connections for segments of large files also take slots
+            # from the semaphore
+            return function(*args, progress=self.progress, connection_limit=semaphore, **kwargs)
+
+    def _host_semaphore(self, url):
+        host = _host(url)
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                # Google Drive downloads are not thread-safe
+                limit = 1 if host == 'gdrive' else self.max_connections_per_host
+                self._host_semaphores[host] = threading.BoundedSemaphore(limit)
+            return self._host_semaphores[host]
+
+
+class _AggregateProgress():
+    """
+    A thread-safe progress bar for many downloads, or for the segments of one
+    download. A ``total`` of None means that the total is unknown.
+    """
+
+    def __init__(self, show_progress=True, total=0, initial=0):
+        self._show_progress = show_progress
+        self._lock = threading.Lock()
+        self._pbar = None
+        self.total = total
+        self.n = initial
+        if show_progress and total != 0:
+            self._pbar = tqdm(total=total, initial=initial, unit='B', unit_scale=True)
+
+    def add_total(self, n):
+        with self._lock:
+            if self.total is not None:
+                self.total += n
+            if self._show_progress:
+                if self._pbar is None:
+                    self._pbar = tqdm(total=self.total, initial=self.n, unit='B', unit_scale=True)
+                else:
+                    self._pbar.total = self.total
+                    self._pbar.refresh()
+
+    def update(self, n):
+        with self._lock:
+            self.n += n
+            if self._pbar is not None:
+                self._pbar.update(n)
+
+    def close(self):
+        with self._lock:
+            if self._pbar is not None:
+                self._pbar.close()
+                self._pbar = None
+
+
+class _FileProgress():
     """
-    Authenticate if necessary, then download while showing a progress bar.
+    The part of an aggregate progress bar that belongs to one file. Bytes
+    reported by failed attempts to download the file stay counted, so each
+    attempt adds to the aggregate total only what is needed to keep the total
+    equal to the bytes reported for the file plus the bytes that remain.
     """
 
-    auth_needed =  _auth_needed(url)
-    if auth_needed:
-        authenticated = _authenticate(url)
+    def __init__(self, progress):
+        self._progress = progress
+        self._lock = threading.Lock()
+        self.total = 0
+        self.n = 0
+
+    def set_remaining(self, remaining):
+        with self._lock:
+            total = self.n + remaining
+            self._progress.add_total(total - self.total)
+            self.total = total
 
-    if not auth_needed or (auth_needed and authenticated):
+    def update(self, n):
+        with self._lock:
+            self.n += n
+        self._progress.update(n)
 
-        # determine where to temporarily save the file during download
-        temp_file = local_file + '.part'
-        logger.debug(f'Temporarily downloading to {temp_file}')
 
-        # create the containing directory if necessary
-        if not os.path.exists(os.path.dirname(local_file)):
-            os.makedirs(os.path.dirname(local_file))
+def _download_with_retries(url, local_file, **kwargs):
+    """
+    Download a file, retrying after errors that are likely to be temporary,
+    such as dropped connections. The delay before each retry is twice as long
+    as the one before it. Each retry resumes an interrupted download where it
+    left off if possible.
+
+    See :func:`_download_with_progress_bar` for possible keyword arguments.
+    """
 
+    max_retries = global_config['downloads']['max_retries']
+    delay = global_config['downloads']['retry_delay']
+    if kwargs.get('progress') is not None:
+        # keep the aggregate total right across retries
+        kwargs['progress'] = _FileProgress(kwargs['progress'])
+    for attempt in range(max_retries + 1):
         try:
-            with urllib.request.urlopen(urllib.parse.quote(url, safe='/:')) as dist:
+            return _download_with_progress_bar(url, local_file, **kwargs)
+        except Exception as e:
+            if attempt == max_retries or not _is_temporary_error(e):
+                raise
+            logger.warning(f'Retrying {os.path.basename(local_file)} in {delay} s after error: {e}')
+            time.sleep(delay)
+            delay *= 2
+
+def _is_temporary_error(error):
+    """
+    Determine whether a download error might not happen again if the download
+    is retried.
+    """
+
+    if isinstance(error, urllib.error.HTTPError):
+        # request timeout, too many requests, and server errors
+        return error.code in [408, 429, 500, 502, 503, 504]
+    if isinstance(error, urllib.error.URLError):
+        if isinstance(error.reason, str):
+            return error.reason.startswith(('ftp error: error_temp(', 'ftp error: TimeoutError('))
+        return isinstance(error.reason, (ConnectionError, TimeoutError))
+    return isinstance(error, (ConnectionError, TimeoutError, EOFError, http.client.HTTPException, ftplib.error_temp))
+
+def _download_with_progress_bar(url, local_file, show_progress=True, bytes_per_chunk=1024*8, progress=None, connection_limit=None):
+    """
+    Download while showing a progress bar, authenticating if necessary.
+
+    The file is downloaded to a temporary ``.part`` file, which is kept if the
+    download is interrupted. If a ``.part`` file already exists, the download
+    continues where it left off, as long as the server can send parts of a
+    file and the remote file has not changed since the ``.part`` file was
+    started.
+
+    Large files are downloaded in several segments at once if the server can
+    send parts of files (see :func:`_segment_count`). If ``connection_limit``
+    is given, a semaphore limiting the connections to the server, each
+    connection beyond the first takes a slot from it if one is free, and
+    segments that do not get a slot wait for another segment to finish.
+
+    If ``progress``, a :class:`_FileProgress`, is given, progress is reported
+    to it in place of a progress bar for this file alone.
+    """
+
+    # determine where to temporarily save the file during download
+    temp_file = local_file + '.part'
+    logger.debug(f'Temporarily downloading to {temp_file}')
+
+    # create the containing directory if necessary
+    os.makedirs(os.path.dirname(local_file), exist_ok=True)
+
+    dist, ranges = _open_resumable(url, temp_file)
+    if dist is None:
+        # authentication failed
+        return
+
+    file_progress = None
+    extra_connections = 0
+    try:
+        with dist:
+            if ranges is None:
+                # start over
+                total = _total_size(dist, 0)
+                info = _write_part_info(temp_file, url, dist.headers, total)
+                extra_connections = _acquire_connections(connection_limit, _segment_count(dist, total) - 1)
+                ranges = _split_ranges(total, 1 + extra_connections)
                 with open(temp_file, 'wb') as f:
-                    if show_progress:
-                        if 'Content-Length' in dist.headers:
-                            # knowing the file size allows progress to be displayed
-                            file_size_in_bytes = int(dist.headers['Content-Length'])
-                            num_chunks = int(np.ceil(file_size_in_bytes/bytes_per_chunk))
-                            total = num_chunks*bytes_per_chunk
-                        else:
-                            # progress can't be displayed, but other stats can be
-                            total = None
-                        pbar = tqdm(total=total, unit='B', unit_scale=True)
-                    while True:
-                        chunk = dist.read(bytes_per_chunk)
-                        if chunk:
-                            f.write(chunk)
-                            if show_progress:
-                                pbar.update(bytes_per_chunk)
-                        else:
-                            break
-                    if show_progress:
-                        pbar.close()
-
-        except:
-            # the download is likely incomplete, so delete the temporary file
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-
-            # raise the exception so that it can be handled elsewhere
-            raise
+                    if len(ranges) > 1:
+                        # allocate the whole file so that segments can be
+                        # written in place
+                        f.truncate(total)
+            else:
+                info = _read_part_info(temp_file)
+                total = info['size']
+                extra_connections = _acquire_connections(connection_limit, len(ranges) - 1)
+                logger.info(f'Resuming {os.path.basename(local_file)}')
+
+            remaining = None if total is None else sum(stop - start for start, stop in ranges)
+            if progress is not None:
+                # report progress of many downloads together
+                if remaining is not None:
+                    progress.set_remaining(remaining)
+            else:
+                # if the file size is unknown, progress can't be displayed,
+                # but other stats can be
+                done = ranges[0][0] if total is None else total - remaining
+                progress = file_progress = _AggregateProgress(show_progress, total, done)
 
-        else:
-            # download completed, so move the temp file to the final location
-            shutil.move(temp_file, local_file)
+            _download_ranges(url, dist, temp_file, ranges, info, progress, bytes_per_chunk, 1 + extra_connections)
+
+        if total is not None and os.path.getsize(temp_file) != total:
+            raise ConnectionError(f'downloaded {os.path.getsize(temp_file)} bytes but expected {total}')
+
+    except:
+        # keep the temporary file so that the download can be resumed,
+        # unless nothing was downloaded
+        if os.path.exists(temp_file) and os.path.getsize(temp_file) == 0:
+            _remove_part_file(temp_file)
+
+        # raise the exception so that it can be handled elsewhere
+        raise
+
+    else:
+        # download completed, so move the temp file to the final location
+        shutil.move(temp_file, local_file)
+        _remove_part_file(temp_file)
+
+    finally:
+        _release_connections(connection_limit, extra_connections)
+        if file_progress is not None:
+            file_progress.close()
+
+def _segment_count(response, total):
+    """
+    Return the number of segments in which to download a file of size
+    ``total``, given the ``response`` to a request for the whole file.
+
+    If the server can send parts of files, a large file is split into as many
+    as "segments_per_file" segments of at least "min_segment_size_mb"
+    megabytes (from the "downloads" section of the global config), which are
+    downloaded at once, since a single connection is often much slower than
+    the network allows. Otherwise the whole file is one segment.
+    """
+
+    if total is not None and response.getcode() == 200 and response.headers.get('Accept-Ranges', '').strip().lower() == 'bytes':
+        min_size = max(1, int(global_config['downloads']['min_segment_size_mb'] * 1024 * 1024))
+        return max(1, min(global_config['downloads']['segments_per_file'], total // min_size))
+    return 1
+
+def _split_ranges(total, count):
+    """
+    Return ``count`` byte ranges covering a file of size ``total``, or one
+    range of unknown size if ``total`` is None. Each range is a list of its
+    first byte and the byte after its last.
+    """
+
+    if total is None:
+        return [[0, None]]
+    bounds = [total * i // count for i in range(count + 1)]
+    return [[bounds[i], bounds[i+1]] for i in range(count)]
+
+def _acquire_connections(connection_limit, n):
+    """
+    Take up to ``n`` slots from the semaphore ``connection_limit`` without
+    waiting, and return how many were taken. If ``connection_limit`` is None,
+    connections are not limited.
+    """
+
+    if connection_limit is None:
+        return n
+    acquired = 0
+    while acquired < n and connection_limit.acquire(blocking=False):
+        acquired += 1
+    return acquired
+
+def _release_connections(connection_limit, n):
+    """
+    Return ``n`` slots taken by :func:`_acquire_connections`.
+    """
+
+    if connection_limit is not None:
+        for i in range(n):
+            connection_limit.release()
 
+def _download_ranges(url, response, temp_file, ranges, info, progress, bytes_per_chunk, max_connections):
+    """
+    Download the byte ``ranges`` of a file into ``temp_file`` using at most
+    ``max_connections`` connections at once, reading the first range from
+    ``response`` while requesting the others.
+
+    The first byte of each range is updated as the range is written. If any
+    range fails, the ranges that remain are recorded so that the download can
+    be resumed, and the error is raised once the others are done.
+    """
+
+    def download_range(i):
+        start, stop = ranges[i]
+        if i == 0:
+            dist = response
+        else:
+            dist = _urlopen(_range_request(url, start, stop, info))
+            if dist is None:
+                raise urllib.error.URLError('authentication failed')
+            if not _can_resume(dist, start, info):
+                dist.close()
+                raise ConnectionError('server did not send the requested part of the file')
+
+        with dist, open(temp_file, 'r+b') as f:
+            f.seek(start)
+            while stop is None or ranges[i][0] < stop:
+                n = bytes_per_chunk if stop is None else min(bytes_per_chunk, stop - ranges[i][0])
+                chunk = dist.read(n)
+                if not chunk:
+                    break
+                f.write(chunk)
+                ranges[i][0] += len(chunk)
+                progress.update(len(chunk))
+
+        if stop is not None and ranges[i][0] < stop:
+            raise ConnectionError(f'connection closed after {ranges[i][0] - start} of {stop - start} bytes')
 
-def _auth_needed(url):
+    try:
+        if len(ranges) == 1 or max_connections == 1:
+            for i in range(len(ranges)):
+                download_range(i)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(ranges), max_connections), thread_name_prefix='Segment') as executor:
+                futures = [executor.submit(download_range, i) for i in range(len(ranges))]
+            for future in futures:
+                if future.exception() is not None:
+                    raise future.exception()
+    except:
+        _write_remaining_ranges(temp_file, info, ranges)
+        raise
+
+def _open_resumable(url, temp_file):
     """
-    Determine whether authentication is needed by attempting to make a
-    connection.
+    Open ``url``, requesting only the parts of the file that are not already
+    in ``temp_file`` if possible. Return the response and the byte ranges
+    still to be downloaded, the first of which begins where the response
+    does, or None in place of the ranges if the download must start over.
     """
 
     # escape spaces and other unsafe characters
     url = urllib.parse.quote(url, safe='/:')
 
-    error = None
-    error_code = None
+    info = _read_part_info(temp_file)
+    if info is not None and info.get('url', None) == url and os.path.exists(temp_file):
+        ranges = info.get('remaining', None)
+        if ranges is None:
+            ranges = [[os.path.getsize(temp_file), info.get('size', None)]]
+        ranges = [list(r) for r in ranges]
+
+        if ranges and ranges != [[0, info.get('size', None)]]:
+            try:
+                dist = _urlopen(_range_request(url, ranges[0][0], None, info))
+            except urllib.error.HTTPError as e:
+                # range not satisfiable, perhaps because the remote file
+                # became smaller
+                if e.code != 416:
+                    raise
+            else:
+                if dist is None or _can_resume(dist, ranges[0][0], info):
+                    return dist, ranges
+                dist.close()
+            logger.info(f'Discarding {os.path.basename(temp_file)} (remote file changed or server cannot resume)')
+
+    return _urlopen(url), None
+
+def _range_request(url, start, stop, info):
+    """
+    Return a request for the bytes of ``url`` from ``start`` up to ``stop``,
+    or to the end of the file if ``stop`` is None. The server is asked to send
+    the whole file instead if it changed since ``info`` was recorded.
+    """
+
+    if stop is None:
+        request = urllib.request.Request(url, headers={'Range': f'bytes={start}-'})
+    else:
+        request = urllib.request.Request(url, headers={'Range': f'bytes={start}-{stop-1}'})
+
+    etag = info.get('etag', None)
+    validator = etag if etag and not etag.startswith('W/') else info.get('last_modified', None)
+    if validator:
+        request.add_header('If-Range', validator)
+    return request
+
+def _urlopen(request):
+    """
+    Open a URL or :class:`urllib.request.Request`, first prompting for login
+    credentials if the server requires them and they are not yet known.
+    Return None if authentication fails.
+    """
 
     try:
-        # try to connect
-        with urllib.request.urlopen(url) as dist:
-            # if connection was successful, additional auth is not needed
+        return urllib.request.urlopen(request)
+    except urllib.error.URLError as e:
+        if _auth_error_code(e) is None:
+            raise
+
+    # authenticate with each server in one thread at a time, so that
+    # concurrent downloads prompt for credentials only once
+    url = request.full_url if isinstance(request, urllib.request.Request) else request
+    with _auth_lock(url):
+        return _authenticate(request)
+
+def _can_resume(response, offset, info):
+    """
+    Determine whether ``response`` continues a partial download of
+    ``offset`` bytes, using the ETag, modification time, and size of the
+    remote file recorded in ``info`` when the download started.
+    """
+
+    if response.getcode() != 206:
+        return False
+
+    match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', response.headers.get('Content-Range', '').strip())
+    if match is None or int(match[1]) != offset:
+        return False
+
+    # the response must be validated against at least one property of the
+    # original file, and must match all of them
+    validated = False
+    if match[3] != '*' and info.get('size', None) is not None:
+        if int(match[3]) != info['size']:
             return False
+        validated = True
+    for key, header in [('etag', 'ETag'), ('last_modified', 'Last-Modified')]:
+        if info.get(key, None) and response.headers.get(header, None):
+            if response.headers[header] != info[key]:
+                return False
+            validated = True
+    return validated
 
-    except urllib.error.HTTPError as e:
+def _total_size(response, offset):
+    """
+    Return the size of the whole file being downloaded, or None if it is not
+    known.
+    """
 
-        error = e
-        error_code = e.code
+    if offset and response.headers.get('Content-Range', None):
+        total = response.headers['Content-Range'].rpartition('/')[2].strip()
+        if total.isdigit():
+            return int(total)
+    if response.headers.get('Content-Length', None):
+        return offset + int(response.headers['Content-Length'])
+    return None
 
-    except urllib.error.URLError as e:
+def _part_info_file(temp_file):
+    """
+    Return the path of the file describing the download of ``temp_file``.
+    """
+    return temp_file + '.yml'
 
-        error = e
+def _read_part_info(temp_file):
+    """
+    Return the description of the download of ``temp_file``, or None if
+    there is none.
+    """
 
-        if isinstance(e.reason, str):
+    try:
+        with open(_part_info_file(temp_file)) as f:
+            info = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError):
+        return None
+    return info if isinstance(info, dict) else None
 
-            # special cases for ftp errors
-            if e.reason.startswith('ftp error: error_perm('):
-                reason = e.reason[23:-2]
-                error_code = int(reason[:3])
-            else:
-                raise
+def _write_part_info(temp_file, url, headers, total):
+    """
+    Record the URL, size, ETag, and modification time of the file being
+    downloaded to ``temp_file``, so that an interrupted download can be
+    resumed later only if the remote file has not changed, and return them.
+    """
 
-        else:
+    info = {
+        'url': urllib.parse.quote(url, safe='/:'),
+        'size': total,
+        'etag': headers.get('ETag', None),
+        'last_modified': headers.get('Last-Modified', None),
+    }
+    with open(_part_info_file(temp_file), 'w') as f:
+        yaml.safe_dump(info, f)
+    return info
+
+def _write_remaining_ranges(temp_file, info, ranges):
+    """
+    Record which byte ranges of the file being downloaded to ``temp_file``
+    have not been downloaded yet.
+    """
 
-            error_code = e.reason.errno
+    remaining = [[start, stop] for start, stop in ranges if stop is None or start < stop]
+    with open(_part_info_file(temp_file), 'w') as f:
+        yaml.safe_dump(dict(info, remaining=remaining), f)
 
-    finally:
+def _remove_part_file(temp_file):
+    """
+    Delete ``temp_file``, if it exists, and its description.
+    """
 
-        if error_code is not None:
+    for file in [temp_file, _part_info_file(temp_file)]:
+        if os.path.exists(file):
+            os.remove(file)
 
-            if error_code in [401, 530, 553]:
-                # unauthorized
-                return True
 
-            else:
-                raise error
+def _auth_error_code(error):
+    """
+    Return the error code of ``error``, a :class:`urllib.error.URLError`, if
+    it means that login credentials are needed, or else None.
+    """
+
+    if isinstance(error, urllib.error.HTTPError):
+        error_code = error.code
+    elif isinstance(error.reason, str) and error.reason.startswith('ftp error: error_perm('):
+        # special cases for ftp errors
+        error_code = int(error.reason[23:26])
+    else:
+        return None
+
+    if error_code in [401, 530, 553]:
+        # unauthorized
+        return error_code
+    return None
 
 
-def _authenticate(url):
+def _authenticate(request):
     """
-    Perform HTTP or FTP authentication.
+    Perform HTTP or FTP authentication, prompting for login credentials until
+    ``request``, a URL or :class:`urllib.request.Request`, succeeds. Return
+    the response, or None if authentication fails.
     """
 
-    # escape spaces and other unsafe characters
-    url = urllib.parse.quote(url, safe='/:')
+    if isinstance(request, urllib.request.Request):
+        url = request.full_url
+    else:
+        # escape spaces and other unsafe characters
+        url = request = urllib.parse.quote(request, safe='/:')
 
     bad_login_attempts = 0
     while True:
@@ -240,10 +879,9 @@ def _authenticate(url):
         error_code = None
 
         try:
-            # try to connect
-            with urllib.request.urlopen(url) as dist:
-                # if connection was successful, authentication is done
-                return True
+            # try to connect, which may succeed right away if another thread
+            # just authenticated
+            return urllib.request.urlopen(request)
 
         except urllib.error.HTTPError as e:
 
@@ -284,7 +922,7 @@ def _authenticate(url):
 
         if bad_login_attempts >= _max_bad_login_attempts:
             logger.error('Unauthorized: Aborting login')
-            return False
+            return None
         else:
             if bad_login_attempts == 0:
                 logger.info('Authentication required')
@@ -295,11 +933,41 @@ def _authenticate(url):
                       f'{url}')
             bad_login_attempts += 1
 
-            netloc = urllib.parse.urlparse(url).netloc
-            host, port = urllib.parse.splitport(netloc)
-            user = input(f'User name on {host}: ')
+            parsed = urllib.parse.urlsplit(url)
+            netloc = parsed.netloc
+            user = input(f'User name on {parsed.hostname}: ')
             if not user:
                 logger.error('No user given, aborting login')
-                return False
+                return None
             passwd = getpass('Password: ')
-            handler.add_password(None, netloc, user, passwd)
+            if handler is _http_auth_handler:
+                # send the credentials with every request rather than waiting
+                # for the server to refuse each one
+                handler.add_password(None, netloc, user, passwd, is_authenticated=True)
+                # forget that the server refused this URL
+                handler.passwd.update_authenticated(url, True)
+            else:
+                handler.add_password(None, netloc, user, passwd)
+
+
+# locks ensuring that only one thread at a time authenticates with each host
+_auth_locks = {}
+_auth_locks_lock = threading.Lock()
+
+def _auth_lock(url):
+    """
+    Return the lock for authenticating with the host of ``url``.
+    """
+
+    with _auth_locks_lock:
+        return _auth_locks.setdefault(_host(url), threading.Lock())
+
+def _host(url):
+    """
+    Return the name of the server of ``url``, or "gdrive" for Google Drive.
+    """
+
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == 'gdrive':
+        return 'gdrive'
+    return parsed.hostname
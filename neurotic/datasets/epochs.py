@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+The :mod:`neurotic.datasets.epochs` module implements classes for quickly
+finding the epochs that overlap a window of time or contain a point in time,
+and functions for combining epochs like sets of time intervals.
+
+.. autoclass:: EpochIndex
+   :members:
+
+.. autoclass:: EpochChannelIndex
+   :members:
+
+.. autofunction:: union_epochs
+
+.. autofunction:: intersect_epochs
+
+.. autofunction:: subtract_epochs
+
+.. autofunction:: merge_epochs
+
+.. autofunction:: dilate_epochs
+
+.. autofunction:: evaluate_epoch_expression
+"""
+
+import numpy as np
+import quantities as pq
+import neo
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class EpochIndex():
+    """
+    An index over the :class:`neo.Epoch <neo.core.Epoch>` channels of a
+    :class:`neo.Block <neo.core.Block>` for fast time queries.
+
+    ``epochs`` may be a Block (only its first segment is used), a Segment, or
+    a list of Epochs. The index is built once, after which queries take
+    logarithmic time in the number of epochs in a channel. Channels are looked
+    up by name; if several Epochs share a name, the first one is used.
+
+    Times may be given as Quantities or as numbers in seconds.
+
+    >>> index = neurotic.EpochIndex(blk)
+    >>> index.overlapping('Type 1', 10, 20)  # indices of epochs in 'Type 1'
+    >>> index['Type 1'].epoch                # the original neo.Epoch
+    """
+
+    def __init__(self, epochs):
+        """
+        Initialize a new EpochIndex.
+        """
+
+        if isinstance(epochs, neo.Block):
+            epochs = epochs.segments[0].epochs
+        elif isinstance(epochs, neo.Segment):
+            epochs = epochs.epochs
+
+        self._channels = {}
+        for ep in epochs:
+            if ep.name not in self._channels:
+                self._channels[ep.name] = EpochChannelIndex(ep)
+
+    def __getitem__(self, name):
+        return self._channels[name]
+
+    def __contains__(self, name):
+        return name in self._channels
+
+    def __iter__(self):
+        return iter(self._channels)
+
+    def __len__(self):
+        return len(self._channels)
+
+    @property
+    def names(self):
+        """
+        The names of the indexed epoch channels.
+        """
+        return list(self._channels)
+
+    def overlapping(self, name, t_start, t_stop):
+        """
+        Return the indices of the epochs in the channel named ``name`` that
+        overlap the window from ``t_start`` to ``t_stop``. See
+        :meth:`EpochChannelIndex.overlapping`.
+        """
+        return self._channels[name].overlapping(t_start, t_stop)
+
+    def containing(self, name, t):
+        """
+        Return the indices of the epochs in the channel named ``name`` that
+        contain time ``t``. See :meth:`EpochChannelIndex.containing`.
+        """
+        return self._channels[name].containing(t)
+
+
+class EpochChannelIndex():
+    """
+    An index over a single :class:`neo.Epoch <neo.core.Epoch>` for fast time
+    queries.
+
+    Epoch start times and end times are sorted by start time, and the running
+    maximum of the end times is kept. Every epoch that ends after some time
+    must then lie between the first position where the running maximum passes
+    that time and the last position where the start precedes the end of the
+    query, so both bounds are found by binary search and only that range is
+    examined.
+
+    Query results are indices into the original Epoch, sorted by start time.
+    """
+
+    def __init__(self, epoch):
+        """
+        Initialize a new EpochChannelIndex.
+        """
+
+        self.epoch = epoch
+
+        starts = _seconds(epoch.times)
+        ends = starts + _seconds(epoch.durations)
+
+        self._order = np.argsort(starts, kind='stable')
+        self._starts = starts[self._order]
+        self._ends = ends[self._order]
+        self._max_ends = np.maximum.accumulate(self._ends) if len(self._ends) else self._ends
+
+        # non-overlapping intervals covering the same times as the epochs with
+        # positive duration, for testing many times at once
+        positive = self._ends > self._starts
+        self._union_starts, self._union_ends = _merge_intervals(self._starts[positive], self._ends[positive])
+
+    def __len__(self):
+        return len(self._starts)
+
+    def overlapping(self, t_start, t_stop):
+        """
+        Return the indices of the epochs that overlap the window from
+        ``t_start`` to ``t_stop``, i.e., that start no later than ``t_stop``
+        and end no earlier than ``t_start``. Epochs with zero duration inside
+        the window are included.
+        """
+
+        t_start, t_stop = _seconds(t_start), _seconds(t_stop)
+        last = np.searchsorted(self._starts, t_stop, 'right')
+        first = np.searchsorted(self._max_ends, t_start, 'left')
+        return self._order[first:last][self._ends[first:last] >= t_start]
+
+    def containing(self, t):
+        """
+        Return the indices of the epochs that contain time ``t``, i.e., that
+        start no later than ``t`` and end after ``t``.
+        """
+
+        t = _seconds(t)
+        last = np.searchsorted(self._starts, t, 'right')
+        first = np.searchsorted(self._max_ends, t, 'right')
+        return self._order[first:last][self._ends[first:last] > t]
+
+    def contains(self, times):
+        """
+        Return a boolean array indicating which of ``times`` are contained in
+        at least one epoch, using the same rule as :meth:`containing`.
+        """
+
+        times = _seconds(times)
+        if len(self._union_starts) == 0:
+            return np.zeros(np.shape(times), dtype=bool)
+        i = np.searchsorted(self._union_starts, times, 'right') - 1
+        return (i >= 0) & (times < self._union_ends[np.maximum(i, 0)])
+
+
+def union_epochs(*epochs, name=None):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` containing the times covered
+    by any of ``epochs``, as sorted, non-overlapping epochs. Overlapping or
+    adjacent epochs are merged.
+    """
+
+    starts, stops = _intervals(*epochs)
+    return _epoch_from_intervals(*_merge_intervals(starts, stops), name)
+
+def intersect_epochs(*epochs, name=None):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` containing the times covered
+    by every one of ``epochs``, as sorted, non-overlapping epochs.
+    """
+
+    starts, stops = _merge_intervals(*_intervals(epochs[0]))
+    for epoch in epochs[1:]:
+        starts, stops = _intersect_intervals(starts, stops, *_merge_intervals(*_intervals(epoch)))
+    return _epoch_from_intervals(starts, stops, name)
+
+def subtract_epochs(epoch, *others, name=None):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` containing the times covered
+    by ``epoch`` but not by any of ``others``, as sorted, non-overlapping
+    epochs.
+    """
+
+    starts, stops = _merge_intervals(*_intervals(epoch))
+    if others:
+        # intersect with the gaps between the other epochs
+        other_starts, other_stops = _merge_intervals(*_intervals(*others))
+        gap_starts = np.r_[-np.inf, other_stops]
+        gap_stops = np.r_[other_starts, np.inf]
+        starts, stops = _intersect_intervals(starts, stops, gap_starts, gap_stops)
+    return _epoch_from_intervals(starts, stops, name)
+
+def merge_epochs(epoch, gap=0, name=None):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` in which epochs of ``epoch``
+    that overlap or are separated by no more than ``gap`` are merged.
+    """
+
+    starts, stops = _intervals(epoch)
+    return _epoch_from_intervals(*_merge_intervals(starts, stops, _seconds(gap)), name)
+
+def dilate_epochs(epoch, before, after=None, name=None):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` in which epochs of ``epoch``
+    start ``before`` earlier and end ``after`` later (by default, the same as
+    ``before``), with any resulting overlaps merged. Negative values shrink
+    epochs, and epochs that shrink to less than nothing are removed.
+    """
+
+    if after is None:
+        after = before
+    starts, stops = _intervals(epoch)
+    starts, stops = starts - _seconds(before), stops + _seconds(after)
+    keep = stops >= starts
+    return _epoch_from_intervals(*_merge_intervals(starts[keep], stops[keep]), name)
+
+def evaluate_epoch_expression(expression, epochs):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` described by ``expression``,
+    which combines the epoch channels in ``epochs`` (an :class:`EpochIndex`,
+    or anything accepted by it).
+
+    An expression is either the name of an epoch channel, or a dictionary
+    with one of these forms, where each ``expr`` is itself an expression and
+    times are in seconds:
+
+        * ``{'union': [expr, expr, ...]}``
+        * ``{'intersect': [expr, expr, ...]}``
+        * ``{'subtract': [expr, expr, ...]}``: the first minus all others
+        * ``{'merge': expr, 'gap': 0.5}``
+        * ``{'dilate': expr, 'before': 0.5, 'after': 1}``
+
+    Channels that are not found are treated as empty, with a warning.
+    """
+
+    if not isinstance(epochs, EpochIndex):
+        epochs = EpochIndex(epochs)
+
+    if isinstance(expression, str):
+        if expression in epochs:
+            return epochs[expression].epoch
+        logger.warning(f'Epoch channel "{expression}" was not found')
+        return _epoch_from_intervals(np.array([]), np.array([]), expression)
+
+    if isinstance(expression, dict):
+        # operations taking a list of expressions, and operations taking one
+        # expression plus parameters
+        operations = {
+            'union':     (union_epochs,     None),
+            'intersect': (intersect_epochs, None),
+            'subtract':  (subtract_epochs,  None),
+            'merge':     (merge_epochs,     ['gap']),
+            'dilate':    (dilate_epochs,    ['before', 'after']),
+        }
+        names = [name for name in expression if name in operations]
+        if len(names) == 1:
+            function, parameters = operations[names[0]]
+            operands = expression[names[0]]
+            kwargs = {k: v for k, v in expression.items() if k != names[0]}
+            if parameters is not None:
+                operands = [operands]
+            if isinstance(operands, list) and operands and set(kwargs) <= set(parameters or []):
+                return function(*[evaluate_epoch_expression(operand, epochs) for operand in operands], **kwargs)
+
+    raise ValueError(f'epoch expression could not be handled: {expression}')
+
+def _intervals(*epochs):
+    """
+    Return the concatenated start and stop times in seconds of ``epochs``.
+    """
+
+    if not epochs:
+        return np.array([]), np.array([])
+    starts = np.concatenate([np.atleast_1d(_seconds(ep.times)) for ep in epochs])
+    stops = starts + np.concatenate([np.atleast_1d(_seconds(ep.durations)) for ep in epochs])
+    return starts, stops
+
+def _merge_intervals(starts, stops, gap=0):
+    """
+    Return sorted, non-overlapping intervals covering the same times as the
+    given intervals, also merging intervals separated by no more than ``gap``.
+    """
+
+    if len(starts) == 0:
+        return starts, stops
+
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    max_stops = np.maximum.accumulate(stops[order])
+    new_interval = np.r_[True, starts[1:] > max_stops[:-1] + gap]
+    return starts[new_interval], max_stops[np.r_[new_interval[1:], True]]
+
+def _intersect_intervals(starts1, stops1, starts2, stops2):
+    """
+    Return the intersection of two sets of sorted, non-overlapping intervals,
+    keeping only intersections with positive duration.
+    """
+
+    # for each interval of the first set, the range of intervals of the second
+    # set that overlap it
+    first = np.searchsorted(stops2, starts1, 'right')
+    last = np.searchsorted(starts2, stops1, 'left')
+    counts = np.maximum(last - first, 0)
+
+    i = np.repeat(np.arange(len(starts1)), counts)
+    j = np.repeat(first - np.cumsum(np.r_[0, counts[:-1]]), counts) + np.arange(counts.sum())
+
+    starts = np.maximum(starts1[i], starts2[j])
+    stops = np.minimum(stops1[i], stops2[j])
+    keep = stops > starts
+    return starts[keep], stops[keep]
+
+def _epoch_from_intervals(starts, stops, name=None):
+    """
+    Return a Neo :class:`Epoch <neo.core.Epoch>` for intervals in seconds.
+    """
+
+    return neo.Epoch(
+        name = name,
+        times = starts * pq.s,
+        durations = (stops - starts) * pq.s,
+        labels = np.full(len(starts), '', dtype='U1'),
+    )
+
+def _seconds(t):
+    """
+    Return ``t`` as a float or float array in seconds, assuming seconds if
+    ``t`` is not a Quantity.
+    """
+
+    if isinstance(t, pq.Quantity):
+        t = t.rescale('s').magnitude
+    if np.ndim(t) == 0:
+        return float(t)
+    return np.asarray(t, dtype=float)
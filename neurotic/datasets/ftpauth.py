@@ -9,8 +9,13 @@ passwords.
 .. autofunction:: setup_ftpauth
 """
 
+import re
+import time
 import ftplib
+import threading
 import urllib
+from urllib.request import ftpwrapper
+from urllib.response import addclosehook
 from urllib.request import FTPHandler, HTTPPasswordMgr
 from urllib.parse import splitport, splituser, unquote
 
@@ -30,6 +35,18 @@ class FTPBasicAuthHandler(FTPHandler):
     header, which can fail for some FTP servers if the original
     :class:`FTPHandler <urllib.request.FTPHandler>` is used.
 
+    Like an HTTP server, this handler can send just the end of a file, for
+    resuming an interrupted download, if the request has a ``Range`` header of
+    the form ``bytes=<start>-``. The transfer then starts at ``<start>`` using
+    the FTP ``REST`` command, and the response has status 206 and a
+    ``Content-Range`` header. The modification time of the file is reported
+    in the ``Last-Modified`` header if the server provides it.
+
+    Connections are kept open after each file is transferred and are reused
+    for later requests to the same directory on the same server, which saves
+    logging in again for every file. Connections left unused for
+    ``max_idle_time`` seconds are closed.
+
     This handler can be installed globally in a Python session so that calls
     to :func:`urllib.request.urlopen('ftp://...') <urllib.request.urlopen>`
     will use it automatically:
@@ -40,6 +57,8 @@ class FTPBasicAuthHandler(FTPHandler):
     >>> urllib.request.install_opener(opener)
     """
 
+    max_idle_time = 60  # seconds
+
     def __init__(self, password_mgr=None):
         """
         Initialize a new FTPBasicAuthHandler.
@@ -49,8 +68,21 @@ class FTPBasicAuthHandler(FTPHandler):
             password_mgr = HTTPPasswordMgr()
         self.passwd = password_mgr
         self.add_password = self.passwd.add_password
+
+        # requests may be made from several threads at once
+        self._local = threading.local()
+        self._idle = {}
+        self._idle_lock = threading.Lock()
         return super().__init__()
 
+    @property
+    def last_req_host(self):
+        return getattr(self._local, 'last_req_host', None)
+
+    @last_req_host.setter
+    def last_req_host(self, host):
+        self._local.last_req_host = host
+
     def ftp_open(self, req):
         """
         When ftp requests are made using this handler, this function gets
@@ -70,6 +102,9 @@ class FTPBasicAuthHandler(FTPHandler):
         original implementation should handle this (``retrlen`` should contain
         the file size). However, for others this can fail silently due to the
         server response not matching an anticipated regular expression.
+
+        Finally, this reimplementation handles ``Range`` request headers for
+        resuming downloads.
         """
 
         import sys
@@ -131,21 +166,43 @@ class FTPBasicAuthHandler(FTPHandler):
             ############################################
             # DIFFERENT FROM FTPHandler.ftp_open
             size = fw.ftp.size(file)
+            modified = _modification_time(fw.ftp, file)
+            rest = _range_start(req)
+            fp, retrlen = None, None
+            if rest and size is not None and rest < size:
+                try:
+                    fp, retrlen = _retrfile_from(fw, file, type, rest)
+                except (ftplib.error_perm, ftplib.error_reply):
+                    # the server cannot resume, so send the whole file
+                    rest = None
+            else:
+                rest = None
+            if fp is None:
+                fp, retrlen = fw.retrfile(file, type)
             ############################################
-            fp, retrlen = fw.retrfile(file, type)
             headers = ""
             mtype = mimetypes.guess_type(req.full_url)[0]
             if mtype:
                 headers += "Content-type: %s\n" % mtype
-            if retrlen is not None and retrlen >= 0:
-                headers += "Content-length: %d\n" % retrlen
             ############################################
             # DIFFERENT FROM FTPHandler.ftp_open
+            if rest:
+                headers += "Content-length: %d\n" % (size - rest)
+                headers += "Content-range: bytes %d-%d/%d\n" % (rest, size - 1, size)
+            elif retrlen is not None and retrlen >= 0:
+                headers += "Content-length: %d\n" % retrlen
             elif size is not None and size >= 0:
                 headers += "Content-length: %d\n" % size
+            if modified:
+                headers += "Last-modified: %s\n" % modified
             ############################################
             headers = email.message_from_string(headers)
-            return addinfourl(fp, headers, req.full_url)
+            ############################################
+            # DIFFERENT FROM FTPHandler.ftp_open
+            # reuse the connection once the transfer is done
+            fp = addclosehook(fp, self._release, fw, fp)
+            ############################################
+            return addinfourl(fp, headers, req.full_url, code=206 if rest else None)
         except ftplib.all_errors as exp:
             exc = URLError('ftp error: %r' % exp)
             raise exc.with_traceback(sys.exc_info()[2])
@@ -163,7 +220,93 @@ class FTPBasicAuthHandler(FTPHandler):
 
         if not user and not passwd:
             user, passwd = self.passwd.find_user_password(None, self.last_req_host)
-        return super().connect_ftp(user, passwd, host, port, dirs, timeout)
+
+        # reuse an idle connection if possible
+        key = (user, passwd, host, port, '/'.join(dirs), timeout)
+        fw = self._get_idle(key)
+        if fw is None:
+            fw = ftpwrapper(user, passwd, host, port, dirs, timeout, persistent=True)
+        fw.neurotic_pool_key = key
+        return fw
+
+    def _get_idle(self, key):
+        """
+        Return an idle connection that is still open, or None if there is
+        none.
+        """
+
+        while True:
+            with self._idle_lock:
+                idle = self._idle.get(key, [])
+                if not idle:
+                    return None
+                fw, released = idle.pop()
+            if time.monotonic() - released < self.max_idle_time:
+                try:
+                    fw.ftp.voidcmd('NOOP')
+                    return fw
+                except ftplib.all_errors:
+                    pass
+            fw.close()
+
+    def _release(self, fw, fp):
+        """
+        Finish a transfer and keep its connection open for reuse.
+        """
+
+        try:
+            fp.close()
+        except ftplib.all_errors:
+            # the transfer was interrupted, so the state of the connection is
+            # unknown
+            fw.close()
+            return
+
+        with self._idle_lock:
+            self._idle.setdefault(fw.neurotic_pool_key, []).append((fw, time.monotonic()))
+
+
+def _range_start(req):
+    """
+    Return the first byte requested by the ``Range`` header of ``req``, or
+    None if the whole file is requested.
+    """
+
+    match = re.fullmatch(r'bytes=(\d+)-', req.get_header('Range', '').strip())
+    if match is None:
+        return None
+    return int(match[1])
+
+def _modification_time(ftp, file):
+    """
+    Return the modification time of ``file`` reported by the FTP server, or
+    None if the server does not support the ``MDTM`` command.
+    """
+
+    try:
+        return ftp.voidcmd('MDTM ' + file)[4:].strip()
+    except ftplib.all_errors:
+        return None
+
+def _retrfile_from(fw, file, type, rest):
+    """
+    Like :meth:`urllib.request.ftpwrapper.retrfile`, but start the transfer
+    ``rest`` bytes into the file.
+    """
+
+    fw.endtransfer()
+    try:
+        fw.ftp.voidcmd('TYPE ' + type)
+    except ftplib.all_errors:
+        fw.init()
+        fw.ftp.voidcmd('TYPE ' + type)
+    conn, retrlen = fw.ftp.ntransfercmd('RETR ' + file, rest)
+    fw.busy = 1
+
+    fp = addclosehook(conn.makefile('rb'), fw.file_close)
+    fw.refcount += 1
+    conn.close()
+    return fp, retrlen
 
 
 def setup_ftpauth():
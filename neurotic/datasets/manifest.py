@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+The :mod:`neurotic.datasets.manifest` module implements functions for
+recording the sizes and checksums of data files in a manifest file and for
+verifying local copies of the files against it.
+
+A manifest is a YAML file listing, for each file path relative to a data
+directory, the file's size in bytes, its modification time, and its SHA-256
+checksum. Files are read in chunks, and several files are read at once, so
+checking large collections is limited by disk speed rather than by the
+processor.
+
+.. autofunction:: write_manifest
+
+.. autofunction:: read_manifest
+
+.. autofunction:: verify_files
+"""
+
+import os
+import hashlib
+import concurrent.futures
+import yaml
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# increment when the format of manifest files changes
+_manifest_version = 1
+
+_hash_algorithm = 'sha256'
+_bytes_per_chunk = 1024*1024
+_default_max_workers = 4
+
+def write_manifest(manifest_file, data_dir, files, max_workers=None):
+    """
+    Write a manifest of ``files``, given as paths relative to ``data_dir``,
+    to ``manifest_file``, and return its contents.
+
+    Files that do not exist are left out of the manifest with a warning. If
+    ``manifest_file`` already exists, checksums of files whose sizes and
+    modification times have not changed are kept rather than computed again.
+    """
+
+    try:
+        old_entries = read_manifest(manifest_file)
+    except (OSError, ValueError):
+        old_entries = {}
+
+    entries = {}
+    to_hash = []
+    for file in files:
+        path = os.path.join(data_dir, file)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            logger.warning(f'Leaving {file} out of manifest (not found locally)')
+            continue
+
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        old_entry = old_entries.get(_manifest_key(file), {})
+        if all(old_entry.get(k, None) == entry[k] for k in ['size', 'mtime']) and _hash_algorithm in old_entry:
+            entry[_hash_algorithm] = old_entry[_hash_algorithm]
+        else:
+            to_hash.append(file)
+        entries[_manifest_key(file)] = entry
+
+    for file, checksum in zip(to_hash, _hash_files([os.path.join(data_dir, file) for file in to_hash], max_workers)):
+        entries[_manifest_key(file)][_hash_algorithm] = checksum
+
+    manifest = {'neurotic_manifest': _manifest_version, 'files': entries}
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_file)), exist_ok=True)
+    with open(manifest_file + '.tmp', 'w') as f:
+        yaml.safe_dump(manifest, f, sort_keys=False)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+    logger.info(f'Wrote manifest of {len(entries)} files to {manifest_file}')
+    return entries
+
+def read_manifest(manifest_file):
+    """
+    Return a dictionary mapping file paths to their sizes, modification times,
+    and checksums as recorded in ``manifest_file``.
+    """
+
+    with open(manifest_file) as f:
+        manifest = yaml.safe_load(f)
+
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('files', None), dict):
+        raise ValueError(f'"{manifest_file}" is not a manifest file')
+    if manifest.get('neurotic_manifest', None) != _manifest_version:
+        raise ValueError(f'"{manifest_file}" has an unsupported manifest version: {manifest.get("neurotic_manifest", None)}')
+
+    return manifest['files']
+
+def verify_files(manifest, data_dir, files, check_hashes=True, max_workers=None):
+    """
+    Compare local copies of ``files``, given as paths relative to
+    ``data_dir``, with their entries in ``manifest`` (as returned by
+    :func:`read_manifest`), and return a dictionary mapping each file to one
+    of these results:
+
+        * ``'ok'``
+        * ``'missing'``: the file does not exist locally
+        * ``'wrong size'``: the file is incomplete or differs from the original
+        * ``'wrong checksum'``: the file differs from the original
+        * ``'not in manifest'``
+
+    Checksums are computed only if ``check_hashes`` is True and sizes match.
+    """
+
+    results = {}
+    to_hash = []
+    for file in files:
+        entry = manifest.get(_manifest_key(file), None)
+        path = os.path.join(data_dir, file)
+        if entry is None:
+            results[file] = 'not in manifest'
+        elif not os.path.exists(path):
+            results[file] = 'missing'
+        elif os.path.getsize(path) != entry['size']:
+            results[file] = 'wrong size'
+        elif check_hashes:
+            to_hash.append(file)
+        else:
+            results[file] = 'ok'
+
+    for file, checksum in zip(to_hash, _hash_files([os.path.join(data_dir, file) for file in to_hash], max_workers)):
+        if checksum == manifest[_manifest_key(file)].get(_hash_algorithm, None):
+            results[file] = 'ok'
+        else:
+            results[file] = 'wrong checksum'
+
+    return {file: results[file] for file in files}
+
+def _manifest_key(file):
+    """
+    Return the portable form of a relative file path used in manifests.
+    """
+    return os.path.normpath(file).replace(os.sep, '/')
+
+def _hash_files(paths, max_workers=None):
+    """
+    Return the checksums of ``paths``, computing several at once.
+    """
+
+    if max_workers is None:
+        max_workers = _default_max_workers
+    if len(paths) <= 1:
+        return [_hash_file(path) for path in paths]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_hash_file, paths))
+
+def _hash_file(path):
+    """
+    Return the checksum of a file, reading it in chunks into a reused buffer.
+    The hash function releases the GIL, so files can be hashed on several
+    threads at once.
+    """
+
+    checksum = hashlib.new(_hash_algorithm)
+    buffer = bytearray(_bytes_per_chunk)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            checksum.update(view[:n])
+    return checksum.hexdigest()
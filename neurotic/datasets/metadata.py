@@ -8,13 +8,21 @@ metadata files.
 """
 
 import os
+import copy
+import time
+import pickle
+import hashlib
+import threading
+import collections.abc
+import concurrent.futures
 import urllib
 import yaml
 from packaging.specifiers import SpecifierSet
 from packaging import version
 
-from .. import __version__
-from ..datasets.download import download
+from .. import __version__, neurotic_dir
+from ..datasets.download import download, DownloadManager
+from ..datasets.manifest import write_manifest, read_manifest, verify_files
 
 import logging
 logger = logging.getLogger(__name__)
@@ -26,7 +34,10 @@ class MetadataSelector():
 
     A metadata file can be specified at initialization, in which case it is
     read immediately. The file contents are stored as a dictionary in
-    :attr:`all_metadata`.
+    :attr:`all_metadata`. Metadata may be split across many files using a
+    directory or the "include" setting (see :ref:`config-metadata-include`).
+    Defaults are filled in and paths are resolved for each metadata set only
+    when it is first accessed, so that large collections load quickly.
 
     >>> metadata = MetadataSelector(file='metadata.yml')
     >>> print(metadata.all_metadata)
@@ -65,6 +76,13 @@ class MetadataSelector():
 
     >>> metadata.download_all_data_files()
 
+    If the selected metadata set has a ``manifest_file``, downloads use it to
+    replace incomplete local files and to check new ones. Local files can also
+    be checked against it, and it can be written from local files, e.g.
+
+    >>> metadata.verify_local_files()
+    >>> metadata.write_manifest()
+
     The absolute path to a local file or the full URL to a remote file
     associated with the selected metadata set can be resolved with the
     :meth:`abs_path` and :meth:`abs_url` methods, e.g.
@@ -106,6 +124,9 @@ class MetadataSelector():
         elif selection not in self.all_metadata:
             raise ValueError('{} was not found in {}'.format(selection, self.file))
         else:
+            # fill in defaults and resolve paths now, so that any problems
+            # with the metadata are found at selection
+            self.all_metadata[selection]
             self._selection = selection
 
     @property
@@ -160,6 +181,41 @@ class MetadataSelector():
         """
         _download_all_data_files(self.selected_metadata, **kwargs)
 
+    def download_datasets(self, keys=None, **kwargs):
+        """
+        Download all files associated with the metadata sets named in
+        ``keys``, or with every metadata set if ``keys`` is None. Files are
+        downloaded several at a time.
+
+        ``max_workers`` and ``max_connections_per_host`` may be given to
+        override the limits in the "downloads" section of the global config.
+        See :func:`neurotic.datasets.download.download` for other possible
+        keyword arguments.
+        """
+        if keys is None:
+            keys = list(self.all_metadata)
+        _download_datasets([self.all_metadata[key] for key in keys], **kwargs)
+
+    def write_manifest(self, **kwargs):
+        """
+        Write the ``manifest_file`` of the selected metadata set, recording
+        the sizes and checksums of its local files.
+
+        See :func:`neurotic.datasets.manifest.write_manifest` for possible
+        keyword arguments.
+        """
+        return _write_manifest(self.selected_metadata, **kwargs)
+
+    def verify_local_files(self, **kwargs):
+        """
+        Check the local files of the selected metadata set against its
+        ``manifest_file``, returning a dictionary of results for each file.
+
+        See :func:`neurotic.datasets.manifest.verify_files` for possible
+        keyword arguments and results.
+        """
+        return _verify_local_files(self.selected_metadata, **kwargs)
+
     def __iter__(self, *args):
         if self.selected_metadata is None:
             logger.error('No metadata set is selected. Use the select() method first.')
@@ -197,22 +253,40 @@ class MetadataSelector():
             return self.selected_metadata.setdefault(*args)
 
 
+# increment when the format of cached metadata changes
+_metadata_cache_version = 2
+
+# the most recently parsed contents of each metadata file, keyed on the
+# absolute path, with values (cache key, datasets, neurotic_config)
+_metadata_cache = {}
+
+# use the much faster LibYAML parser if PyYAML was built with it
+_yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 def _load_metadata(file = 'metadata.yml', local_data_root = None, remote_data_root = None):
     """
     Read metadata stored in a YAML file about available collections of data,
     assign defaults to missing parameters, and resolve absolute paths for local
     data stores and full URLs for remote data stores.
 
+    ``file`` may also be a directory, in which case every YAML file in it is
+    read. A metadata file may read datasets from other files or directories
+    with the "include" setting under the reserved keyword "neurotic_config".
+    Relative paths in "include" are relative to the directory containing the
+    including file.
+
     ``local_data_root`` must be an absolute or relative path on the local
     system, or None. If it is a relative path, it is relative to the current
     working directory. If it is None, its value defaults to the directory
-    containing ``file``.
+    containing the file in which each data set appears.
 
     ``remote_data_root`` must be a full URL or None. If it is None, ``file``
     will be checked for a fallback value. "remote_data_root" may be provided in
     the YAML file under the reserved keyword "neurotic_config". Any non-None
     value passed to this function will override the value provided in the file.
     If both are unspecified, it is assumed that no remote data store exists.
+    Included files use the value of the including file unless they provide
+    their own.
 
     The "data_dir" property is optional for every data set in ``file`` and
     specifies the directory on the local system containing the data files.
@@ -230,96 +304,308 @@ def _load_metadata(file = 'metadata.yml', local_data_root = None, remote_data_ro
     both "data_dir" and "remote_data_dir" (i.e., the local and remote data
     stores mirror one another) and can be resolved with ``_abs_path`` or
     ``_abs_url``.
+
+    The parsed contents of each file are cached in memory and in the
+    *neurotic* user directory, keyed on the size and modification time of the
+    file, so that only files that changed are parsed again. Defaults and paths
+    are not filled in until a data set is first accessed in the returned
+    dictionary.
     """
 
     assert file is not None, 'metadata file must be specified'
     assert os.path.exists(file), 'metadata file "{}" cannot be found'.format(file)
 
-    # local_data_root defaults to the directory containing file
-    if local_data_root is None:
-        local_data_root = os.path.dirname(file)
+    if remote_data_root is not None and not _is_url(remote_data_root):
+        raise ValueError('"remote_data_root" passed to function is not a full URL: "{}"'.format(remote_data_root))
+
+    md = _LazyMetadata()
+    sources = {}  # the file in which each data set appears
+
+    # read files depth-first in the order they are included, starting with
+    # file itself
+    visited = set()
+    stack = [(file, None)]
+    while stack:
+        path, inherited_remote_data_root = stack.pop()
+        if os.path.isdir(path):
+            md.files.append(path)
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith(('.yml', '.yaml')))
+            stack += [(os.path.join(path, name), inherited_remote_data_root) for name in reversed(names)]
+            continue
+
+        abs_path = os.path.abspath(path)
+        if abs_path in visited:
+            # the file was already included
+            continue
+        visited.add(abs_path)
+        md.files.append(path)
+
+        datasets, config = _load_metadata_file(path)
+
+        # check neurotic version requirements
+        neurotic_version = config.get('neurotic_version', None)
+        if neurotic_version is not None:
+            version_spec = SpecifierSet(str(neurotic_version), prereleases=True)
+            if version.parse(__version__) not in version_spec:
+                logger.warning('the installed version of neurotic '
+                               f'({__version__}) does not meet version '
+                               'requirements specified in the metadata file '
+                               f'{path}: {version_spec}')
+
+        # use remote_data_root passed to function preferentially, then the
+        # value provided in the file, then the value inherited from the
+        # including file
+        remote_data_root_from_file = config.get('remote_data_root', None)
+        if remote_data_root is not None:
+            file_remote_data_root = remote_data_root
+        elif remote_data_root_from_file is not None:
+            if not _is_url(remote_data_root_from_file):
+                raise ValueError('"remote_data_root" provided in file is not a full URL: "{}"'.format(remote_data_root_from_file))
+            file_remote_data_root = remote_data_root_from_file
+        else:
+            file_remote_data_root = inherited_remote_data_root
+
+        # local_data_root defaults to the directory containing the file
+        file_local_data_root = local_data_root if local_data_root is not None else os.path.dirname(path)
+
+        for key, dataset in datasets.items():
+            if key in sources:
+                raise ValueError('"{}" appears in both "{}" and "{}"'.format(key, sources[key], path))
+            sources[key] = path
+            md._add(key, dataset, file_local_data_root, file_remote_data_root)
+
+        includes = config.get('include', None) or []
+        if isinstance(includes, str):
+            includes = [includes]
+        stack += [(os.path.join(os.path.dirname(path), include), file_remote_data_root) for include in reversed(includes)]
+
+    return md
+
+def _load_metadata_file(file):
+    """
+    Return the data sets and the "neurotic_config" settings in ``file``, as
+    read by :func:`_parse_metadata`, using the cache if the file has not
+    changed.
+
+    The returned values are shared by every caller and must not be modified.
+    """
+
+    stat = os.stat(file)
+    key = (_metadata_cache_version, __version__, os.path.abspath(file),
+           stat.st_size, stat.st_mtime_ns)
+
+    cached = _metadata_cache.get(key[2], None)
+    if cached is None or cached[0] != key:
+        cached = _load_metadata_cache(key)
+        if cached is None:
+            cached = (key, *_parse_metadata(file))
+            _save_metadata_cache(cached)
+        _metadata_cache[key[2]] = cached
+    _, datasets, config = cached
+
+    return datasets, config
+
+def _parse_metadata(file):
+    """
+    Read the metadata in ``file`` without caching or resolving it, and return
+    the data sets and the "neurotic_config" settings.
+    """
 
     # load metadata from file
     with open(file) as f:
-        md = yaml.safe_load(f)
+        md = yaml.load(f, Loader=_yaml_loader)
+    if md is None:
+        # the file is empty
+        md = {}
 
     # remove special entry "neurotic_config" from the dict if it exists
     config = md.pop('neurotic_config', None)
-    if isinstance(config, dict):
-        # process global settings
-        neurotic_version = config.get('neurotic_version', None)
-        remote_data_root_from_file = config.get('remote_data_root', None)
-    else:
+    if not isinstance(config, dict):
         # use defaults for all global settings
-        neurotic_version = None
-        remote_data_root_from_file = None
-
-    # check neurotic version requirements
-    if neurotic_version is not None:
-        version_spec = SpecifierSet(str(neurotic_version), prereleases=True)
-        if version.parse(__version__) not in version_spec:
-            logger.warning('the installed version of neurotic '
-                           f'({__version__}) does not meet version '
-                           'requirements specified in the metadata file: '
-                           f'{version_spec}')
-
-    # use remote_data_root passed to function preferentially
-    if remote_data_root is not None:
-        if not _is_url(remote_data_root):
-            raise ValueError('"remote_data_root" passed to function is not a full URL: "{}"'.format(remote_data_root))
-        else:
-            # use the value passed to the function
-            pass
-    elif remote_data_root_from_file is not None:
-        if not _is_url(remote_data_root_from_file):
-            raise ValueError('"remote_data_root" provided in file is not a full URL: "{}"'.format(remote_data_root_from_file))
-        else:
-            # use the value provided in the file
-            remote_data_root = remote_data_root_from_file
-    else:
-        # both potential sources of remote_data_root are None
-        pass
+        config = {}
 
-    # iterate over all data sets
     for key in md:
-
         assert type(md[key]) is dict, 'File "{}" may be formatted incorrectly, especially beginning with entry "{}"'.format(file, key)
 
-        # fill in missing metadata with default values
-        defaults = _defaults_for_key(key)
-        for k in defaults:
-            md[key].setdefault(k, defaults[k])
-
-        # determine the absolute path of the local data directory
-        if md[key]['data_dir'] is not None:
-            # data_dir is either an absolute path already or is specified
-            # relative to local_data_root
-            if os.path.isabs(md[key]['data_dir']):
-                dir = md[key]['data_dir']
-            else:
-                dir = os.path.abspath(os.path.join(local_data_root, md[key]['data_dir']))
+    return md, config
+
+def _resolve_metadata(key, dataset, local_data_root, remote_data_root):
+    """
+    Return a copy of the metadata for one data set with defaults filled in and
+    paths resolved, as described in :func:`_load_metadata`.
+    """
+
+    md = copy.deepcopy(dataset)
+
+    # fill in missing metadata with default values
+    defaults = _defaults_for_key(key)
+    for k in defaults:
+        md.setdefault(k, defaults[k])
+
+    # determine the absolute path of the local data directory
+    if md['data_dir'] is not None:
+        # data_dir is either an absolute path already or is specified
+        # relative to local_data_root
+        if os.path.isabs(md['data_dir']):
+            dir = md['data_dir']
         else:
-            # data_dir is a required property
-            raise ValueError('"data_dir" missing for "{}"'.format(key))
-        md[key]['data_dir'] = os.path.normpath(dir)
-
-        # determine the full URL to the remote data directory
-        if md[key]['remote_data_dir'] is not None:
-            # remote_data_dir is either a full URL already or is specified
-            # relative to remote_data_root
-            if _is_url(md[key]['remote_data_dir']):
-                url = md[key]['remote_data_dir']
-            elif _is_url(remote_data_root):
-                url = '/'.join([remote_data_root, md[key]['remote_data_dir']])
-            else:
-                url = None
+            dir = os.path.abspath(os.path.join(local_data_root, md['data_dir']))
+    else:
+        # data_dir is a required property
+        raise ValueError('"data_dir" missing for "{}"'.format(key))
+    md['data_dir'] = os.path.normpath(dir)
+
+    # determine the full URL to the remote data directory
+    if md['remote_data_dir'] is not None:
+        # remote_data_dir is either a full URL already or is specified
+        # relative to remote_data_root
+        if _is_url(md['remote_data_dir']):
+            url = md['remote_data_dir']
+        elif _is_url(remote_data_root):
+            url = '/'.join([remote_data_root, md['remote_data_dir']])
         else:
-            # there is no remote data store
             url = None
-        md[key]['remote_data_dir'] = url
+    else:
+        # there is no remote data store
+        url = None
+    md['remote_data_dir'] = url
 
     return md
 
+class _LazyMetadata(collections.abc.MutableMapping):
+    """
+    A dictionary of metadata for data sets that fills in defaults and resolves
+    paths for each data set only when it is first accessed.
+    """
+
+    def __init__(self):
+        # unresolved data sets, with values (metadata, local_data_root,
+        # remote_data_root)
+        self._unresolved = {}
+        self._resolved = {}
+
+        # the metadata files and directories that were read
+        self.files = []
+
+    def _add(self, key, dataset, local_data_root, remote_data_root):
+        self._unresolved[key] = (dataset, local_data_root, remote_data_root)
+
+    def peek(self, key, name, default=None):
+        """
+        Return the value of ``name`` for a data set as given in the metadata
+        file, without filling in defaults or resolving paths, unless the data
+        set was already resolved.
+        """
+        if key in self._resolved:
+            return self._resolved[key].get(name, default)
+        return self._unresolved[key][0].get(name, default)
+
+    def _keep_resolved(self, other, keys):
+        """
+        Use the resolved data sets of another _LazyMetadata for ``keys``,
+        which must be unchanged between the two, so that changes made to them
+        after they were resolved are kept.
+        """
+        for key in keys:
+            if key in other._resolved:
+                self._resolved.setdefault(key, other._resolved[key])
+
+    def __getitem__(self, key):
+        if key not in self._resolved:
+            md = _resolve_metadata(key, *self._unresolved[key])
+            # another thread may have resolved it first
+            return self._resolved.setdefault(key, md)
+        return self._resolved[key]
+
+    def __setitem__(self, key, value):
+        self._unresolved.setdefault(key, None)
+        self._resolved[key] = value
+
+    def __delitem__(self, key):
+        del self._unresolved[key]
+        self._resolved.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._unresolved)
+
+    def __len__(self):
+        return len(self._unresolved)
+
+    def __contains__(self, key):
+        return key in self._unresolved
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({list(self)})'
+
+
+def _changed_datasets(old, new):
+    """
+    Return the set of keys of data sets that were added, removed, or changed
+    in the metadata files between two dictionaries returned by
+    :func:`_load_metadata`.
+
+    Changes made to data sets after they were loaded are ignored.
+    """
+
+    if not isinstance(old, _LazyMetadata) or not isinstance(new, _LazyMetadata):
+        return set(old or {}) | set(new or {})
+
+    changed = old._unresolved.keys() ^ new._unresolved.keys()
+    for key in old._unresolved.keys() & new._unresolved.keys():
+        # data sets read from unchanged files are identical objects, which
+        # makes this comparison fast
+        if old._unresolved[key] != new._unresolved[key]:
+            changed.add(key)
+    return changed
+
+
+def _metadata_cache_file(key):
+    """
+    Return the path to the cached metadata for a cache key.
+    """
+
+    # exclude the file size and modification time so that the cache for a
+    # file is replaced when it changes
+    file = key[2]
+    digest = hashlib.sha1(file.encode('utf-8')).hexdigest()
+    return os.path.join(neurotic_dir, 'cache', 'metadata', digest + '.pickle')
+
+def _load_metadata_cache(key):
+    """
+    Return the cached ``(key, datasets, neurotic_config)`` if they were saved
+    with the given key, or otherwise None.
+    """
+
+    cache_file = _metadata_cache_file(key)
+    if not os.path.exists(cache_file):
+        return None
+
+    try:
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+        if cached[0] != key:
+            return None
+    except Exception as e:
+        logger.debug(f'Ignoring unreadable metadata cache {cache_file}: {e}')
+        return None
+
+    return cached
+
+def _save_metadata_cache(cached):
+    """
+    Save ``(key, datasets, neurotic_config)`` to the cache.
+    """
+
+    cache_file = _metadata_cache_file(cached[0])
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = cache_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        logger.debug(f'Unable to write metadata cache {cache_file}: {e}')
+
 
 def _defaults_for_key(key):
     """
@@ -382,6 +668,14 @@ def _defaults_for_key(key):
         # list of labels for epoch encoder
         'epoch_encoder_possible_labels': [],
 
+        # save only changes to a journal next to the epoch encoder file, which
+        # is compacted into the file in the background
+        'epoch_encoder_journal': False,
+
+        # save epoch encoder changes automatically in the background after this
+        # many seconds without further edits
+        'epoch_encoder_autosave': None,
+
         # list of dicts giving name, channel, units, amplitude window, epoch window, color for each unit
         # - e.g. [{'name': 'Unit X', 'channel': 'Channel A', 'units': 'uV', 'amplitude': [75, 150], 'epoch': 'Type 1', 'color': '#ff0000'}, ...]
         'amplitude_discriminators': None,
@@ -419,6 +713,11 @@ def _defaults_for_key(key):
         # - path relative to data_dir and remote_data_dir
         'video_file': None,
 
+        # a manifest of the sizes and checksums of the other files, written
+        # with "neurotic --write-manifests"
+        # - path relative to data_dir and remote_data_dir
+        'manifest_file': None,
+
         # the video time offset in seconds
         'video_offset': None,
 
@@ -504,6 +803,11 @@ def _download_file(metadata, file, **kwargs):
     """
     Download a file.
 
+    If ``metadata`` has a ``manifest_file``, a local copy of the file is
+    replaced if its size does not match the manifest, and a downloaded file
+    is checked against the manifest. A downloaded file that does not match is
+    deleted and a ValueError is raised.
+
     See :func:`neurotic.datasets.download.download` for possible keyword
     arguments.
     """
@@ -515,52 +819,248 @@ def _download_file(metadata, file, **kwargs):
     if metadata.get(file, None):
 
         # create directories if necessary
-        if not os.path.exists(os.path.dirname(_abs_path(metadata, file))):
-            os.makedirs(os.path.dirname(_abs_path(metadata, file)))
+        os.makedirs(os.path.dirname(_abs_path(metadata, file)), exist_ok=True)
+
+        manifest = None
+        if file != 'manifest_file' and metadata.get('manifest_file', None):
+            manifest = _read_manifest_for_download(metadata, **kwargs)
+
+        if manifest is not None and os.path.exists(_abs_path(metadata, file)):
+            result = verify_files(manifest, metadata['data_dir'], [metadata[file]], check_hashes=False)[metadata[file]]
+            if result == 'wrong size':
+                logger.warning(f'Replacing {metadata[file]} (size does not match manifest)')
+                kwargs = dict(kwargs, overwrite_existing=True)
 
         # download the file only if it does not already exist
-        download(_abs_url(metadata, file), _abs_path(metadata, file), **kwargs)
+        existed = os.path.exists(_abs_path(metadata, file))
+        if file == 'manifest_file':
+            with _manifest_download_lock:
+                download(_abs_url(metadata, file), _abs_path(metadata, file), **kwargs)
+        else:
+            download(_abs_url(metadata, file), _abs_path(metadata, file), **kwargs)
 
+        # check a new copy against the manifest
+        if manifest is not None and (not existed or kwargs.get('overwrite_existing', False)):
+            result = verify_files(manifest, metadata['data_dir'], [metadata[file]])[metadata[file]]
+            if result in ['wrong size', 'wrong checksum']:
+                # a bad copy with the right size would otherwise be kept as
+                # complete by later downloads
+                os.remove(_abs_path(metadata, file))
+                raise ValueError(f'Downloaded {metadata[file]} does not match manifest ({result})')
+
+        # the directory listing may now be out of date
+        _forget_directory_listing(os.path.dirname(_abs_path(metadata, file)))
+
+_manifest_download_lock = threading.RLock()
+
+def _read_manifest_for_download(metadata, **kwargs):
+    """
+    Return the contents of the manifest file, downloading it first if there
+    is no local copy, or None if it cannot be read.
+    """
+
+    # files downloaded concurrently may share a manifest, which should be
+    # downloaded only once
+    with _manifest_download_lock:
+        if not os.path.exists(_abs_path(metadata, 'manifest_file')):
+            try:
+                _download_file(metadata, 'manifest_file', **kwargs)
+            except Exception as e:
+                logger.warning(f'Unable to download manifest: {e}')
+                return None
+
+    try:
+        return read_manifest(_abs_path(metadata, 'manifest_file'))
+    except (OSError, ValueError) as e:
+        logger.warning(f'Ignoring manifest: {e}')
+        return None
 
 def _download_all_data_files(metadata, **kwargs):
     """
     Download all files associated with metadata.
 
-    See :func:`neurotic.datasets.download.download` for possible keyword
-    arguments.
+    See :func:`_download_datasets` for possible keyword arguments.
     """
 
     if not _is_url(metadata.get('remote_data_dir', None)):
         logger.error('metadata[remote_data_dir] is not a full URL')
         return
 
-    for file in [k for k in metadata if k.endswith('_file')]:
-        _download_file(metadata, file, **kwargs)
+    _download_datasets([metadata], **kwargs)
+
+def _download_datasets(datasets, max_workers=None, max_connections_per_host=None, **kwargs):
+    """
+    Download all files associated with each metadata set in ``datasets``,
+    several at a time.
+
+    ``max_workers`` and ``max_connections_per_host`` are passed to
+    :class:`neurotic.datasets.download.DownloadManager`. See
+    :func:`neurotic.datasets.download.download` for other possible keyword
+    arguments.
+    """
+
+    show_progress = kwargs.get('show_progress', True)
+    with DownloadManager(max_workers, max_connections_per_host, show_progress) as manager:
+        started = set()
+        for metadata in datasets:
+            if not _is_url(metadata.get('remote_data_dir', None)):
+                logger.error('metadata[remote_data_dir] is not a full URL for "{}"'.format(metadata.get('key', None)))
+                continue
+
+            for file in [k for k in metadata if k.endswith('_file')]:
+                # datasets may share files, which should be downloaded once
+                path = _abs_path(metadata, file)
+                if path is None or path in started:
+                    continue
+                started.add(path)
+                manager.submit(_abs_url(metadata, file), _download_file, metadata, file, **kwargs)
+
+        manager.wait()
     logger.info('Downloads complete')
 
+def _manifest_files(metadata):
+    """
+    Return the relative paths of the files that belong in the manifest.
+    """
+
+    return [metadata[k] for k in metadata if k.endswith('_file') and k != 'manifest_file' and metadata[k] is not None]
+
+def _write_manifest(metadata, **kwargs):
+    """
+    Write the manifest file from the local files.
 
-def _selector_labels(all_metadata):
+    See :func:`neurotic.datasets.manifest.write_manifest` for possible keyword
+    arguments.
     """
 
+    if not metadata.get('manifest_file', None):
+        raise ValueError('"manifest_file" missing for "{}"'.format(metadata.get('key', None)))
+
+    return write_manifest(_abs_path(metadata, 'manifest_file'), metadata['data_dir'], _manifest_files(metadata), **kwargs)
+
+def _verify_local_files(metadata, **kwargs):
     """
+    Check the local files against the manifest file.
 
-    # indicate presence of local data files with symbols
-    has_local_data = {}
-    for key, metadata in all_metadata.items():
+    See :func:`neurotic.datasets.manifest.verify_files` for possible keyword
+    arguments.
+    """
+
+    if not metadata.get('manifest_file', None):
+        raise ValueError('"manifest_file" missing for "{}"'.format(metadata.get('key', None)))
+
+    manifest = read_manifest(_abs_path(metadata, 'manifest_file'))
+    return verify_files(manifest, metadata['data_dir'], _manifest_files(metadata), **kwargs)
+
+
+# how long listings of data directories are reused when checking for local
+# files, in seconds
+_directory_listing_ttl = 10
+
+# the names of the entries in each data directory, keyed on the directory,
+# with values (time listed, set of names)
+_directory_listings = {}
+_directory_listings_lock = threading.Lock()
+
+def _list_directory(directory, cached_only=False):
+    """
+    Return the set of names of the entries in ``directory``, normalized for
+    case where the file system ignores it, using a single scan of the
+    directory. A recent listing is reused if available. If ``cached_only`` is
+    True and no recent listing is available, return None instead of scanning.
+    """
+
+    with _directory_listings_lock:
+        listed, names = _directory_listings.get(directory, (None, None))
+    if listed is not None and time.monotonic() - listed < _directory_listing_ttl:
+        return names
+    if cached_only:
+        return None
+
+    listed = time.monotonic()
+    try:
+        with os.scandir(directory) as entries:
+            names = {os.path.normcase(entry.name) for entry in entries}
+    except OSError:
+        # the directory does not exist or cannot be read
+        names = set()
+
+    with _directory_listings_lock:
+        _directory_listings[directory] = (listed, names)
+    return names
+
+def _forget_directory_listing(directory):
+    """
+    Discard the listing of ``directory`` so that it will be scanned again.
+    """
+
+    with _directory_listings_lock:
+        _directory_listings.pop(directory, None)
+
+def _local_data_markers(all_metadata, cached_only=False, keys=None, max_workers=8):
+    """
+    Return a dictionary mapping the keys in ``all_metadata``, or only those in
+    ``keys`` if given, to symbols indicating whether all (◆), some (⬖), or
+    none (◇) of their files exist locally.
+
+    Each data directory is listed only once, and directories are listed
+    concurrently, since each listing may take a long time on network shares.
+    If ``cached_only`` is True, only recent listings are used, and keys for
+    which these are not available are omitted.
+    """
+
+    if cached_only and not _directory_listings:
+        # avoid resolving every data set when nothing is cached
+        return {}
+
+    if keys is None:
+        keys = all_metadata.keys()
+
+    files = {}
+    for key in keys:
+        metadata = all_metadata[key]
         filenames = [k for k in metadata if k.endswith('_file') and metadata[k] is not None]
-        files_exist = [os.path.exists(_abs_path(metadata, file)) for file in filenames]
+        files[key] = [os.path.split(_abs_path(metadata, file)) for file in filenames]
+
+    directories = {directory for paths in files.values() for directory, _ in paths}
+    if cached_only or len(directories) <= 1:
+        listings = {directory: _list_directory(directory, cached_only) for directory in directories}
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            listings = dict(zip(directories, executor.map(_list_directory, directories)))
+
+    markers = {}
+    for key, paths in files.items():
+        if any(listings[directory] is None for directory, _ in paths):
+            continue
+        files_exist = [os.path.normcase(name) in listings[directory] for directory, name in paths]
         if all(files_exist):
-            has_local_data[key] = '◆'
+            markers[key] = '◆'
         elif any(files_exist):
-            has_local_data[key] = '⬖'
+            markers[key] = '⬖'
         else:
-            has_local_data[key] = '◇'
+            markers[key] = '◇'
+
+    return markers
+
+def _selector_labels(all_metadata, local_data_markers=None):
+    """
+    Return display text for each dataset in ``all_metadata``, beginning with
+    symbols for the presence of local files, which are checked using
+    :func:`_local_data_markers` unless given in ``local_data_markers`` (keys
+    missing from it are left unmarked).
+    """
+
+    # indicate presence of local data files with symbols
+    if local_data_markers is None:
+        local_data_markers = _local_data_markers(all_metadata)
+    has_local_data = {key: local_data_markers.get(key, ' ') for key in all_metadata}
 
     # indicate lack of video_offset with an exclamation point unless there is
     # no video_file
     has_video_offset = {}
-    for key, metadata in all_metadata.items():
-        if metadata.get('video_offset', None) is None and metadata.get('video_file', None) is not None:
+    for key in all_metadata:
+        if _peek(all_metadata, key, 'video_offset') is None and _peek(all_metadata, key, 'video_file') is not None:
             has_video_offset[key] = '!'
         else:
             has_video_offset[key] = ' '
@@ -572,9 +1072,19 @@ def _selector_labels(all_metadata):
         has_video_offset[k] +
         ' ' +
         k.ljust(longest_key_length + 4) +
-        str(all_metadata[k]['description']
-            if all_metadata[k]['description'] else '')
+        str(_peek(all_metadata, k, 'description')
+            if _peek(all_metadata, k, 'description') else '')
 
         for k in all_metadata.keys()]
 
     return labels
+
+def _peek(all_metadata, key, name):
+    """
+    Return the value of ``name`` for a data set in ``all_metadata`` without
+    resolving the data set if it has not been resolved yet.
+    """
+
+    if isinstance(all_metadata, _LazyMetadata):
+        return all_metadata.peek(key, name)
+    return all_metadata[key].get(name, None)
@@ -16,7 +16,8 @@ import neo
 import ephyviewer
 
 from ..datasets.metadata import _abs_path
-from ..gui.epochencoder import NeuroticWritableEpochSource
+from .. import _elephant_tools
+from ..gui.epochencoder import NeuroticWritableEpochSource, NeuroticEpochEncoder
 
 import logging
 logger = logging.getLogger(__name__)
@@ -479,15 +480,31 @@ class EphyviewerConfigurator():
 
             if rauc_sigs:
 
-                sig_rauc_source = ephyviewer.InMemoryAnalogSignalSource(
-                    signals = np.concatenate([rauc_sigs[p['index']].as_array() for p in self.metadata['plots']], axis = 1),
-                    sample_rate = rauc_sigs[0].sampling_rate.rescale('Hz'), # assuming all AnalogSignals have the same sampling rate
-                    t_start = rauc_sigs[0].t_start.rescale('s'),            # assuming all AnalogSignals start at the same time
-                    channel_names = [p['ylabel'] + ' RAUC' for p in self.metadata['plots']],
-                )
-                sources['signal_rauc'] = [sig_rauc_source]
+                rauc_integrals = [sig.annotations['rauc_integral'] for sig in sigs if 'rauc_integral' in sig.annotations]
+
+                if len(rauc_integrals) == len(rauc_sigs):
+                    # the bin duration can be changed interactively
+                    sig_rauc_source = _RAUCSource(
+                        rauc_integrals = [rauc_integrals[p['index']] for p in self.metadata['plots']],
+                        bin_duration = rauc_sigs[0].sampling_period.rescale('s').magnitude, # assuming all AnalogSignals have the same sampling rate
+                        channel_names = [p['ylabel'] + ' RAUC' for p in self.metadata['plots']],
+                    )
+                    sources['signal_rauc'] = [sig_rauc_source]
+
+                    trace_rauc_view = _RAUCTraceViewer(source = sources['signal_rauc'][0], name = 'Integrated signals (RAUC)')
+                    trace_rauc_view.params.param('bin_duration').setLimits(sig_rauc_source.bin_duration_limits)
+                    trace_rauc_view.params['bin_duration'] = sig_rauc_source.bin_duration
+
+                else:
+                    sig_rauc_source = ephyviewer.InMemoryAnalogSignalSource(
+                        signals = np.concatenate([rauc_sigs[p['index']].as_array() for p in self.metadata['plots']], axis = 1),
+                        sample_rate = rauc_sigs[0].sampling_rate.rescale('Hz'), # assuming all AnalogSignals have the same sampling rate
+                        t_start = rauc_sigs[0].t_start.rescale('s'),            # assuming all AnalogSignals start at the same time
+                        channel_names = [p['ylabel'] + ' RAUC' for p in self.metadata['plots']],
+                    )
+                    sources['signal_rauc'] = [sig_rauc_source]
 
-                trace_rauc_view = ephyviewer.TraceViewer(source = sources['signal_rauc'][0], name = 'Integrated signals (RAUC)')
+                    trace_rauc_view = ephyviewer.TraceViewer(source = sources['signal_rauc'][0], name = 'Integrated signals (RAUC)')
 
                 if 'Signals' in win.viewers:
                     win.add_view(trace_rauc_view, tabify_with = 'Signals')
@@ -693,9 +710,11 @@ class EphyviewerConfigurator():
             writable_epoch_source = NeuroticWritableEpochSource(
                 filename = _abs_path(self.metadata, 'epoch_encoder_file'),
                 possible_labels = possible_labels,
+                journal = self.metadata.get('epoch_encoder_journal', False),
+                autosave = self.metadata.get('epoch_encoder_autosave', None),
             )
 
-            epoch_encoder = ephyviewer.EpochEncoder(source = writable_epoch_source, name = 'Epoch encoder')
+            epoch_encoder = NeuroticEpochEncoder(source = writable_epoch_source, name = 'Epoch encoder')
             epoch_encoder.params['exclusive_mode'] = False
             win.add_view(epoch_encoder)
 
@@ -772,8 +791,12 @@ class EphyviewerConfigurator():
         ########################################################################
         # DATAFRAME
 
-        annotations_dataframe = _neo_epoch_to_dataframe(seg.epochs, exclude_epoch_encoder_epochs=True)
-        if self.is_shown('data_frame') and len(annotations_dataframe) > 0:
+        if self.is_shown('data_frame'):
+            annotations_dataframe = _neo_epoch_to_dataframe(seg.epochs, exclude_epoch_encoder_epochs=True)
+        else:
+            annotations_dataframe = None
+
+        if annotations_dataframe is not None and len(annotations_dataframe) > 0:
 
             data_frame_view = ephyviewer.DataFrameView(source = annotations_dataframe, name = 'Table')
             if 'Events' in win.viewers:
@@ -858,23 +881,38 @@ def _default_ylim(sig):
 
 def _neo_epoch_to_dataframe(neo_epochs, exclude_epoch_encoder_epochs=False):
     """
-    Convert a list of Neo Epochs into a dataframe.
+    Convert a list of Neo Epochs into a dataframe with categorical Type and
+    Label columns, sorted by start time, end time, type, and label.
     """
 
-    dtypes = {
-        'Start (s)':    float,
-        'End (s)':      float,
-        'Duration (s)': float,
-        'Type':         str,
-        'Label':        str,
-    }
-    columns = list(dtypes.keys())
-    df = pd.DataFrame(columns=columns)
-    for ep in neo_epochs:
-        if len(ep.times) > 0 and (not exclude_epoch_encoder_epochs or '(from epoch encoder file)' not in ep.labels):
-            data = np.array([ep.times, ep.times+ep.durations, ep.durations, [ep.name]*len(ep), ep.labels]).T
-            df = pd.concat([df, pd.DataFrame(data, columns=columns)], ignore_index=True)
-    return df.astype(dtype=dtypes).sort_values(['Start (s)', 'End (s)', 'Type', 'Label']).reset_index(drop=True)
+    epochs = [ep for ep in neo_epochs if len(ep.times) > 0 and (not exclude_epoch_encoder_epochs or '(from epoch encoder file)' not in ep.labels)]
+
+    if epochs:
+        starts = np.concatenate([ep.times.rescale('s').magnitude for ep in epochs]).astype(float)
+        durations = np.concatenate([ep.durations.rescale('s').magnitude for ep in epochs]).astype(float)
+        labels = np.concatenate([ep.labels.astype(str) for ep in epochs])
+
+        # category codes sort in the same order as the type names
+        types = sorted({str(ep.name) for ep in epochs})
+        type_codes = np.repeat([types.index(str(ep.name)) for ep in epochs], [len(ep) for ep in epochs])
+    else:
+        starts = durations = np.array([], dtype=float)
+        labels = np.array([], dtype=str)
+        types = []
+        type_codes = np.array([], dtype=int)
+
+    types = pd.Categorical.from_codes(type_codes, categories=types)
+    labels = pd.Categorical(labels)
+    stops = starts + durations
+    order = np.lexsort((labels.codes, type_codes, stops, starts))
+
+    return pd.DataFrame({
+        'Start (s)':    starts[order],
+        'End (s)':      stops[order],
+        'Duration (s)': durations[order],
+        'Type':         types[order],
+        'Label':        labels[order],
+    })
 
 def _estimate_video_jump_times(blk):
     """
@@ -918,3 +956,96 @@ def _estimate_video_jump_times(blk):
             video_jumps.append([t, dur])
 
         return video_jumps
+
+class _RAUCSource(ephyviewer.InMemoryAnalogSignalSource):
+    """
+    An ephyviewer signal source for RAUC time series that can change bin
+    duration without revisiting the original signals.
+
+    RAUCs are found from the cumulative integrals of the rectified signals
+    (see :func:`neurotic._elephant_tools.cumulative_rauc`), so switching bin
+    duration takes time proportional to the number of bins. Bin durations are
+    rounded to multiples of the base bin duration of the integrals. Recently
+    used bin durations are cached.
+    """
+
+    max_cached_bin_durations = 8
+
+    def __init__(self, rauc_integrals, bin_duration, channel_names=None):
+        """
+        Initialize a new _RAUCSource.
+        """
+
+        self.rauc_integrals = rauc_integrals
+        self.base_bin_duration = float(rauc_integrals[0].sampling_period.rescale('s').magnitude) # assuming all AnalogSignals have the same sampling rate
+        self._binned = {}
+
+        signals, sample_rate, t_start = self._compute(bin_duration)
+        ephyviewer.InMemoryAnalogSignalSource.__init__(self, signals, sample_rate, t_start, channel_names=channel_names)
+
+    @property
+    def bin_duration(self):
+        """
+        The current bin duration in seconds.
+        """
+        return 1 / self.sample_rate
+
+    @property
+    def bin_duration_limits(self):
+        """
+        The smallest and largest allowed bin durations in seconds.
+        """
+        n_bins = min(len(integral) for integral in self.rauc_integrals)
+        return (self.base_bin_duration, max(n_bins, 1) * self.base_bin_duration)
+
+    def set_bin_duration(self, bin_duration):
+        """
+        Change the bin duration, given in seconds.
+        """
+        self.signals, self.sample_rate, self._t_start = self._compute(bin_duration)
+        self._t_stop = self.signals.shape[0]/self.sample_rate + self._t_start
+
+    def _compute(self, bin_duration):
+        base_bins_per_bin = max(int(np.round(bin_duration / self.base_bin_duration)), 1)
+        if base_bins_per_bin not in self._binned:
+            if len(self._binned) >= self.max_cached_bin_durations:
+                # forget the oldest bin duration
+                self._binned.pop(next(iter(self._binned)))
+            bin_duration = base_bins_per_bin * self.base_bin_duration
+            signals = np.concatenate([
+                np.reshape(_elephant_tools.rauc_from_cumulative(integral, bin_duration * pq.s).magnitude, (-1, integral.shape[1]))
+                for integral in self.rauc_integrals], axis = 1)
+            t_start = float(self.rauc_integrals[0].t_start.rescale('s').magnitude) + bin_duration/2 # assuming all AnalogSignals start at the same time
+            self._binned[base_bins_per_bin] = (signals, 1/bin_duration, t_start)
+        return self._binned[base_bins_per_bin]
+
+class _RAUCTraceViewer(ephyviewer.TraceViewer):
+    """
+    An ephyviewer trace viewer for a :class:`_RAUCSource` with a
+    ``bin_duration`` parameter for switching the resolution of the RAUC time
+    series.
+    """
+
+    _default_params = ephyviewer.TraceViewer._default_params + [
+        {'name': 'bin_duration', 'type': 'float', 'value': 0.1, 'suffix': 's', 'siPrefix': True, 'dec': True, 'step': 0.5, 'minStep': 1e-6},
+    ]
+
+    def on_param_change(self, params=None, changes=None):
+        for param, change, data in changes:
+            if change == 'value' and param.name() == 'bin_duration':
+                old_bin_duration = self.source.bin_duration
+                self.source.set_bin_duration(self.params['bin_duration'])
+
+                # RAUCs grow in proportion to bin duration, so rescale gains
+                # to keep traces the same apparent size
+                ratio = old_bin_duration / self.source.bin_duration
+                self.all_params.blockSignals(True)
+                for i in range(self.source.nb_channel):
+                    self.by_channel_params['ch{}'.format(i), 'gain'] *= ratio
+                self.all_params.blockSignals(False)
+
+                # force median and MAD to be estimated again for the new data
+                if hasattr(self.params_controller, 'signals_med'):
+                    del self.params_controller.signals_med
+
+        ephyviewer.TraceViewer.on_param_change(self, params, changes)
@@ -1,16 +1,25 @@
 # -*- coding: utf-8 -*-
 """
 The :mod:`neurotic.gui.epochencoder` module implements a subclass of
-:class:`ephyviewer.datasource.epochs.WritableEpochSource`.
+:class:`ephyviewer.datasource.epochs.WritableEpochSource` and a subclass of
+:class:`ephyviewer.EpochEncoder` that can save automatically.
 
 .. autoclass:: NeuroticWritableEpochSource
+
+.. autoclass:: NeuroticEpochEncoder
 """
 
 import os
 import shutil
+import threading
+import collections
+import concurrent.futures
 import numpy as np
 import pandas as pd
-from ephyviewer import WritableEpochSource
+from ephyviewer import WritableEpochSource, EpochEncoder
+from ephyviewer.myqt import QT
+
+from ..datasets.data import _epoch_encoder_journal_file, _read_epoch_encoder_journal, _append_epoch_encoder_journal
 
 import logging
 logger = logging.getLogger(__name__)
@@ -20,15 +29,44 @@ class NeuroticWritableEpochSource(WritableEpochSource):
     """
     A subclass of :class:`ephyviewer.datasource.epochs.WritableEpochSource` for
     custom CSV column formatting and automatic file backup.
+
+    If ``journal=True``, :meth:`save` appends only the epochs that changed
+    since the last save to a journal file next to the CSV file, rather than
+    rewriting the CSV file. The journal is compacted into the CSV file by a
+    background thread ``compact_interval`` seconds after a save, or when
+    :meth:`compact` is called. :meth:`load` replays any journal entries that
+    have not been compacted yet, regardless of ``journal``.
+
+    If ``autosave`` is a number of seconds, :class:`NeuroticEpochEncoder`
+    saves changes automatically once no edits have been made for that long,
+    using :meth:`save_in_background`.
     """
 
-    def __init__(self, filename, possible_labels, color_labels=None, channel_name='', backup=True):
+    def __init__(self, filename, possible_labels, color_labels=None, channel_name='', backup=True, journal=False, compact_interval=60, autosave=None):
         """
         Initialize a new NeuroticWritableEpochSource.
         """
 
         self.filename = filename
         self.backup = backup
+        self.journal = journal
+        self.compact_interval = compact_interval
+        self.autosave = autosave
+
+        # epochs currently stored in the file and journal
+        self._saved_epochs = collections.Counter()
+        self._journal_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_timer = None
+
+        # snapshots are numbered so that a background save never overwrites a
+        # newer save that finished first
+        self._save_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_snapshot = None
+        self._snapshot_count = 0
+        self._saved_snapshot = 0
+        self._save_executor = None
 
         WritableEpochSource.__init__(self, epoch=None, possible_labels=possible_labels, color_labels=color_labels, channel_name=channel_name)
 
@@ -38,7 +76,8 @@ class NeuroticWritableEpochSource(WritableEpochSource):
 
         Data is loaded from the CSV file if it exists; otherwise the superclass
         implementation in WritableEpochSource.load() is called to create an
-        empty dictionary with the correct keys and types.
+        empty dictionary with the correct keys and types. Changes recorded in
+        the journal but not yet compacted into the CSV file are applied.
 
         The method returns a dictionary containing the loaded data in this form:
 
@@ -60,12 +99,171 @@ class NeuroticWritableEpochSource(WritableEpochSource):
             # an empty dictionary
             epoch = super().load()
 
+        journal = _read_epoch_encoder_journal(self.filename)
+        if journal:
+            counts = _count_epochs(epoch['time'], epoch['time'] + epoch['duration'], epoch['label'])
+            for key, count in journal.items():
+                counts[key] = count
+            times, stops, labels = _epochs_from_counts(counts)
+            epoch = {'time':     times,
+                     'duration': stops - times,
+                     'label':    labels,
+                     'name':     self.channel_name}
+
+        self._saved_epochs = _count_epochs(epoch['time'], epoch['time'] + epoch['duration'], epoch['label'])
+
         return epoch
 
     def save(self):
         """
         Save the epoch data to a CSV file, creating a backup first if the file
         already exists.
+
+        If ``journal=True``, only changes are saved, to the journal.
+        """
+
+        self._save_snapshot(self._snapshot())
+
+    def save_in_background(self, callback=None):
+        """
+        Save a copy of the current epoch data like :meth:`save`, but on a
+        worker thread, so that the caller never waits for the disk. If several
+        background saves are requested before the worker gets to them, only
+        the most recent copy is written.
+
+        If given, ``callback`` is called on the worker thread once the request
+        is handled, with True if the copy or a newer one was saved, or False
+        if saving failed.
+        """
+
+        snapshot = self._snapshot()
+        with self._pending_lock:
+            self._pending_snapshot = snapshot
+
+        if self._save_executor is None:
+            self._save_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='EpochEncoderSave')
+        future = self._save_executor.submit(self._save_pending_snapshot)
+
+        if callback is not None:
+            number = snapshot[0]
+            future.add_done_callback(lambda future: callback(number <= self._saved_snapshot))
+
+    def wait_for_background_saves(self):
+        """
+        Block until all saves started by :meth:`save_in_background` are
+        finished.
+        """
+
+        if self._save_executor is not None:
+            self._save_executor.shutdown(wait=True)
+            self._save_executor = None
+
+    def _snapshot(self):
+        """
+        Return a numbered copy of the epoch data. Called only from the thread
+        that edits the epochs.
+        """
+
+        self._snapshot_count += 1
+        return (self._snapshot_count, self.ep_times.copy(), self.ep_times + self.ep_durations, self.ep_labels.copy())
+
+    def _save_pending_snapshot(self):
+        with self._pending_lock:
+            snapshot, self._pending_snapshot = self._pending_snapshot, None
+        if snapshot is None:
+            # a later request already saved it
+            return
+        try:
+            self._save_snapshot(snapshot)
+        except Exception:
+            logger.exception(f'Failed to save epoch encoder file {self.filename}')
+
+    def _save_snapshot(self, snapshot):
+        number, times, stops, labels = snapshot
+
+        with self._save_lock:
+            if number <= self._saved_snapshot:
+                return
+
+            if self.journal:
+                self._save_to_journal(times, stops, labels)
+            else:
+                with self._compact_lock, self._journal_lock:
+                    self._write_file(times, stops, labels)
+
+                    # the file now contains all changes
+                    self._remove_journal()
+                    self._saved_epochs = _count_epochs(times, stops, labels)
+
+            self._saved_snapshot = number
+
+    def compact(self):
+        """
+        Rewrite the CSV file to include all changes in the journal, and then
+        remove those changes from the journal.
+        """
+
+        journal_file = _epoch_encoder_journal_file(self.filename)
+
+        with self._compact_lock:
+
+            # take a snapshot of the saved epochs, which saves may continue to
+            # change while the file is written
+            with self._journal_lock:
+                if not os.path.exists(journal_file):
+                    return
+                journal_size = os.path.getsize(journal_file)
+                times, stops, labels = _epochs_from_counts(self._saved_epochs)
+
+            # replaying the journal onto the rewritten file is harmless, so a
+            # crash before the journal is truncated below loses nothing
+            self._write_file(times, stops, labels)
+
+            # keep only entries appended after the snapshot
+            with self._journal_lock:
+                with open(journal_file, 'rb') as f:
+                    header = f.readline()
+                    f.seek(journal_size)
+                    tail = f.read()
+                if tail:
+                    with open(journal_file + '.tmp', 'wb') as f:
+                        f.write(header + tail)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(journal_file + '.tmp', journal_file)
+                else:
+                    self._remove_journal()
+
+    def _save_to_journal(self, times, stops, labels):
+        """
+        Append changes since the last save to the journal and schedule
+        compaction.
+        """
+
+        epochs = _count_epochs(times, stops, labels)
+
+        with self._journal_lock:
+            changes = {key: epochs[key] for key in self._saved_epochs.keys() | epochs.keys() if epochs[key] != self._saved_epochs[key]}
+            if changes:
+                _append_epoch_encoder_journal(self.filename, changes)
+            self._saved_epochs = epochs
+
+        if changes and (self._compact_timer is None or not self._compact_timer.is_alive()):
+            self._compact_timer = threading.Timer(self.compact_interval, self._compact_in_background)
+            self._compact_timer.daemon = True
+            self._compact_timer.start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception:
+            logger.exception(f'Failed to compact epoch encoder journal for {self.filename}')
+
+    def _write_file(self, times, stops, labels):
+        """
+        Write epochs to the CSV file, creating a backup first if the file
+        already exists. The file is replaced atomically, so it is never left
+        partially written.
         """
 
         # if file already exists, make a backup copy first
@@ -76,8 +274,140 @@ class NeuroticWritableEpochSource(WritableEpochSource):
             shutil.copy2(self.filename, backup_filename)
 
         df = pd.DataFrame()
-        df['Start (s)'] = np.round(self.ep_times, 6)                   # round to nearest microsecond
-        df['End (s)'] = np.round(self.ep_times + self.ep_durations, 6) # round to nearest microsecond
-        df['Type'] = self.ep_labels
+        df['Start (s)'] = np.round(times, 6) # round to nearest microsecond
+        df['End (s)'] = np.round(stops, 6)   # round to nearest microsecond
+        df['Type'] = labels
         df.sort_values(['Start (s)', 'End (s)', 'Type'], inplace=True)
-        df.to_csv(self.filename, index=False)
+        with open(self.filename + '.tmp', 'w', newline='') as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.filename + '.tmp', self.filename)
+
+    def _remove_journal(self):
+        journal_file = _epoch_encoder_journal_file(self.filename)
+        if os.path.exists(journal_file):
+            os.remove(journal_file)
+
+
+class NeuroticEpochEncoder(EpochEncoder):
+    """
+    A subclass of :class:`ephyviewer.EpochEncoder` that saves automatically if
+    the ``autosave`` parameter of its :class:`NeuroticWritableEpochSource` is
+    set.
+
+    Every edit, undo, or redo restarts a timer, and the epochs are saved on a
+    worker thread once ``autosave`` seconds pass without further changes.
+    Changes count as saved only once the save succeeds. Pending changes are
+    saved before the viewer closes.
+    """
+
+    # emitted on the worker thread when an automatic save is handled
+    autosave_finished = QT.pyqtSignal()
+
+    def __init__(self, **kargs):
+        """
+        Initialize a new NeuroticEpochEncoder.
+        """
+
+        # refresh_toolbar is called during initialization, before the timer
+        # exists and before any edits are made
+        self._autosave_timer = None
+
+        # every save is numbered, so that only the result of the most recent
+        # one changes whether there are unsaved changes
+        self._save_count = 0
+        self._autosave_request = None
+        self._autosave_result = None
+
+        EpochEncoder.__init__(self, **kargs)
+
+        if self.source.autosave is not None:
+            self._autosave_timer = QT.QTimer(self)
+            self._autosave_timer.setSingleShot(True)
+            self._autosave_timer.setInterval(int(self.source.autosave * 1000))
+            self._autosave_timer.timeout.connect(self.on_autosave)
+            self.autosave_finished.connect(self._apply_autosave_result)
+
+    def refresh_toolbar(self):
+        EpochEncoder.refresh_toolbar(self)
+
+        # called after every change, so restarting the timer here coalesces
+        # bursts of edits into one save
+        if self._autosave_timer is not None and self.changes_since_save != 0:
+            self._autosave_timer.start()
+
+    def on_autosave(self):
+        # remember the saved state by its place in the history, like
+        # changes_since_save does
+        self._save_count += 1
+        number = self._save_count
+        self._autosave_request = (number, self.history_position, self.history[self.history_position])
+        self.source.save_in_background(callback=lambda saved: self._on_autosave_finished(number, saved))
+
+    def _on_autosave_finished(self, number, saved):
+        # called on the worker thread
+        self._autosave_result = (number, saved)
+        self.autosave_finished.emit()
+
+    def _apply_autosave_result(self):
+        if self._autosave_request is None or self._autosave_result is None:
+            return
+        number, position, state = self._autosave_request
+        result_number, saved = self._autosave_result
+        if result_number != number:
+            # a newer save is pending or already finished
+            return
+        self._autosave_request = None
+
+        if not saved:
+            # the failure was logged, and the changes remain unsaved
+            return
+
+        if position < len(self.history) and self.history[position] is state:
+            # edits made while saving remain unsaved
+            self.changes_since_save = self.history_position - position
+        else:
+            # the saved state was removed from history and so is unreachable
+            self.changes_since_save = None
+        EpochEncoder.refresh_toolbar(self)
+
+    def on_save(self):
+        if self._autosave_timer is not None:
+            self._autosave_timer.stop()
+        self._save_count += 1
+        self._autosave_request = None
+        EpochEncoder.on_save(self)
+
+    def closeEvent(self, event):
+        if self._autosave_timer is not None and self._autosave_timer.isActive():
+            self._autosave_timer.stop()
+            self.on_autosave()
+        self.source.wait_for_background_saves()
+        self._apply_autosave_result()
+        EpochEncoder.closeEvent(self, event)
+
+
+def _count_epochs(times, stops, labels):
+    """
+    Return a Counter of ``(start, end, type)`` for epochs, rounding times to
+    the nearest microsecond as they are written to the CSV file.
+    """
+
+    return collections.Counter(zip(
+        np.round(np.asarray(times, dtype=float), 6).tolist(),
+        np.round(np.asarray(stops, dtype=float), 6).tolist(),
+        [str(label) for label in labels],
+    ))
+
+def _epochs_from_counts(counts):
+    """
+    Return arrays of start times, end times, and labels, sorted by start time,
+    for a Counter returned by :func:`_count_epochs`.
+    """
+
+    keys = sorted(counts.elements())
+    times = np.array([key[0] for key in keys], dtype=float)
+    stops = np.array([key[1] for key in keys], dtype=float)
+    labels = np.array([key[2] for key in keys], dtype='U')
+    return times, stops, labels
@@ -14,7 +14,10 @@ import subprocess
 import pkg_resources
 import warnings
 from packaging import version
+import re
+import bisect
 import pprint
+import concurrent.futures
 
 import quantities as pq
 import neo
@@ -22,7 +25,7 @@ from ephyviewer import QT, QT_MODE
 
 from .. import __version__, _elephant_tools, global_config, global_config_file, default_log_level, log_file, gdrive_downloader
 from ..datasets import MetadataSelector, load_dataset
-from ..datasets.metadata import _selector_labels
+from ..datasets.metadata import _selector_labels, _local_data_markers, _peek, _changed_datasets
 from ..gui.config import EphyviewerConfigurator, available_themes, available_ui_scales
 
 import logging
@@ -181,7 +184,7 @@ class MainWindow(QT.QMainWindow):
         # select a dataset if the user provided one
         if initial_selection:
             try:
-                self.metadata_selector.dataset_list.setCurrentRow(list(self.metadata_selector.all_metadata).index(initial_selection))
+                self.metadata_selector.set_current_key(initial_selection)
             except (TypeError, ValueError) as e:
                 logger.error(f'Bad dataset key, will ignore: {e}')
                 self.statusBar().showMessage('ERROR: Bad dataset key, will '
@@ -196,6 +199,13 @@ class MainWindow(QT.QMainWindow):
         if global_config['app']['auto_check_for_updates']:
             self.check_for_updates(show_new_only=True)
 
+    def closeEvent(self, event):
+        """
+        Executed when the window is closed.
+        """
+        self.metadata_selector.stop_local_data_checks()
+        QT.QMainWindow.closeEvent(self, event)
+
     def create_menus(self):
         """
         Construct the menus of the app.
@@ -786,10 +796,21 @@ class MainWindow(QT.QMainWindow):
 class _MetadataSelectorQt(MetadataSelector, QT.QWidget):
     """
     A QWidget that displays the state of a MetadataSelector, providing a
-    QListWidget for selecting one dataset and a QTextEdit for displaying parsed
-    metadata.
+    QListView for selecting one dataset, a search box for filtering the list,
+    and a QTextEdit for displaying parsed metadata.
+
+    The list is shown immediately when metadata is loaded, and symbols
+    indicating which datasets have local files are filled in once a worker
+    thread has checked for the files.
+
+    Metadata files are watched and reloaded automatically when they change.
+    Datasets that did not change keep their parsed metadata, including any
+    defaults filled in when they were launched, and only the list entries of
+    datasets that changed are updated.
     """
 
+    local_data_check_finished = QT.pyqtSignal(int, object)
+
     def __init__(self, mainwindow):
         """
         Initialize a new _MetadataSelectorQt.
@@ -803,17 +824,30 @@ class _MetadataSelectorQt(MetadataSelector, QT.QWidget):
         self.layout = QT.QVBoxLayout()
         self.setLayout(self.layout)
 
-        self.dataset_list = QT.QListWidget(self)
+        self.filter_edit = QT.QLineEdit(self)
+        self.filter_edit.setPlaceholderText('Search datasets')
+        self.filter_edit.setClearButtonEnabled(True)
+        self.layout.addWidget(self.filter_edit)
+
+        self.dataset_model = _DatasetListModel(self)
+        self.dataset_proxy_model = _DatasetFilterProxyModel(self)
+        self.dataset_proxy_model.setSourceModel(self.dataset_model)
+
+        self.dataset_list = QT.QListView(self)
+        self.dataset_list.setModel(self.dataset_proxy_model)
+        self.dataset_list.setUniformItemSizes(True)
         self.layout.addWidget(self.dataset_list)
 
-        self.dataset_list.setSelectionMode(QT.QListWidget.SingleSelection)
+        self.dataset_list.setSelectionMode(QT.QListView.SingleSelection)
+        self.dataset_list.setEditTriggers(QT.QListView.NoEditTriggers)
 
         font = self.dataset_list.font()
         font.setFamily('Courier')
         self.dataset_list.setFont(font)
 
-        self.dataset_list.currentRowChanged.connect(self._on_select)
-        self.dataset_list.itemDoubleClicked.connect(self.mainwindow.start_launch)
+        self.dataset_list.selectionModel().currentChanged.connect(self._on_select)
+        self.dataset_list.doubleClicked.connect(self.mainwindow.start_launch)
+        self.filter_edit.textChanged.connect(self._on_filter_changed)
 
         parsed_metadata_checkbox = QT.QCheckBox('&Show parsed metadata')
         parsed_metadata_checkbox.setChecked(False)
@@ -829,26 +863,74 @@ class _MetadataSelectorQt(MetadataSelector, QT.QWidget):
         font.setFamily('Courier')
         self.parsed_metadata_widget.setFont(font)
 
-    def _on_select(self, currentRow):
+        # check for local data files on a worker thread, since this can be
+        # slow on network drives; the signal is delivered on the GUI thread
+        self._local_data_check_count = 0
+        self._local_data_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='LocalDataCheck')
+        self._local_data_markers = {}
+        self.local_data_check_finished.connect(self.on_local_data_check_finished)
+
+        # reload metadata files when they change, waiting briefly since
+        # editors may write a file in several steps
+        self.file_watcher = QT.QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self._on_file_changed)
+        self.file_watcher.directoryChanged.connect(self._on_file_changed)
+        self._reload_timer = QT.QTimer(self)
+        self._reload_timer.setSingleShot(True)
+        self._reload_timer.setInterval(500)
+        self._reload_timer.timeout.connect(self._reload_changed_files)
+
+    def _on_select(self, current, previous=None):
         """
         Update the MetadataSelector's selection after changing the
-        QListWidget's selection.
+        QListView's selection.
         """
 
-        if currentRow >= 0:
-            self._selection = list(self.all_metadata)[currentRow]
+        key = self.dataset_proxy_model.data(current, QT.Qt.UserRole)
+        if key is not None:
+            self._selection = key
 
-            self.parsed_metadata_widget.setText(pprint.pformat(
-                self.selected_metadata, sort_dicts=False, width=200))
+            try:
+                text = pprint.pformat(self.selected_metadata, sort_dicts=False, width=200)
+            except Exception as e:
+                logger.error(f'Bad metadata for "{key}": {e}')
+                text = f'ERROR: {e}'
+            self.parsed_metadata_widget.setText(text)
         else:
             self._selection = None
 
+    def _on_filter_changed(self, text):
+        """
+        Show only datasets matching the search text.
+        """
+
+        self.dataset_proxy_model.set_filter_text(text)
+
+        # keep a dataset selected if any are shown
+        if not self.dataset_list.currentIndex().isValid() and self.dataset_proxy_model.rowCount() > 0:
+            self.dataset_list.setCurrentIndex(self.dataset_proxy_model.index(0, 0))
+
+    def set_current_key(self, key):
+        """
+        Select the dataset ``key`` in the list, clearing the search text if
+        the dataset is not shown.
+        """
+
+        row = self.dataset_model.row(key)
+        index = self.dataset_proxy_model.mapFromSource(self.dataset_model.index(row, 0))
+        if not index.isValid():
+            self.filter_edit.clear()
+            index = self.dataset_proxy_model.mapFromSource(self.dataset_model.index(row, 0))
+        self.dataset_list.setCurrentIndex(index)
+        self.dataset_list.scrollTo(index)
+
     def load(self):
         """
-        Load or reload the metadata file and populate the QListWidget.
+        Load or reload the metadata file and populate the QListView.
         """
 
-        # remember the current selection
+        # remember the current metadata and selection
+        old_metadata = self.all_metadata
         old_selection = self._selection
 
         try:
@@ -859,20 +941,129 @@ class _MetadataSelectorQt(MetadataSelector, QT.QWidget):
                                                     '(see console for '
                                                     'details)', msecs=5000)
 
+        if self.all_metadata is not None and self.all_metadata is not old_metadata:
+
+            # keep the parsed metadata of datasets that did not change
+            changed = _changed_datasets(old_metadata, self.all_metadata)
+            unchanged = [key for key in self.all_metadata if key not in changed]
+            if old_metadata is not None:
+                self.all_metadata._keep_resolved(old_metadata, unchanged)
+
+            # use the last check for local data files for datasets that did
+            # not change, and only recent checks for the others
+            markers = _local_data_markers(self.all_metadata, cached_only=True, keys=[key for key in self.all_metadata if key in changed])
+            markers.update({key: self._local_data_markers[key] for key in unchanged if key in self._local_data_markers})
+            self._local_data_markers = markers
+            labels = _selector_labels(self.all_metadata, markers)
+
+            if self.dataset_model.keys() == list(self.all_metadata):
+                # the same datasets are listed in the same order, so update
+                # only the entries that changed
+                self.dataset_model.set_labels(labels)
+                if changed:
+                    self.dataset_proxy_model.index_datasets(self.all_metadata)
+                if self._selection in changed:
+                    self._on_select(self.dataset_list.currentIndex())
+
+            else:
+                # repopulate the list, which triggers the selection to change
+                self.dataset_model.set_datasets(self.all_metadata, labels)
+                self.dataset_proxy_model.index_datasets(self.all_metadata)
+
+                if old_selection in self.all_metadata:
+                    # reselect the original selection if it still exists
+                    self.set_current_key(old_selection)
+                elif self.dataset_proxy_model.rowCount() > 0:
+                    # otherwise select the first item shown
+                    self.dataset_list.setCurrentIndex(self.dataset_proxy_model.index(0, 0))
+
+        if self.all_metadata is not None and self._local_data_executor is not None:
+
+            # check for local data files in the background
+            self._local_data_check_count += 1
+            self._local_data_executor.submit(self._check_local_data, self._local_data_check_count, self.all_metadata)
+
+        self._watch_files()
+
+    def stop_local_data_checks(self):
+        """
+        Cancel pending checks for local data files and stop the worker
+        thread, which would otherwise keep the interpreter from exiting.
+        """
+        if self._local_data_executor is not None:
+            self._local_data_executor.shutdown(wait=False, cancel_futures=True)
+            self._local_data_executor = None
+
+    def _watch_files(self):
+        """
+        Watch the metadata files and directories that were read.
+        """
+
         if self.all_metadata is not None:
+            files = self.all_metadata.files
+        elif self.file is not None:
+            files = [self.file]
+        else:
+            files = []
 
-            # clear and repopulate the list,
-            # which triggers the selection to change
-            self.dataset_list.clear()
-            for label in _selector_labels(self.all_metadata):
-                QT.QListWidgetItem(label, self.dataset_list)
+        if self.file_watcher.files() or self.file_watcher.directories():
+            self.file_watcher.removePaths(self.file_watcher.files() + self.file_watcher.directories())
+        files = [file for file in files if os.path.exists(file)]
+        if files:
+            self.file_watcher.addPaths(files)
 
-            if old_selection in self.all_metadata:
-                # reselect the original selection if it still exists
-                self.dataset_list.setCurrentRow(list(self.all_metadata).index(old_selection))
-            else:
-                # otherwise select the first item
-                self.dataset_list.setCurrentRow(0)
+    def _on_file_changed(self, path):
+        """
+        Schedule a reload after a metadata file changes.
+        """
+
+        self._reload_timer.start()
+
+    def _reload_changed_files(self):
+        """
+        Reload the metadata after metadata files change.
+        """
+
+        if self.all_metadata is not None and not all(os.path.exists(file) for file in self.all_metadata.files):
+            # an editor may replace a file by deleting it and writing a new
+            # one, so wait for it to reappear
+            self._reload_timer.start()
+            return
+
+        logger.info('Metadata file changed, reloading')
+        self.load()
+
+    def _check_local_data(self, request, all_metadata):
+        """
+        Check which datasets have local files and emit a signal when complete.
+        Runs on a worker thread.
+        """
+
+        markers = None
+        try:
+            markers = _local_data_markers(all_metadata)
+        except Exception as e:
+            logger.error(f'Checking for local data files failed: {e}')
+
+        try:
+            self.local_data_check_finished.emit(request, markers)
+        except RuntimeError:
+            # the selector was destroyed during the check
+            pass
+
+    def on_local_data_check_finished(self, request, markers):
+        """
+        Update the symbols indicating the presence of local data files.
+        """
+
+        if request != self._local_data_check_count:
+            # the metadata was reloaded since this check began, and a newer
+            # check is pending
+            return
+
+        if markers is not None:
+            self._local_data_markers = markers
+            self.dataset_model.set_labels(_selector_labels(self.all_metadata, markers))
 
     def toggle_parsed_metadata(self, checked):
         """
@@ -884,6 +1075,172 @@ class _MetadataSelectorQt(MetadataSelector, QT.QWidget):
         else:
             self.parsed_metadata_widget.hide()
 
+class _DatasetListModel(QT.QAbstractListModel):
+    """
+    A list model of dataset keys and their display labels.
+    """
+
+    def __init__(self, parent=None):
+        """
+        Initialize a new _DatasetListModel.
+        """
+
+        QT.QAbstractListModel.__init__(self, parent)
+
+        self._keys = []
+        self._labels = []
+        self._rows = {}
+
+    def set_datasets(self, keys, labels):
+        """
+        Replace the datasets in the list.
+        """
+
+        self.beginResetModel()
+        self._keys = list(keys)
+        self._labels = list(labels)
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self.endResetModel()
+
+    def set_labels(self, labels):
+        """
+        Update the display labels of the datasets in the list.
+        """
+
+        labels = list(labels)
+        changed = [row for row, (old, new) in enumerate(zip(self._labels, labels)) if old != new]
+        self._labels = labels
+        if changed:
+            self.dataChanged.emit(self.index(changed[0], 0), self.index(changed[-1], 0), [QT.Qt.DisplayRole])
+
+    def keys(self):
+        """
+        Return the keys of the datasets in the list.
+        """
+        return list(self._keys)
+
+    def row(self, key):
+        """
+        Return the row of dataset ``key``, raising a ValueError if it is not
+        in the list.
+        """
+        if key not in self._rows:
+            raise ValueError(f'"{key}" is not in the list')
+        return self._rows[key]
+
+    def rowCount(self, parent=QT.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._keys)
+
+    def data(self, index, role=QT.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == QT.Qt.DisplayRole:
+            return self._labels[index.row()]
+        if role == QT.Qt.UserRole:
+            return self._keys[index.row()]
+        return None
+
+class _DatasetFilterProxyModel(QT.QSortFilterProxyModel):
+    """
+    A proxy model that shows only the datasets matching search text.
+
+    Every word of the search text must begin a word in the key or description
+    of a dataset, ignoring case. The words of all datasets are indexed once in
+    sorted order, so the datasets matching a word are found by binary search,
+    and the datasets matching text that extends the previous search text are
+    found among the previous matches.
+    """
+
+    def __init__(self, parent=None):
+        """
+        Initialize a new _DatasetFilterProxyModel.
+        """
+
+        QT.QSortFilterProxyModel.__init__(self, parent)
+
+        self._tokens = []        # sorted unique words
+        self._token_rows = []    # the rows containing each word
+        self._filter_words = []
+        self._accepted = None    # the rows matching the search text, or None to show all
+
+    def index_datasets(self, all_metadata):
+        """
+        Index the words in the keys and descriptions of ``all_metadata``,
+        which must be in the same order as the source model, and apply the
+        current search text.
+        """
+
+        token_rows = {}
+        for row, key in enumerate(all_metadata):
+            text = f'{key} {_peek(all_metadata, key, "description") or ""}'
+            for token in _search_tokens(text):
+                token_rows.setdefault(token, set()).add(row)
+
+        self._tokens = sorted(token_rows)
+        self._token_rows = [token_rows[token] for token in self._tokens]
+
+        words, self._filter_words = self._filter_words, []
+        self._apply_filter_words(words)
+
+    def set_filter_text(self, text):
+        """
+        Show only the datasets matching ``text``.
+        """
+
+        self._apply_filter_words(_search_tokens(text))
+
+    def _apply_filter_words(self, words):
+        previous_words, previous_accepted = self._filter_words, self._accepted
+        self._filter_words = words
+
+        if not words:
+            accepted = None
+        elif previous_accepted is not None and _extends_search(previous_words, words):
+            # narrow the previous matches
+            accepted = previous_accepted
+            for word in words[len(previous_words) - 1:]:
+                accepted = accepted & self._rows_matching(word)
+        else:
+            accepted = self._rows_matching(words[0])
+            for word in words[1:]:
+                accepted = accepted & self._rows_matching(word)
+
+        if accepted != self._accepted:
+            self._accepted = accepted
+            self.invalidate()
+
+    def _rows_matching(self, word):
+        """
+        Return the set of rows containing a word beginning with ``word``.
+        """
+
+        first = bisect.bisect_left(self._tokens, word)
+        last = bisect.bisect_left(self._tokens, word + '\U0010ffff', first)
+        if last - first == 1:
+            return self._token_rows[first]
+        return set().union(*self._token_rows[first:last])
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self._accepted is None or source_row in self._accepted
+
+def _search_tokens(text):
+    """
+    Return the lowercase words in ``text`` for searching.
+    """
+    return re.findall(r'\w+', text.lower())
+
+def _extends_search(previous_words, words):
+    """
+    Return True if every dataset matching ``words`` must also match
+    ``previous_words``, i.e., if ``words`` only add text to the end of
+    ``previous_words``.
+    """
+    n = len(previous_words)
+    return (0 < n <= len(words) and words[:n-1] == previous_words[:n-1]
+            and words[n-1].startswith(previous_words[n-1]))
+
 class _NetworkWorker(QT.QObject):
     """
     A thread worker for for network activity (e.g., downloading data)
@@ -20,6 +20,7 @@ from ephyviewer import QT, mkQApp
 
 from . import __version__, global_config, _global_config_factory_defaults, global_config_file, default_log_level
 from .datasets.data import load_dataset
+from .datasets.metadata import MetadataSelector
 from .gui.config import EphyviewerConfigurator, available_themes, available_ui_scales
 from .gui.standalone import MainWindow
 
@@ -126,6 +127,17 @@ def parse_args(argv):
                        help='launch Jupyter with an example notebook '
                             'instead of starting the standalone app (other '
                             'args will be ignored)')
+    group.add_argument('--write-manifests',
+                       action='store_true',
+                       help='write the manifest_file of the dataset, or of '
+                            'every dataset if none is given, recording the '
+                            'sizes and checksums of local files, instead of '
+                            'starting the standalone app')
+    group.add_argument('--verify-manifests',
+                       action='store_true',
+                       help='check local files against the manifest_file of '
+                            'the dataset, or of every dataset if none is '
+                            'given, instead of starting the standalone app')
 
     args = parser.parse_args(argv[1:])
 
@@ -211,6 +223,41 @@ def launch_example_notebook():
         except FileNotFoundError as e:
             logger.error(f'Unable to locate the example notebook at {path}')
 
+def manifests_from_args(args):
+    """
+    Write or verify the manifests of the datasets selected by the
+    command-line arguments. Return True if every dataset succeeded.
+    """
+
+    file = args.file or pkg_resources.resource_filename('neurotic', 'example/metadata.yml')
+    metadata = MetadataSelector(file=file)
+    keys = [args.dataset] if args.dataset else metadata.keys
+
+    success = True
+    for key in keys:
+        metadata.select(key)
+        if not metadata['manifest_file']:
+            if args.dataset:
+                logger.error(f'"{key}" has no manifest_file')
+                success = False
+            continue
+
+        try:
+            if args.write_manifests:
+                metadata.write_manifest()
+            else:
+                results = metadata.verify_local_files()
+                for file, result in results.items():
+                    if result != 'ok':
+                        logger.error(f'{key}: {file}: {result}')
+                        success = False
+                logger.info(f'{key}: {list(results.values()).count("ok")} of {len(results)} files ok')
+        except Exception as e:
+            logger.error(f'{key}: {e}')
+            success = False
+
+    return success
+
 def main():
     """
 
@@ -219,6 +266,9 @@ def main():
     args = parse_args(sys.argv)
     if args.launch_example_notebook:
         launch_example_notebook()
+    elif args.write_manifests or args.verify_manifests:
+        if not manifests_from_args(args):
+            sys.exit(1)
     else:
         logger.info('Loading user interface')
         app = mkQApp()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.datasets.annotationindex module
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from neurotic.datasets import data
+from neurotic.datasets.metadata import MetadataSelector
+from neurotic.datasets.annotationindex import AnnotationIndex
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AnnotationIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.cache_patch = mock.patch.object(data, 'neurotic_dir', self.temp_dir.name)
+        self.cache_patch.start()
+
+        self.metadata_file = os.path.join(self.temp_dir.name, 'metadata.yml')
+        with open(self.metadata_file, 'w') as f:
+            f.write('dataset 1:\n'
+                    '    annotations_file: annotations-1.csv\n'
+                    '    epoch_encoder_file: epoch-encoder-1.csv\n'
+                    'dataset 2:\n'
+                    '    annotations_file: annotations-2.csv\n'
+                    'dataset 3:\n'
+                    '    annotations_file: not-downloaded.csv\n')
+        self._write('annotations-1.csv', 'Start (s),End (s),Type,Label\n'
+                                         '1,4,B8 activity,long\n'
+                                         '5,6,B8 activity,short\n'
+                                         '7,,Note,event\n')
+        self._write('epoch-encoder-1.csv', 'Start (s),End (s),Type\n'
+                                           '2,5,B8 activity\n')
+        self._write('annotations-2.csv', 'Start (s),End (s),Type,Label\n'
+                                         '10,13,B8 activity,\n')
+
+        self.database = os.path.join(self.temp_dir.name, 'index.sqlite')
+        self.metadata = MetadataSelector(file=self.metadata_file)
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.temp_dir.cleanup()
+
+    def _write(self, file, text):
+        with open(os.path.join(self.temp_dir.name, file), 'w') as f:
+            f.write(text)
+
+    def test_query(self):
+        """Test querying annotations across datasets"""
+        with AnnotationIndex(self.metadata, self.database) as index:
+            df = index.query(type='B8 activity', min_duration=2)
+            self.assertEqual(list(df['Dataset']), ['dataset 1', 'dataset 1', 'dataset 2'])
+            self.assertEqual(list(df['Start (s)']), [1, 2, 10])
+            self.assertEqual(list(df['Label']), ['long', '(from epoch encoder file)', ''])
+
+            df = index.query(t_start=6, t_stop=8)
+            self.assertEqual(list(df['Label']), ['short', 'event'])
+
+            df = index.query(label=['short', 'event'], datasets='dataset 1', max_duration=0)
+            self.assertEqual(list(df['Type']), ['Note'])
+
+    def test_update(self):
+        """Test that only changed files are indexed again"""
+        AnnotationIndex(self.metadata, self.database).close()
+
+        self._write('annotations-2.csv', 'Start (s),End (s),Type,Label\n'
+                                         '20,21,B8 activity,changed\n')
+        os.utime(os.path.join(self.temp_dir.name, 'annotations-2.csv'), ns=(0, 0))
+        with open(self.metadata_file, 'a') as f:
+            f.write('dataset 4:\n'
+                    '    annotations_file: annotations-2.csv\n')
+        self.metadata.load()
+        del self.metadata.all_metadata['dataset 1']
+
+        with mock.patch('neurotic.datasets.annotationindex._read_table', wraps=data._read_table) as reader:
+            with AnnotationIndex(self.metadata, self.database) as index:
+                self.assertEqual(reader.call_count, 2)
+                df = index.query()
+                self.assertEqual(list(df['Dataset']), ['dataset 2', 'dataset 4'])
+                self.assertEqual(list(df['Label']), ['changed', 'changed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -262,5 +262,31 @@ class CLITestCase(unittest.TestCase):
                          self.example_dataset,
                          'dataset was not changed correctly')
 
+    def test_manifests(self):
+        """Test that manifests can be written and verified"""
+        metadata_file = os.path.join(self.temp_dir.name, 'manifests.yml')
+        with open(metadata_file, 'w') as f:
+            f.write('with manifest:\n'
+                    '    data_file: data.txt\n'
+                    '    manifest_file: manifest.yml\n'
+                    'without manifest:\n'
+                    '    data_file: data.txt\n')
+        with open(os.path.join(self.temp_dir.name, 'data.txt'), 'w') as f:
+            f.write('data')
+
+        args = neurotic.parse_args(['neurotic', '--write-manifests', metadata_file])
+        self.assertTrue(neurotic.manifests_from_args(args))
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir.name, 'manifest.yml')))
+
+        args = neurotic.parse_args(['neurotic', '--verify-manifests', metadata_file])
+        self.assertTrue(neurotic.manifests_from_args(args))
+
+        with open(os.path.join(self.temp_dir.name, 'data.txt'), 'w') as f:
+            f.write('changed')
+        self.assertFalse(neurotic.manifests_from_args(args))
+
+        args = neurotic.parse_args(['neurotic', '--verify-manifests', metadata_file, 'without manifest'])
+        self.assertFalse(neurotic.manifests_from_args(args))
+
 if __name__ == '__main__':
     unittest.main()
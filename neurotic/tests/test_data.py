@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.datasets.data module
+"""
+
+import os
+import tempfile
+import collections
+import unittest
+from unittest import mock
+
+import numpy as np
+import quantities as pq
+import neo
+
+from neurotic.datasets import data
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AnnotationsTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.cache_patch = mock.patch.object(data, 'neurotic_dir', self.temp_dir.name)
+        self.cache_patch.start()
+
+        self.metadata = {
+            'data_dir': self.temp_dir.name,
+            'annotations_file': 'annotations.csv',
+        }
+        self.annotations_file = os.path.join(self.temp_dir.name, 'annotations.csv')
+        with open(self.annotations_file, 'w') as f:
+            f.write('Start (s),End (s),Type,Label\n'
+                    '3,4,b,first b\n'
+                    '1,,a,first a\n'
+                    '2,2.5,b,\n'
+                    '-1,1,a,negative start\n'
+                    '5,4,,end before start\n'
+                    '6,7,,no type\n')
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.temp_dir.cleanup()
+
+    def _read(self):
+        table = data._read_table(self.metadata, 'annotations_file')
+        epochs = data._create_neo_epochs_from_table(table, self.annotations_file)
+        events = data._create_neo_events_from_table(table, self.annotations_file)
+        return epochs, events
+
+    def test_grouped_by_type(self):
+        """Test that annotations are validated, sorted, and grouped by type"""
+        epochs, events = self._read()
+        self.assertEqual([ep.name for ep in epochs], ['Other', 'a', 'b'])
+        self.assertEqual([ev.name for ev in events], ['Other', 'a', 'b'])
+        np.testing.assert_array_equal(epochs[2].times.magnitude, [2, 3])
+        np.testing.assert_array_equal(epochs[2].durations.magnitude, [0.5, 1])
+        np.testing.assert_array_equal(epochs[2].labels, ['', 'first b'])
+        np.testing.assert_array_equal(epochs[1].durations.magnitude, [0])
+
+    def test_cache(self):
+        """Test that cached tables are used until the file changes"""
+        with mock.patch.object(data, '_read_annotations_file', wraps=data._read_annotations_file) as reader:
+            epochs, _ = self._read()
+            epochs_cached, _ = self._read()
+            self.assertEqual(reader.call_count, 1)
+            for ep, ep_cached in zip(epochs, epochs_cached):
+                self.assertEqual(ep.name, ep_cached.name)
+                np.testing.assert_array_equal(ep.times, ep_cached.times)
+                np.testing.assert_array_equal(ep.labels, ep_cached.labels)
+
+            with open(self.annotations_file, 'a') as f:
+                f.write('8,9,c,new type\n')
+            epochs, _ = self._read()
+            self.assertEqual(reader.call_count, 2)
+            self.assertEqual([ep.name for ep in epochs], ['Other', 'a', 'b', 'c'])
+
+    def test_cache_size(self):
+        """Test that the least recently used cached tables are deleted"""
+        files = []
+        for i in range(3):
+            files.append(os.path.join(self.temp_dir.name, f'annotations{i}.csv'))
+            with open(files[-1], 'w') as f:
+                f.write('Start (s),End (s),Type,Label\n'
+                        '1,2,a,label\n')
+        cache_files = [data._table_cache_file(file) for file in files]
+
+        data._read_table(dict(self.metadata, annotations_file=files[0]), 'annotations_file')
+        size = os.path.getsize(cache_files[0])
+        with mock.patch.object(data, '_table_cache_max_bytes', 2 * size):
+            data._read_table(dict(self.metadata, annotations_file=files[1]), 'annotations_file')
+            os.utime(cache_files[1], (0, 0))  # least recently used
+            data._read_table(dict(self.metadata, annotations_file=files[2]), 'annotations_file')
+        self.assertEqual([os.path.exists(file) for file in cache_files], [True, False, True])
+
+    def test_chunks(self):
+        """Test that parsing in chunks does not change the table"""
+        with self.assertLogs(data.logger, 'WARNING') as logs:
+            expected = data._read_annotations_file(self.metadata)
+        self.assertEqual(logs.output, [
+            'WARNING:neurotic.datasets.data:1 rows will be discarded because their Start times are missing or negative (lines 5)',
+            'WARNING:neurotic.datasets.data:1 rows will be discarded because their End times precede their Start times (lines 6)',
+        ])
+        for chunk_rows in [1, 2, 4]:
+            with self.assertLogs(data.logger, 'WARNING'):
+                table = data._read_annotations_file(self.metadata, chunk_rows)
+            for name in expected:
+                np.testing.assert_array_equal(table[name], expected[name])
+
+
+class RAUCBaselineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.metadata = {
+            'data_dir': self.temp_dir.name,
+            'data_file': 'data.bin',
+            'rauc_baseline': 'median',
+        }
+        with open(os.path.join(self.temp_dir.name, 'data.bin'), 'wb') as f:
+            f.write(b'0123')
+
+        patcher = mock.patch.object(data, '_rauc_median_cache', collections.OrderedDict())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _sig(self, name):
+        return neo.AnalogSignal(np.arange(10), units='mV', sampling_rate=1*pq.kHz, name=name)
+
+    def test_cache_size(self):
+        """Test that the least recently used medians are dropped from the cache"""
+        with mock.patch.object(data, '_rauc_median_cache_size', 2):
+            with mock.patch.object(data._elephant_tools, 'signal_median', wraps=data._elephant_tools.signal_median) as median:
+                for name in ['A', 'B', 'A', 'C', 'A', 'B']:
+                    data._rauc_baseline(self.metadata, self._sig(name), read_from_data_file=True)
+                self.assertEqual(median.call_count, 4)
+        self.assertEqual([key[5] for key in data._rauc_median_cache], ['A', 'B'])
+
+
+class SpikesFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.index = np.array([5, 1, 9, 3, 7, 2, 8, 4])
+        self.label = np.array([1, 0, 2, -1, 1, 0, 3, 2])
+        self.metadata = {
+            'data_dir': self.temp_dir.name,
+            'tridesclous_channels': {0: ['A'], 1: ['A'], 2: ['B'], 3: ['B']},
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write_files(self):
+        np.savetxt(os.path.join(self.temp_dir.name, 'spikes.csv'), np.c_[self.index, self.label], fmt='%d', delimiter=',')
+        np.save(os.path.join(self.temp_dir.name, 'spikes.npy'), np.c_[self.index, self.label])
+        spikes = np.zeros(len(self.index), dtype=data._tridesclous_spike_dtype)
+        spikes['index'] = self.index
+        spikes['cluster_label'] = self.label
+        np.save(os.path.join(self.temp_dir.name, 'spikes-structured.npy'), spikes)
+        spikes.tofile(os.path.join(self.temp_dir.name, 'spikes.raw'))
+        return ['spikes.csv', 'spikes.npy', 'spikes-structured.npy', 'spikes.raw']
+
+    def _read(self, file):
+        spikes = data._read_spikes_file(dict(self.metadata, tridesclous_file=file), None)
+        return {label: spikes['index'][spikes['offsets'][i]:spikes['offsets'][i+1]].tolist() for i, label in enumerate(spikes['labels'].tolist())}
+
+    def test_formats(self):
+        """Test reading spikes from each supported file format"""
+        for file in self._write_files():
+            self.assertEqual(self._read(file), {0: [1, 2], 1: [5, 7], 2: [9, 4], 3: [8]}, file)
+
+    def test_merge(self):
+        """Test merging clusters and dropping all others"""
+        self.metadata['tridesclous_merge'] = [[0, 1], [3]]
+        for file in self._write_files():
+            self.assertEqual(self._read(file), {0: [5, 1, 7, 2], 3: [8]}, file)
+
+    def test_spike_trains(self):
+        """Test creating spike trains from the spikes"""
+        self._write_files()
+        self.metadata['tridesclous_file'] = 'spikes.raw'
+        spikes = data._read_spikes_file(self.metadata, None)
+        sts = data._create_neo_spike_trains_from_spikes(spikes, self.metadata, 0*pq.s, 1*pq.s, 1*pq.ms)
+        self.assertEqual([st.name for st in sts], ['0', '1', '2', '3'])
+        np.testing.assert_allclose(sts[2].times.rescale('ms').magnitude, [9, 4])
+        self.assertEqual(sts[2].annotations['channels'], ['B'])
+
+
+class EventsAndEpochsTestCase(unittest.TestCase):
+
+    def test_shared_arrays(self):
+        """Test that events and epochs are added as views of each other"""
+        blk = neo.Block()
+        blk.segments.append(neo.Segment())
+        ev = neo.Event([1, 2, 3]*pq.s, labels=['a', 'b', 'c'], name='ev')
+        ep = neo.Epoch([4, 5]*pq.s, durations=[1, 2]*pq.s, labels=['d', 'e'], name='ep')
+        blk.segments[0].events.append(ev)
+        blk.segments[0].epochs.append(ep)
+
+        blk = data.load_dataset({}, blk=blk)
+        epochs = {ep.name: ep for ep in blk.segments[0].epochs}
+        events = {ev.name: ev for ev in blk.segments[0].events}
+
+        self.assertTrue(np.shares_memory(epochs['ev'], events['ev']))
+        self.assertIs(epochs['ev'].labels, events['ev'].labels)
+        np.testing.assert_array_equal(epochs['ev'].durations.magnitude, [0, 0, 0])
+        np.testing.assert_array_equal(epochs['ev'][1:].durations.magnitude, [0, 0])
+
+        self.assertTrue(np.shares_memory(events['ep'], epochs['ep']))
+        self.assertIs(events['ep'].labels, epochs['ep'].labels)
+        self.assertIsInstance(events['ep'], neo.Event)
+
+
+if __name__ == '__main__':
+    unittest.main()
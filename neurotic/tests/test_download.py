@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.datasets.download module
+"""
+
+import os
+import re
+import time
+import base64
+import hashlib
+import importlib
+import functools
+import tempfile
+import threading
+import http.server
+import urllib
+import unittest
+from unittest import mock
+
+from neurotic import global_config
+from neurotic.datasets.download import download, DownloadManager
+from neurotic.datasets.metadata import _download_datasets
+
+# the module, which is hidden by the function of the same name
+download_module = importlib.import_module('neurotic.datasets.download')
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DownloadManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.local_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+
+        self.files = [f'file{i}.bin' for i in range(8)]
+        for i, file in enumerate(self.files):
+            with open(os.path.join(self.remote_dir.name, file), 'wb') as f:
+                f.write(bytes([i]) * 1000 * (i+1))
+
+        handler = functools.partial(_SlowHTTPRequestHandler, directory=self.remote_dir.name)
+        _SlowHTTPRequestHandler.active = 0
+        _SlowHTTPRequestHandler.max_active = 0
+        _RangeHTTPRequestHandler.ranges = []
+        _RangeHTTPRequestHandler.drop_after = None
+        _RangeHTTPRequestHandler.accept_ranges = True
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.remote_dir.cleanup()
+        self.local_dir.cleanup()
+
+    def _local_data(self, file):
+        with open(os.path.join(self.local_dir.name, file), 'rb') as f:
+            return f.read()
+
+    def test_concurrent_downloads(self):
+        """Test that files are downloaded concurrently with aggregate progress"""
+        with DownloadManager(max_workers=8, max_connections_per_host=8, show_progress=False) as manager:
+            for file in self.files:
+                manager.add(f'{self.url}/{file}', os.path.join(self.local_dir.name, file))
+            manager.wait()
+            self.assertEqual(manager.progress.total, sum(1000 * (i+1) for i in range(len(self.files))))
+            self.assertEqual(manager.progress.n, manager.progress.total)
+
+        for i, file in enumerate(self.files):
+            self.assertEqual(self._local_data(file), bytes([i]) * 1000 * (i+1))
+        self.assertGreater(_SlowHTTPRequestHandler.max_active, 1)
+
+    def test_connections_per_host(self):
+        """Test that connections to one server are limited"""
+        with DownloadManager(max_workers=8, max_connections_per_host=2, show_progress=False) as manager:
+            for file in self.files:
+                manager.add(f'{self.url}/{file}', os.path.join(self.local_dir.name, file))
+            manager.wait()
+
+        self.assertEqual(_SlowHTTPRequestHandler.max_active, 2)
+
+    def test_segments_per_host(self):
+        """Test that segments of large files count against the connection limit"""
+        data = bytes(range(256)) * 4000
+        large_files = ['large0.bin', 'large1.bin']
+        for file in large_files:
+            with open(os.path.join(self.remote_dir.name, file), 'wb') as f:
+                f.write(data)
+
+        with mock.patch.dict(global_config['downloads'], {'segments_per_file': 4, 'min_segment_size_mb': 0.1}):
+            with DownloadManager(max_workers=8, max_connections_per_host=3, show_progress=False) as manager:
+                for file in large_files:
+                    manager.add(f'{self.url}/{file}', os.path.join(self.local_dir.name, file))
+                manager.wait()
+
+        for file in large_files:
+            self.assertEqual(self._local_data(file), data)
+        self.assertTrue(any(_RangeHTTPRequestHandler.ranges))
+        self.assertLessEqual(_SlowHTTPRequestHandler.max_active, 3)
+        self.assertGreater(_SlowHTTPRequestHandler.max_active, 1)
+
+    def test_errors(self):
+        """Test that download errors are raised after other downloads finish"""
+        with DownloadManager(show_progress=False) as manager:
+            manager.add(f'{self.url}/missing.bin', os.path.join(self.local_dir.name, 'missing.bin'))
+            manager.add(f'{self.url}/file0.bin', os.path.join(self.local_dir.name, 'file0.bin'))
+            with self.assertRaises(Exception):
+                manager.wait()
+        self.assertTrue(os.path.exists(os.path.join(self.local_dir.name, 'file0.bin')))
+
+    def test_download_datasets(self):
+        """Test that the files of many datasets are downloaded together"""
+        datasets = [{
+            'key': f'dataset {i}',
+            'data_dir': self.local_dir.name,
+            'remote_data_dir': self.url,
+            'data_file': file,
+            'video_file': 'file0.bin',  # shared by every dataset
+        } for i, file in enumerate(self.files)]
+
+        _download_datasets(datasets, max_connections_per_host=3, show_progress=False)
+        for i, file in enumerate(self.files):
+            self.assertEqual(self._local_data(file), bytes([i]) * 1000 * (i+1))
+        self.assertLessEqual(_SlowHTTPRequestHandler.max_active, 3)
+
+
+class ResumeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.local_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+
+        self.data = bytes(range(256)) * 4000
+        with open(os.path.join(self.remote_dir.name, 'data.bin'), 'wb') as f:
+            f.write(self.data)
+
+        handler = functools.partial(_RangeHTTPRequestHandler, directory=self.remote_dir.name)
+        _RangeHTTPRequestHandler.ranges = []
+        _RangeHTTPRequestHandler.drop_after = None
+        _RangeHTTPRequestHandler.accept_ranges = True
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/data.bin'
+        self.local_file = os.path.join(self.local_dir.name, 'data.bin')
+
+        patcher = mock.patch.dict(global_config['downloads'], {'max_retries': 2, 'retry_delay': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.remote_dir.cleanup()
+        self.local_dir.cleanup()
+
+    def _local_data(self):
+        with open(self.local_file, 'rb') as f:
+            return f.read()
+
+    def test_retry_resumes(self):
+        """Test that a dropped connection is resumed on retry"""
+        _RangeHTTPRequestHandler.drop_after = 300000
+        download(self.url, self.local_file, show_progress=False)
+        self.assertEqual(self._local_data(), self.data)
+        self.assertIn('bytes=300000-', _RangeHTTPRequestHandler.ranges)
+        self.assertFalse(os.path.exists(self.local_file + '.part'))
+        self.assertFalse(os.path.exists(self.local_file + '.part.yml'))
+
+    def test_retry_progress(self):
+        """Test that a retried download is counted once in the aggregate progress"""
+        with DownloadManager(show_progress=False) as manager:
+            _RangeHTTPRequestHandler.drop_after = 300000
+            manager.add(self.url, self.local_file)
+            manager.wait()
+            self.assertEqual(self._local_data(), self.data)
+            self.assertIn('bytes=300000-', _RangeHTTPRequestHandler.ranges)
+            self.assertEqual(manager.progress.n, len(self.data))
+            self.assertEqual(manager.progress.total, len(self.data))
+
+    def test_resume_later(self):
+        """Test that an interrupted download is resumed by a later download"""
+        _RangeHTTPRequestHandler.drop_after = 300000
+        with mock.patch.dict(global_config['downloads'], {'max_retries': 0}):
+            with self.assertRaises(ConnectionError):
+                download(self.url, self.local_file, show_progress=False)
+        self.assertFalse(os.path.exists(self.local_file))
+        self.assertEqual(os.path.getsize(self.local_file + '.part'), 300000)
+
+        _RangeHTTPRequestHandler.drop_after = None
+        download(self.url, self.local_file, show_progress=False)
+        self.assertEqual(self._local_data(), self.data)
+        self.assertEqual(_RangeHTTPRequestHandler.ranges[-1], 'bytes=300000-')
+
+    def test_remote_file_changed(self):
+        """Test that a download starts over if the remote file changed"""
+        _RangeHTTPRequestHandler.drop_after = 300000
+        with mock.patch.dict(global_config['downloads'], {'max_retries': 0}):
+            with self.assertRaises(ConnectionError):
+                download(self.url, self.local_file, show_progress=False)
+
+        self.data = self.data[::-1]
+        with open(os.path.join(self.remote_dir.name, 'data.bin'), 'wb') as f:
+            f.write(self.data)
+
+        _RangeHTTPRequestHandler.drop_after = None
+        download(self.url, self.local_file, show_progress=False)
+        self.assertEqual(self._local_data(), self.data)
+
+    def test_not_found(self):
+        """Test that missing files are not retried"""
+        with self.assertRaises(urllib.error.HTTPError):
+            download(self.url + '.missing', self.local_file, show_progress=False)
+        self.assertEqual(len(_RangeHTTPRequestHandler.ranges), 1)
+
+
+class SegmentedDownloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.local_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+
+        self.data = bytes(range(256)) * 4000
+        with open(os.path.join(self.remote_dir.name, 'data.bin'), 'wb') as f:
+            f.write(self.data)
+
+        handler = functools.partial(_RangeHTTPRequestHandler, directory=self.remote_dir.name)
+        _RangeHTTPRequestHandler.ranges = []
+        _RangeHTTPRequestHandler.drop_after = None
+        _RangeHTTPRequestHandler.accept_ranges = True
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/data.bin'
+        self.local_file = os.path.join(self.local_dir.name, 'data.bin')
+
+        # split the file into 4 segments of 256000 bytes
+        patcher = mock.patch.dict(global_config['downloads'], {
+            'max_retries': 0,
+            'retry_delay': 0,
+            'segments_per_file': 4,
+            'min_segment_size_mb': 0.1,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.remote_dir.cleanup()
+        self.local_dir.cleanup()
+
+    def _local_data(self):
+        with open(self.local_file, 'rb') as f:
+            return f.read()
+
+    def test_segments(self):
+        """Test that a large file is downloaded in segments with one progress bar"""
+        with DownloadManager(show_progress=False) as manager:
+            manager.add(self.url, self.local_file)
+            manager.wait()
+            self.assertEqual(manager.progress.total, len(self.data))
+            self.assertEqual(manager.progress.n, len(self.data))
+
+        self.assertEqual(self._local_data(), self.data)
+        self.assertCountEqual(_RangeHTTPRequestHandler.ranges,
+                              [None, 'bytes=256000-511999', 'bytes=512000-767999', 'bytes=768000-1023999'])
+
+    def test_resume_segments(self):
+        """Test that only the unfinished parts of a segmented download are downloaded again"""
+        _RangeHTTPRequestHandler.drop_after = 100000
+        with self.assertRaises(ConnectionError):
+            download(self.url, self.local_file, show_progress=False)
+        self.assertFalse(os.path.exists(self.local_file))
+
+        _RangeHTTPRequestHandler.drop_after = None
+        download(self.url, self.local_file, show_progress=False)
+        self.assertEqual(self._local_data(), self.data)
+        self.assertEqual(len(_RangeHTTPRequestHandler.ranges), 5)
+        self.assertEqual(_RangeHTTPRequestHandler.ranges[-1], 'bytes=100000-')
+
+    def test_no_segments(self):
+        """Test that files are downloaded whole if the server does not advertise ranges"""
+        _RangeHTTPRequestHandler.accept_ranges = False
+        download(self.url, self.local_file, show_progress=False)
+        self.assertEqual(self._local_data(), self.data)
+        self.assertEqual(_RangeHTTPRequestHandler.ranges, [None])
+
+
+class ConnectionReuseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.local_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+
+        self.files = [f'file{i}.bin' for i in range(5)]
+        for i, file in enumerate(self.files):
+            with open(os.path.join(self.remote_dir.name, file), 'wb') as f:
+                f.write(bytes([i]) * 1000)
+
+        handler = functools.partial(_KeepAliveHTTPRequestHandler, directory=self.remote_dir.name)
+        _KeepAliveHTTPRequestHandler.connections = 0
+        _KeepAliveHTTPRequestHandler.requests = 0
+        _KeepAliveHTTPRequestHandler.credentials = None
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def tearDown(self):
+        download_module._connection_pool.clear()
+        self.server.shutdown()
+        self.server.server_close()
+        self.remote_dir.cleanup()
+        self.local_dir.cleanup()
+
+    def _download_all(self):
+        for file in self.files:
+            download(f'{self.url}/{file}', os.path.join(self.local_dir.name, file), show_progress=False)
+        for i, file in enumerate(self.files):
+            with open(os.path.join(self.local_dir.name, file), 'rb') as f:
+                self.assertEqual(f.read(), bytes([i]) * 1000)
+
+    def test_reuse_connection(self):
+        """Test that each file takes one request over a shared connection"""
+        self._download_all()
+        self.assertEqual(_KeepAliveHTTPRequestHandler.requests, len(self.files))
+        self.assertEqual(_KeepAliveHTTPRequestHandler.connections, 1)
+
+    def test_authenticate_once(self):
+        """Test that credentials are requested once and then sent with every request"""
+        _KeepAliveHTTPRequestHandler.credentials = 'user:secret'
+        with mock.patch('builtins.input', return_value='user') as input_mock, \
+                mock.patch.object(download_module, 'getpass', return_value='secret'):
+            self._download_all()
+        input_mock.assert_called_once()
+
+        # the first file takes a refused request, a request to check the
+        # credentials, and the download
+        self.assertEqual(_KeepAliveHTTPRequestHandler.requests, len(self.files) + 2)
+
+    def test_no_user_given(self):
+        """Test that a file is skipped if no user name is given"""
+        _KeepAliveHTTPRequestHandler.credentials = 'user:secret'
+        local_file = os.path.join(self.local_dir.name, self.files[0])
+        with mock.patch('builtins.input', return_value='') as input_mock, \
+                self.assertLogs('neurotic.datasets.download', 'ERROR') as logs:
+            download(f'{self.url}/{self.files[0]}', local_file, show_progress=False)
+        input_mock.assert_called_once()
+        self.assertIn('No user given, aborting login', ' '.join(logs.output))
+        self.assertFalse(os.path.exists(local_file))
+
+    def test_bad_credentials(self):
+        """Test that a file is skipped after repeated bad credentials"""
+        _KeepAliveHTTPRequestHandler.credentials = 'user:secret'
+        local_file = os.path.join(self.local_dir.name, self.files[0])
+        with mock.patch('builtins.input', return_value='user') as input_mock, \
+                mock.patch.object(download_module, 'getpass', return_value='wrong'), \
+                self.assertLogs('neurotic.datasets.download', 'ERROR') as logs:
+            download(f'{self.url}/{self.files[0]}', local_file, show_progress=False)
+        self.assertEqual(input_mock.call_count, download_module._max_bad_login_attempts)
+        self.assertIn('Unauthorized: Aborting login', ' '.join(logs.output))
+        self.assertFalse(os.path.exists(local_file))
+
+
+class _RangeHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    A request handler that serves files with ETags and supports requests for
+    byte ranges, which it advertises if ``accept_ranges`` is True. If
+    ``drop_after`` is set, responses to requests for whole files end after
+    that many bytes, as if the connection were lost. The ``Range`` header of
+    each request is recorded in ``ranges``.
+    """
+
+    ranges = []
+    drop_after = None
+    accept_ranges = True
+
+    def __init__(self, *args, directory=None, **kwargs):
+        self.directory = directory
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        cls = _RangeHTTPRequestHandler
+        cls.ranges.append(self.headers.get('Range', None))
+
+        path = os.path.join(self.directory, self.path.lstrip('/'))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+        etag = '"{}"'.format(hashlib.md5(data).hexdigest())
+
+        start, stop = 0, len(data)
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and self.headers.get('If-Range', etag) == etag:
+            start = int(match[1])
+            stop = int(match[2]) + 1 if match[2] else len(data)
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{stop-1}/{len(data)}')
+        else:
+            self.send_response(200)
+        if cls.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(stop - start))
+        self.end_headers()
+
+        body = data[start:stop]
+        if cls.drop_after is not None and not match:
+            body = body[:cls.drop_after]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SlowHTTPRequestHandler(_RangeHTTPRequestHandler):
+    """
+    A request handler that serves files and byte ranges slowly while counting
+    the most requests handled at once.
+    """
+
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = _SlowHTTPRequestHandler
+        with cls.lock:
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(0.05)
+            super().do_GET()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+class _KeepAliveHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    A request handler that keeps connections open and counts them, and that
+    requires basic authentication if ``credentials`` is set.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    requests = 0
+    credentials = None
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            _KeepAliveHTTPRequestHandler.connections += 1
+
+    def do_GET(self):
+        cls = _KeepAliveHTTPRequestHandler
+        with cls.lock:
+            cls.requests += 1
+        if cls.credentials is not None:
+            expected = 'Basic ' + base64.b64encode(cls.credentials.encode()).decode()
+            if self.headers.get('Authorization', None) != expected:
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', 'Basic realm="test"')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
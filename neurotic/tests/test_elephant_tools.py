@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic._elephant_tools module
+"""
+
+import warnings
+import unittest
+from unittest import mock
+
+import numpy as np
+import quantities as pq
+import neo
+
+from neurotic import _elephant_tools
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class InstantaneousRateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        times = np.sort(rng.uniform(0.5, 20, 500))
+        self.st = neo.SpikeTrain(times*pq.s, t_start=0.5*pq.s, t_stop=20*pq.s)
+
+    def test_recursive_matches_fft(self):
+        """Test that recursive convolution matches FFT convolution"""
+        for kernel_cls in [_elephant_tools.ExponentialKernel,
+                           _elephant_tools.AlphaKernel,
+                           _elephant_tools.CausalAlphaKernel]:
+            for trim in [False, True]:
+                kernel = kernel_cls(0.2*pq.s)
+                self.assertTrue(_elephant_tools._has_recursive_form(kernel))
+
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    rate = _elephant_tools.instantaneous_rate(
+                        self.st, 1*pq.ms, kernel=kernel, trim=trim)
+                    with mock.patch.object(_elephant_tools, '_has_recursive_form', return_value=False):
+                        rate_fft = _elephant_tools.instantaneous_rate(
+                            self.st, 1*pq.ms, kernel=kernel, trim=trim)
+
+                self.assertEqual(rate.shape, rate_fft.shape)
+                self.assertEqual(rate.t_start, rate_fft.t_start)
+                np.testing.assert_allclose(rate.magnitude, rate_fft.magnitude, atol=1e-8)
+
+    def test_inverted_kernel_uses_fft(self):
+        """Test that inverted kernels are not convolved recursively"""
+        kernel = _elephant_tools.ExponentialKernel(0.2*pq.s, invert=True)
+        self.assertFalse(_elephant_tools._has_recursive_form(kernel))
+
+    def test_auto_kernel(self):
+        """Test rate estimation with an automatically sized kernel"""
+        rate = _elephant_tools.instantaneous_rate(self.st, 10*pq.ms)
+        self.assertEqual(rate.shape, (1950, 1))
+
+
+class SSKernelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.spiketimes = np.sort(rng.uniform(0, 100, 2000))
+
+    def _reference_density(self, x, w):
+        # the Gaussian kernel smoother of the original one-bandwidth-at-a-time
+        # implementation, with bandwidth w in units of samples
+        L = len(x)
+        n = 2
+        while n < L + 3 * w:
+            n = 2 * n
+        f = np.arange(0, n, 1.0) / n
+        f = np.concatenate((-f[:int(n / 2)], f[int(n / 2):0:-1]))
+        K = np.exp(-0.5 * (w * 2 * np.pi * f)**2)
+        return np.fft.ifft(np.fft.fft(x, n) * K, n)[:L]
+
+    def _histogram(self, spiketimes, t):
+        dt = np.min(np.diff(t))
+        yhist, _ = np.histogram(spiketimes, np.r_[t - dt / 2, t[-1] + dt / 2])
+        return yhist, dt
+
+    def test_bandwidth_grid(self):
+        """Test that batched cost evaluation matches one-by-one evaluation"""
+        w = np.linspace(0.1, 5, 50)
+        result = _elephant_tools.sskernel(self.spiketimes, w=w)
+
+        yhist, dt = self._histogram(self.spiketimes, result['t'])
+        N = np.sum(yhist)
+        x = yhist / (N * dt)
+        C = []
+        for w_ in w:
+            yh = np.abs(self._reference_density(x, w_ / dt))
+            C.append((np.sum(yh ** 2) * dt - 2 * np.sum(yh * x) * dt + 2 / np.sqrt(2 * np.pi) / w_ / N) * N * N)
+
+        np.testing.assert_allclose(result['C'], C)
+        self.assertEqual(result['optw'], w[np.argmin(C)])
+
+    def test_bootstrap(self):
+        """Test bootstrap confidence intervals"""
+        tin = np.linspace(10, 90, 200)
+        np.random.seed(0)
+        result = _elephant_tools.sskernel(self.spiketimes, tin=tin, bootstrap=True, workers=2)
+        yb = result['yb']
+        self.assertEqual(yb.shape, (1000, 200))
+        lower, upper = result['confb95']
+        ybsort = np.sort(yb, axis=0)
+        np.testing.assert_array_equal(lower, ybsort[50])
+        np.testing.assert_array_equal(upper, ybsort[950])
+
+        # compare with intervals from the original one-resample-at-a-time
+        # implementation, which bins the spikes within tin at its resolution
+        spiketimes = self.spiketimes[(self.spiketimes >= 10) & (self.spiketimes <= 90)]
+        N = len(spiketimes)
+        rng = np.random.default_rng(1)
+        reference = np.zeros((1000, len(tin)))
+        for i in range(1000):
+            yhist, dt = self._histogram(spiketimes[rng.integers(0, N, N)], tin)
+            y = self._reference_density(yhist / dt / N, result['optw'] / dt).real
+            reference[i] = y / np.sum(y * dt)
+        reference = np.sort(reference, axis=0)
+        np.testing.assert_allclose(lower, reference[50], rtol=0.05)
+        np.testing.assert_allclose(upper, reference[950], rtol=0.05)
+
+
+class RAUCTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.sig = neo.AnalogSignal(rng.normal(size=(1003, 3)), units='mV',
+                                    sampling_rate=1*pq.kHz, t_start=2*pq.s)
+
+    def _reference(self, baseline, samples_per_bin):
+        data = self.sig.magnitude - baseline
+        n_bins = int(np.ceil(len(data) / samples_per_bin))
+        padded = np.zeros((n_bins * samples_per_bin, data.shape[1]))
+        padded[:len(data)] = data
+        binned = np.abs(padded.reshape(n_bins, samples_per_bin, -1))
+        return np.trapezoid(binned, dx=1e-3, axis=1)
+
+    def test_binned(self):
+        """Test binned RAUC with a ragged final bin"""
+        baseline = self.sig.magnitude.mean(axis=0)
+        rauc = _elephant_tools.rauc(self.sig, baseline='mean', bin_duration=10*pq.ms)
+        self.assertIsInstance(rauc, neo.AnalogSignal)
+        self.assertEqual(rauc.shape, (101, 3))
+        self.assertAlmostEqual(float(rauc.t_start.rescale('s')), 2.005)
+        np.testing.assert_allclose(rauc.rescale('mV*s').magnitude, self._reference(baseline, 10))
+
+    def test_single_bin(self):
+        """Test RAUC over the entire signal"""
+        rauc = _elephant_tools.rauc(self.sig, baseline=0.1*pq.V)
+        self.assertEqual(rauc.shape, (3,))
+        np.testing.assert_allclose(rauc.rescale('mV*s').magnitude, self._reference(100, 1003)[0])
+
+    def test_blocks(self):
+        """Test that block-wise integration does not depend on block size"""
+        data = self.sig.magnitude
+        expected = _elephant_tools._rauc_bins(data, 7, 1e-3, 0.2)
+        for max_block_elements in [1, 10, 100]:
+            np.testing.assert_allclose(
+                _elephant_tools._rauc_bins(data, 7, 1e-3, 0.2, max_block_elements),
+                expected)
+
+    def _assert_rauc_equal(self, result, expected):
+        self.assertEqual(type(result), type(expected))
+        self.assertEqual(result.units, expected.units)
+        np.testing.assert_allclose(result.magnitude, expected.magnitude, atol=1e-10)
+        if isinstance(expected, neo.AnalogSignal):
+            self.assertEqual(result.t_start, expected.t_start)
+            self.assertEqual(result.sampling_period, expected.sampling_period)
+
+    def test_cumulative(self):
+        """Test RAUC from the cumulative integral for several bin durations"""
+        integral = _elephant_tools.cumulative_rauc(self.sig, baseline='median',
+                                                   max_block_elements=100)
+        self.assertEqual(integral.shape, self.sig.shape)
+        for bin_duration in [None, 1*pq.ms, 7*pq.ms, 10*pq.ms, 0.5*pq.s]:
+            expected = _elephant_tools.rauc(self.sig, baseline='median', bin_duration=bin_duration)
+            result = _elephant_tools.rauc_from_cumulative(integral, bin_duration)
+            self._assert_rauc_equal(result, expected)
+
+    def test_cumulative_base_bins(self):
+        """Test RAUC from the cumulative integral kept only at base bin edges"""
+        for base_bin_duration in [1*pq.ms, 7*pq.ms, 10*pq.ms]:
+            integral = _elephant_tools.cumulative_rauc(self.sig, baseline='median',
+                                                       base_bin_duration=base_bin_duration,
+                                                       max_block_elements=100)
+            n_bins = int(np.ceil(len(self.sig) / base_bin_duration.rescale('ms').magnitude))
+            self.assertEqual(integral.shape, (n_bins, 3))
+            for multiple in [None, 1, 2, 3, 100, 2000]:
+                bin_duration = None if multiple is None else multiple * base_bin_duration
+                expected = _elephant_tools.rauc(self.sig, baseline='median', bin_duration=bin_duration)
+                result = _elephant_tools.rauc_from_cumulative(integral, bin_duration)
+                self._assert_rauc_equal(result, expected)
+
+
+class StreamingQuantileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = np.c_[rng.normal(size=20000),
+                          rng.exponential(size=20000) * 50,
+                          np.full(20000, 7.0)]
+
+    def test_error_bound(self):
+        """Test that quantiles are within the error bound"""
+        estimator = _elephant_tools.StreamingQuantile(n_bins=256)
+        for start in range(0, len(self.data), 100):
+            # ranges of later chunks are larger, forcing the histogram to grow
+            estimator.update(self.data[start:start+100])
+        for q in [0.1, 0.5, 0.9]:
+            error = np.abs(estimator.quantile(q) - np.quantile(self.data, q, axis=0))
+            self.assertTrue(np.all(error <= estimator.error))
+
+    def test_non_finite(self):
+        """Test that non-finite samples are ignored"""
+        data = self.data.copy()
+        data[::3, 0] = np.nan
+        data[::5, 1] = np.inf
+        estimator = _elephant_tools.StreamingQuantile()
+        estimator.update(data)
+        expected = [np.median(data[np.isfinite(data[:, c]), c]) for c in range(data.shape[1])]
+        error = np.abs(estimator.median() - expected)
+        self.assertTrue(np.all(error <= estimator.error))
+
+    def test_streaming_median(self):
+        """Test median estimation for an AnalogSignal"""
+        sig = neo.AnalogSignal(self.data, units='mV', sampling_rate=1*pq.kHz)
+        median = _elephant_tools.streaming_median(sig, max_block_elements=999)
+        self.assertEqual(median.units, pq.mV)
+        np.testing.assert_allclose(median.magnitude, np.median(self.data, axis=0), atol=0.05)
+
+    def test_signal_median(self):
+        """Test that medians are exact unless the signal is very long"""
+        sig = neo.AnalogSignal(self.data, units='mV', sampling_rate=1*pq.kHz)
+        median = _elephant_tools.signal_median(sig)
+        self.assertEqual(median.units, pq.mV)
+        np.testing.assert_array_equal(median.magnitude, np.median(self.data, axis=0))
+
+        with mock.patch.object(_elephant_tools, 'streaming_median', wraps=_elephant_tools.streaming_median) as streaming_median:
+            median = _elephant_tools.signal_median(sig, max_exact_elements=self.data.size - 1)
+            streaming_median.assert_called_once()
+        np.testing.assert_allclose(median.magnitude, np.median(self.data, axis=0), atol=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
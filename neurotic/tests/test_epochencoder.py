@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.gui.epochencoder module
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+from ephyviewer import mkQApp
+
+from neurotic.gui.epochencoder import NeuroticWritableEpochSource, NeuroticEpochEncoder
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.filename = os.path.join(self.temp_dir.name, 'epoch-encoder.csv')
+        self.journal_file = self.filename + '.journal'
+        with open(self.filename, 'w') as f:
+            f.write('Start (s),End (s),Type\n'
+                    '1.0,2.0,a\n'
+                    '3.0,4.5,b\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _source(self, journal=True):
+        # a long compact_interval keeps compaction under the test's control
+        return NeuroticWritableEpochSource(self.filename, ['a', 'b'], journal=journal, compact_interval=3600)
+
+    def _assert_epochs(self, source, times, durations, labels):
+        np.testing.assert_allclose(source.ep_times, times)
+        np.testing.assert_allclose(source.ep_durations, durations)
+        np.testing.assert_array_equal(source.ep_labels, labels)
+
+    def test_save_to_journal(self):
+        """Test that journaled saves leave the file alone and are replayed"""
+        with open(self.filename) as f:
+            original = f.read()
+
+        source = self._source()
+        source.add_epoch(5.0, 1.0, 'a')
+        source.delete_epoch(0)
+        source.save()
+
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), original)
+        self.assertTrue(os.path.exists(self.journal_file))
+        self._assert_epochs(self._source(), [3, 5], [1.5, 1], ['b', 'a'])
+
+    def test_compact(self):
+        """Test that compaction rewrites the file and empties the journal"""
+        source = self._source()
+        source.add_epoch(5.0, 1.0, 'a')
+        source.save()
+        source.compact()
+
+        self.assertFalse(os.path.exists(self.journal_file))
+        self._assert_epochs(self._source(), [1, 3, 5], [1, 1.5, 1], ['a', 'b', 'a'])
+
+    def test_replay_after_compaction(self):
+        """Test that replaying a journal already compacted is harmless"""
+        source = self._source()
+        source.add_epoch(5.0, 1.0, 'a')
+        source.delete_epoch(0)
+        source.save()
+
+        # simulate a crash after the file is rewritten but before the journal
+        # is truncated
+        shutil.copy(self.journal_file, self.journal_file + '.saved')
+        source.compact()
+        shutil.copy(self.journal_file + '.saved', self.journal_file)
+
+        self._assert_epochs(self._source(), [3, 5], [1.5, 1], ['b', 'a'])
+
+    def test_save_without_journal(self):
+        """Test that a full save incorporates and removes the journal"""
+        source = self._source()
+        source.add_epoch(5.0, 1.0, 'a')
+        source.save()
+
+        source = self._source(journal=False)
+        source.delete_epoch(2)
+        source.save()
+
+        self.assertFalse(os.path.exists(self.journal_file))
+        self._assert_epochs(self._source(), [1, 3], [1, 1.5], ['a', 'b'])
+
+
+class AutosaveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.filename = os.path.join(self.temp_dir.name, 'epoch-encoder.csv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read(self):
+        source = NeuroticWritableEpochSource(self.filename, ['a', 'b'])
+        return source.ep_times.tolist(), source.ep_labels.tolist()
+
+    def test_save_in_background(self):
+        """Test that background saves write snapshots taken when requested"""
+        source = NeuroticWritableEpochSource(self.filename, ['a', 'b'])
+        source.add_epoch(1.0, 1.0, 'a')
+        source.save_in_background()
+
+        # later edits are not part of the snapshot
+        source.add_epoch(3.0, 1.0, 'b')
+        source.wait_for_background_saves()
+        self.assertEqual(self._read(), ([1], ['a']))
+        self.assertFalse(os.path.exists(self.filename + '.tmp'))
+
+    def test_newer_save_wins(self):
+        """Test that a pending background save never overwrites a newer save"""
+        source = NeuroticWritableEpochSource(self.filename, ['a', 'b'])
+        source.add_epoch(1.0, 1.0, 'a')
+        old_snapshot = source._snapshot()
+        source.add_epoch(3.0, 1.0, 'b')
+        source.save()
+        source._save_snapshot(old_snapshot)
+        self.assertEqual(self._read(), ([1, 3], ['a', 'b']))
+
+    def test_epoch_encoder(self):
+        """Test that the epoch encoder coalesces edits into one autosave"""
+        app = mkQApp()
+        source = NeuroticWritableEpochSource(self.filename, ['a', 'b'], autosave=0.05)
+        epoch_encoder = NeuroticEpochEncoder(source=source, name='Epoch encoder')
+
+        with mock.patch.object(source, 'save_in_background', wraps=source.save_in_background) as save:
+            for t in [1.0, 3.0, 5.0]:
+                source.add_epoch(t, 1.0, 'a')
+                epoch_encoder.append_history()
+            self.assertEqual(epoch_encoder.changes_since_save, 3)
+            self.assertFalse(os.path.exists(self.filename))
+
+            _process_events(app, 0.3)
+            self.assertEqual(save.call_count, 1)
+
+        self.assertEqual(epoch_encoder.changes_since_save, 0)
+        epoch_encoder.close()
+        self.assertEqual(self._read(), ([1, 3, 5], ['a', 'a', 'a']))
+
+    def test_epoch_encoder_save_fails(self):
+        """Test that changes stay unsaved if an autosave fails"""
+        app = mkQApp()
+        source = NeuroticWritableEpochSource(self.filename, ['a', 'b'], autosave=0.05)
+        epoch_encoder = NeuroticEpochEncoder(source=source, name='Epoch encoder')
+
+        with mock.patch.object(source, '_write_file', side_effect=OSError('disk full')):
+            with self.assertLogs('neurotic.gui.epochencoder', 'ERROR'):
+                source.add_epoch(1.0, 1.0, 'a')
+                epoch_encoder.append_history()
+                _process_events(app, 0.3)
+
+        self.assertEqual(epoch_encoder.changes_since_save, 1)
+        self.assertTrue(epoch_encoder.save_action.isEnabled())
+        self.assertFalse(os.path.exists(self.filename))
+
+        epoch_encoder.on_save()
+        self.assertEqual(epoch_encoder.changes_since_save, 0)
+        epoch_encoder.close()
+        self.assertEqual(self._read(), ([1], ['a']))
+
+
+def _process_events(app, duration):
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
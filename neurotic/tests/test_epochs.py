@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.datasets.epochs module
+"""
+
+import unittest
+
+import numpy as np
+import quantities as pq
+import neo
+
+from neurotic.datasets import epochs as epoch_ops
+from neurotic.datasets.epochs import EpochIndex
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class EpochIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.times = rng.uniform(0, 100, 500)
+        self.durations = rng.exponential(1, 500)
+        self.durations[::10] = 0
+        self.durations[0] = 50  # one long epoch overlapping many others
+        self.epoch = neo.Epoch(self.times*pq.s, durations=self.durations*pq.s, name='Type 1')
+        seg = neo.Segment()
+        seg.epochs = [self.epoch, neo.Epoch([1]*pq.s, durations=[1]*pq.s, name='Type 2')]
+        self.blk = neo.Block()
+        self.blk.segments.append(seg)
+
+    def test_overlapping(self):
+        """Test window queries against a linear scan"""
+        index = EpochIndex(self.blk)
+        self.assertEqual(index.names, ['Type 1', 'Type 2'])
+        ends = self.times + self.durations
+        for t_start, t_stop in [(10, 20), (49.5, 49.6), (-5, 0), (150, 160), (0, 150)]:
+            expected = np.flatnonzero((self.times <= t_stop) & (ends >= t_start))
+            result = index.overlapping('Type 1', t_start, t_stop)
+            np.testing.assert_array_equal(np.sort(result), expected)
+            self.assertTrue(np.all(np.diff(self.times[result]) >= 0))
+
+    def test_containing(self):
+        """Test point queries and masks against a linear scan"""
+        channel = EpochIndex(self.blk)['Type 1']
+        ends = self.times + self.durations
+        points = np.r_[np.linspace(-1, 101, 300), self.times[:20], ends[:20]]
+        for t in points:
+            expected = np.flatnonzero((self.times <= t) & (t < ends))
+            np.testing.assert_array_equal(np.sort(channel.containing(t)), expected)
+        expected_mask = [np.any((self.times <= t) & (t < ends)) for t in points]
+        np.testing.assert_array_equal(channel.contains(points*1000*pq.ms), expected_mask)
+
+    def test_empty(self):
+        """Test queries on a channel without epochs"""
+        index = EpochIndex([neo.Epoch(name='empty')])
+        self.assertEqual(len(index['empty'].overlapping(0, 1)), 0)
+        self.assertEqual(len(index['empty'].containing(0)), 0)
+        np.testing.assert_array_equal(index['empty'].contains([0, 1]), [False, False])
+
+
+class EpochOperationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.a = neo.Epoch(rng.integers(0, 1000, 200)*pq.ms, durations=rng.integers(0, 20, 200)*pq.ms, name='a')
+        self.b = neo.Epoch(rng.integers(0, 1000, 100)*pq.ms, durations=rng.integers(1, 50, 100)*pq.ms, name='b')
+        # half-millisecond grid points lie strictly inside or outside epochs
+        # with whole-millisecond bounds
+        self.grid = np.arange(-100, 1100) / 1000 + 0.0005
+
+    def _covers(self, epoch):
+        starts = epoch.times.rescale('s').magnitude
+        stops = starts + epoch.durations.rescale('s').magnitude
+        return np.any((starts[:, None] <= self.grid) & (self.grid < stops[:, None]), axis=0)
+
+    def _assert_disjoint(self, epoch):
+        stops = epoch.times + epoch.durations
+        self.assertTrue(np.all(epoch.times[1:] > stops[:-1]))
+        self.assertTrue(np.all(epoch.durations >= 0))
+
+    def test_operations(self):
+        """Test set operations against membership of grid points"""
+        a, b = self._covers(self.a), self._covers(self.b)
+        for result, expected in [
+                (epoch_ops.union_epochs(self.a, self.b), a | b),
+                (epoch_ops.intersect_epochs(self.a, self.b), a & b),
+                (epoch_ops.subtract_epochs(self.a, self.b), a & ~b),
+                (epoch_ops.merge_epochs(self.a), a),
+                ]:
+            self._assert_disjoint(result)
+            np.testing.assert_array_equal(self._covers(result), expected)
+
+    def test_dilate_and_merge(self):
+        """Test dilating, eroding, and merging with a gap"""
+        epoch = neo.Epoch([0, 3, 10]*pq.s, durations=[2, 1, 3]*pq.s)
+        result = epoch_ops.dilate_epochs(epoch, 0.5, 1)
+        np.testing.assert_array_equal(result.times.magnitude, [-0.5, 9.5])
+        np.testing.assert_array_equal(result.durations.magnitude, [5.5, 4.5])
+        result = epoch_ops.dilate_epochs(epoch, -0.75)
+        np.testing.assert_array_equal(result.times.magnitude, [0.75, 10.75])
+        result = epoch_ops.merge_epochs(epoch, gap=1*pq.s)
+        np.testing.assert_array_equal(result.times.magnitude, [0, 10])
+
+    def test_expression(self):
+        """Test evaluating nested epoch expressions"""
+        index = EpochIndex([self.a, self.b])
+        result = epoch_ops.evaluate_epoch_expression(
+            {'subtract': ['a', {'dilate': 'b', 'before': 0.002, 'after': 0}, 'missing']}, index)
+        expected = epoch_ops.subtract_epochs(self.a, epoch_ops.dilate_epochs(self.b, 0.002, 0))
+        np.testing.assert_array_equal(result.times, expected.times)
+        np.testing.assert_array_equal(result.durations, expected.durations)
+
+        for expression in [{'union': 'a'}, {'merge': 'a', 'before': 1}, {'union': ['a'], 'intersect': ['b']}, 3]:
+            with self.assertRaises(ValueError):
+                epoch_ops.evaluate_epoch_expression(expression, index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,12 +3,17 @@
 Tests for the GUI
 """
 
+import os
+import time
 import pkg_resources
 import tempfile
 import shutil
 import gc
 import unittest
 
+import numpy as np
+import quantities as pq
+import neo
 from ephyviewer import QT, mkQApp, MainViewer
 import neurotic
 
@@ -107,5 +112,143 @@ class GUITestCase(unittest.TestCase):
         # close thread properly
         win.close()
 
+
+class EpochDataFrameTestCase(unittest.TestCase):
+
+    def test_neo_epoch_to_dataframe(self):
+        """Test building the epoch table for the DataFrame view"""
+        from neurotic.gui.config import _neo_epoch_to_dataframe
+        epochs = [
+            neo.Epoch([2, 1]*pq.s, durations=[1, 2]*pq.s, labels=['y', 'x'], name='b'),
+            neo.Epoch([1000]*pq.ms, durations=[1000]*pq.ms, labels=['z'], name='a'),
+            neo.Epoch([0]*pq.s, durations=[1]*pq.s, labels=['(from epoch encoder file)'], name='c'),
+            neo.Epoch(name='empty'),
+        ]
+        df = _neo_epoch_to_dataframe(epochs, exclude_epoch_encoder_epochs=True)
+        np.testing.assert_array_equal(df['Start (s)'], [1, 1, 2])
+        np.testing.assert_array_equal(df['End (s)'], [2, 3, 3])
+        self.assertEqual(list(df['Type']), ['a', 'b', 'b'])
+        self.assertEqual(list(df['Label']), ['z', 'x', 'y'])
+        self.assertEqual(df['Type'].dtype, 'category')
+
+        self.assertEqual(len(_neo_epoch_to_dataframe([])), 0)
+        self.assertEqual(len(_neo_epoch_to_dataframe(epochs)), 4)
+
+
+class DatasetFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from neurotic.gui.standalone import _DatasetListModel, _DatasetFilterProxyModel
+
+        self.app = mkQApp()
+        self.all_metadata = {
+            'aplysia 1': {'description': 'Feeding, swallowing'},
+            'aplysia 2': {'description': 'Feeding, biting'},
+            'rat 1':     {'description': None},
+        }
+        self.model = _DatasetListModel()
+        self.model.set_datasets(self.all_metadata, self.all_metadata)
+        self.proxy_model = _DatasetFilterProxyModel()
+        self.proxy_model.setSourceModel(self.model)
+        self.proxy_model.index_datasets(self.all_metadata)
+
+    def _shown(self):
+        return [self.proxy_model.index(row, 0).data(QT.Qt.UserRole)
+                for row in range(self.proxy_model.rowCount())]
+
+    def test_filter(self):
+        """Test that search text filters datasets by key and description"""
+        self.assertEqual(self._shown(), ['aplysia 1', 'aplysia 2', 'rat 1'])
+
+        for text, expected in [('ap',            ['aplysia 1', 'aplysia 2']),
+                               ('apl FEED',      ['aplysia 1', 'aplysia 2']),
+                               ('apl feed bit',  ['aplysia 2']),
+                               ('apl feed bitx', []),
+                               ('1',             ['aplysia 1', 'rat 1']),
+                               ('ing',           []),
+                               ('',              ['aplysia 1', 'aplysia 2', 'rat 1'])]:
+            self.proxy_model.set_filter_text(text)
+            self.assertEqual(self._shown(), expected, text)
+
+    def test_reindex(self):
+        """Test that search text is kept when datasets change"""
+        self.proxy_model.set_filter_text('rat')
+        self.all_metadata['rat 2'] = {'description': None}
+        self.model.set_datasets(self.all_metadata, self.all_metadata)
+        self.proxy_model.index_datasets(self.all_metadata)
+        self.assertEqual(self._shown(), ['rat 1', 'rat 2'])
+
+
+class MetadataAutoReloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        from neurotic.gui.standalone import MainWindow
+
+        self.app = mkQApp()
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.file = os.path.join(self.temp_dir.name, 'metadata.yml')
+        self._write('dataset 1:\n'
+                    '    description: one\n'
+                    'dataset 2:\n'
+                    '    description: two\n')
+        self.win = MainWindow(file=self.file, initial_selection='dataset 1')
+        self.selector = self.win.metadata_selector
+
+    def tearDown(self):
+        self.win.close()
+        self.temp_dir.cleanup()
+
+    def _write(self, text):
+        with open(self.file, 'w') as f:
+            f.write(text)
+
+    def _labels(self):
+        model = self.selector.dataset_model
+        return [model.index(row, 0).data()[3:] for row in range(model.rowCount())]
+
+    def _wait_for_reload(self, old_metadata):
+        deadline = time.monotonic() + 5
+        while self.selector.all_metadata is old_metadata and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.01)
+
+    def test_auto_reload(self):
+        """Test that changes to the metadata file are loaded automatically"""
+        dataset_1 = self.selector.all_metadata['dataset 1']
+        dataset_1['plots'] = [{'channel': 'A'}]  # e.g., defaults filled in at launch
+
+        old_metadata = self.selector.all_metadata
+        self._write('dataset 1:\n'
+                    '    description: one\n'
+                    'dataset 2:\n'
+                    '    description: changed\n')
+        self._wait_for_reload(old_metadata)
+
+        self.assertIsNot(self.selector.all_metadata, old_metadata)
+        self.assertEqual(self._labels(), ['dataset 1    one', 'dataset 2    changed'])
+        self.assertEqual(self.selector._selection, 'dataset 1')
+
+        # unchanged datasets keep their parsed metadata
+        self.assertIs(self.selector.all_metadata['dataset 1'], dataset_1)
+        self.assertEqual(self.selector['plots'], [{'channel': 'A'}])
+
+        old_metadata = self.selector.all_metadata
+        self._write('dataset 3:\n'
+                    '    description: three\n')
+        self._wait_for_reload(old_metadata)
+        self.assertEqual(self._labels(), ['dataset 3    three'])
+        self.assertEqual(self.selector._selection, 'dataset 3')
+
+    def test_close(self):
+        """Test that closing the window stops checks for local data files"""
+        executor = self.selector._local_data_executor
+        self.win.close()
+        self.assertTrue(executor._shutdown)
+        self.assertIsNone(self.selector._local_data_executor)
+
+        # reloading afterwards does not start new checks
+        self.selector.load()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.datasets.manifest module
+"""
+
+import os
+import functools
+import tempfile
+import threading
+import http.server
+import unittest
+from unittest import mock
+
+from neurotic.datasets import manifest
+from neurotic.datasets.manifest import write_manifest, read_manifest, verify_files
+from neurotic.datasets.metadata import _download_all_data_files
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.data_dir = self.temp_dir.name
+        self.manifest_file = os.path.join(self.data_dir, 'manifest.yml')
+        self.files = ['data.bin', os.path.join('videos', 'video.bin')]
+        self._write('data.bin', b'0123456789' * 100000)
+        self._write(os.path.join('videos', 'video.bin'), b'abc')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, file, data):
+        path = os.path.join(self.data_dir, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_write_and_verify(self):
+        """Test that local files are verified against a manifest"""
+        entries = write_manifest(self.manifest_file, self.data_dir, self.files + ['missing.bin'])
+        self.assertEqual(list(entries), ['data.bin', 'videos/video.bin'])
+        self.assertEqual(entries['videos/video.bin']['size'], 3)
+        self.assertEqual(entries['videos/video.bin']['sha256'],
+                         'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad')
+        self.assertEqual(read_manifest(self.manifest_file), entries)
+
+        self.assertEqual(verify_files(entries, self.data_dir, self.files),
+                         {'data.bin': 'ok', self.files[1]: 'ok'})
+
+        self._write('data.bin', b'0123456789' * 99999 + b'012345678X')
+        self._write(os.path.join('videos', 'video.bin'), b'ab')
+        self.assertEqual(verify_files(entries, self.data_dir, self.files + ['other.bin']),
+                         {'data.bin': 'wrong checksum', self.files[1]: 'wrong size', 'other.bin': 'not in manifest'})
+        self.assertEqual(verify_files(entries, self.data_dir, ['data.bin'], check_hashes=False),
+                         {'data.bin': 'ok'})
+
+        os.remove(os.path.join(self.data_dir, 'data.bin'))
+        self.assertEqual(verify_files(entries, self.data_dir, ['data.bin']), {'data.bin': 'missing'})
+
+    def test_rewrite(self):
+        """Test that only changed files are hashed again"""
+        write_manifest(self.manifest_file, self.data_dir, self.files)
+        self._write('data.bin', b'changed')
+        with mock.patch.object(manifest, '_hash_file', wraps=manifest._hash_file) as hash_file:
+            entries = write_manifest(self.manifest_file, self.data_dir, self.files)
+            hash_file.assert_called_once_with(os.path.join(self.data_dir, 'data.bin'))
+        self.assertEqual(entries['data.bin']['size'], 7)
+
+    def test_chunks(self):
+        """Test that files are hashed correctly across chunks"""
+        with mock.patch.object(manifest, '_bytes_per_chunk', 7):
+            entries = write_manifest(self.manifest_file, self.data_dir, self.files)
+        self.assertEqual(verify_files(entries, self.data_dir, self.files),
+                         {'data.bin': 'ok', self.files[1]: 'ok'})
+
+
+class DownloadWithManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.local_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+
+        with open(os.path.join(self.remote_dir.name, 'data.bin'), 'wb') as f:
+            f.write(b'0123456789' * 1000)
+        write_manifest(os.path.join(self.remote_dir.name, 'manifest.yml'), self.remote_dir.name, ['data.bin'])
+
+        handler = functools.partial(_QuietHTTPRequestHandler, directory=self.remote_dir.name)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.metadata = {
+            'data_dir': self.local_dir.name,
+            'remote_data_dir': f'http://127.0.0.1:{self.server.server_port}',
+            'data_file': 'data.bin',
+            'manifest_file': 'manifest.yml',
+        }
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.remote_dir.cleanup()
+        self.local_dir.cleanup()
+
+    def _local_data(self):
+        with open(os.path.join(self.local_dir.name, 'data.bin'), 'rb') as f:
+            return f.read()
+
+    def test_replace_incomplete_file(self):
+        """Test that incomplete local files are downloaded again"""
+        with open(os.path.join(self.local_dir.name, 'data.bin'), 'wb') as f:
+            f.write(b'0123')
+
+        _download_all_data_files(self.metadata, show_progress=False)
+        self.assertEqual(self._local_data(), b'0123456789' * 1000)
+        self.assertTrue(os.path.exists(os.path.join(self.local_dir.name, 'manifest.yml')))
+
+    def test_keep_complete_file(self):
+        """Test that complete local files are not downloaded again"""
+        with open(os.path.join(self.local_dir.name, 'data.bin'), 'wb') as f:
+            f.write(b'9876543210' * 1000)
+
+        with self.assertLogs('neurotic.datasets.download', 'INFO') as logs:
+            _download_all_data_files(self.metadata, show_progress=False)
+        self.assertIn('Skipping data.bin (already exists)', ' '.join(logs.output))
+        self.assertEqual(self._local_data(), b'9876543210' * 1000)
+
+    def test_bad_download(self):
+        """Test that downloaded files that do not match the manifest are deleted"""
+        with open(os.path.join(self.remote_dir.name, 'data.bin'), 'wb') as f:
+            f.write(b'9876543210' * 1000)
+
+        with self.assertRaisesRegex(ValueError, 'wrong checksum'):
+            _download_all_data_files(self.metadata, show_progress=False)
+        self.assertFalse(os.path.exists(os.path.join(self.local_dir.name, 'data.bin')))
+
+
+class _QuietHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
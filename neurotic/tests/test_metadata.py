@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neurotic.datasets.metadata module
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from neurotic.datasets import metadata
+from neurotic.datasets.metadata import MetadataSelector
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class MetadataCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.cache_patch = mock.patch.object(metadata, 'neurotic_dir', self.temp_dir.name)
+        self.cache_patch.start()
+        self.memory_patch = mock.patch.object(metadata, '_metadata_cache', {})
+        self.memory_patch.start()
+
+        self.file = os.path.join(self.temp_dir.name, 'metadata.yml')
+        with open(self.file, 'w') as f:
+            f.write('dataset 1:\n'
+                    '    data_dir: data\n'
+                    '    data_file: data.axgx\n')
+
+    def tearDown(self):
+        self.memory_patch.stop()
+        self.cache_patch.stop()
+        self.temp_dir.cleanup()
+
+    def test_cache(self):
+        """Test that unchanged metadata files are not parsed again"""
+        with mock.patch.object(metadata, '_parse_metadata', wraps=metadata._parse_metadata) as parser:
+            selector = MetadataSelector(file=self.file, initial_selection='dataset 1')
+            self.assertEqual(selector['data_dir'], os.path.join(self.temp_dir.name, 'data'))
+            selector['data_file'] = 'modified.axgx'
+
+            # cached in memory, and protected from modification
+            selector.load()
+            self.assertEqual(selector['data_file'], 'data.axgx')
+
+            # cached on disk
+            metadata._metadata_cache.clear()
+            selector.load()
+            self.assertEqual(parser.call_count, 1)
+
+            # a different local_data_root resolves paths differently without
+            # parsing again
+            other = MetadataSelector(file=self.file, local_data_root=os.path.join(self.temp_dir.name, 'other'),
+                                     initial_selection='dataset 1')
+            self.assertEqual(other['data_dir'], os.path.join(self.temp_dir.name, 'other', 'data'))
+            self.assertEqual(parser.call_count, 1)
+
+            # changes to the file are detected
+            with open(self.file, 'a') as f:
+                f.write('dataset 2:\n'
+                        '    data_file: data.axgx\n')
+            selector.load()
+            self.assertEqual(selector.keys, ['dataset 1', 'dataset 2'])
+            self.assertEqual(parser.call_count, 2)
+
+
+class IncludeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.cache_patch = mock.patch.object(metadata, 'neurotic_dir', self.temp_dir.name)
+        self.cache_patch.start()
+        self.memory_patch = mock.patch.object(metadata, '_metadata_cache', {})
+        self.memory_patch.start()
+
+        self.file = self._write('metadata.yml',
+                                'neurotic_config:\n'
+                                '    remote_data_root: http://server\n'
+                                '    include: [more.yml, experiments]\n'
+                                'dataset 1:\n'
+                                '    description: first\n')
+        self._write('more.yml',
+                    'dataset 2:\n'
+                    '    remote_data_dir: more\n')
+        self._write('experiments/b.yml',
+                    'neurotic_config:\n'
+                    '    remote_data_root: http://other\n'
+                    'dataset 4:\n'
+                    '    remote_data_dir: b\n')
+        self._write('experiments/a.yaml',
+                    'dataset 3:\n'
+                    '    data_dir: data\n'
+                    '    video_file: video.mp4\n')
+
+    def tearDown(self):
+        self.memory_patch.stop()
+        self.cache_patch.stop()
+        self.temp_dir.cleanup()
+
+    def _write(self, name, text):
+        file = os.path.join(self.temp_dir.name, name)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, 'w') as f:
+            f.write(text)
+        return file
+
+    def test_include(self):
+        """Test that included files and directories are read in order"""
+        selector = MetadataSelector(file=self.file)
+        self.assertEqual(selector.keys, ['dataset 1', 'dataset 2', 'dataset 3', 'dataset 4'])
+
+        selector.select('dataset 2')
+        self.assertEqual(selector['remote_data_dir'], 'http://server/more')
+        selector.select('dataset 3')
+        self.assertEqual(selector['data_dir'], os.path.join(self.temp_dir.name, 'experiments', 'data'))
+        selector.select('dataset 4')
+        self.assertEqual(selector['remote_data_dir'], 'http://other/b')
+
+        # a directory may be loaded directly
+        selector = MetadataSelector(file=os.path.join(self.temp_dir.name, 'experiments'))
+        self.assertEqual(selector.keys, ['dataset 3', 'dataset 4'])
+
+    def test_only_changed_files_are_parsed(self):
+        """Test that only changed files are parsed again"""
+        MetadataSelector(file=self.file)
+        with mock.patch.object(metadata, '_parse_metadata', wraps=metadata._parse_metadata) as parser:
+            self._write('more.yml',
+                        'dataset 2:\n'
+                        '    description: changed\n')
+            selector = MetadataSelector(file=self.file)
+            parser.assert_called_once_with(os.path.join(self.temp_dir.name, 'more.yml'))
+        self.assertEqual(selector.all_metadata.peek('dataset 2', 'description'), 'changed')
+
+    def test_lazy(self):
+        """Test that data sets are resolved only when accessed"""
+        selector = MetadataSelector(file=self.file)
+        with mock.patch.object(metadata, '_resolve_metadata', wraps=metadata._resolve_metadata) as resolve:
+            labels = metadata._selector_labels(selector.all_metadata, {})
+            self.assertEqual(labels[0].split(), ['dataset', '1', 'first'])
+            self.assertEqual(labels[2][1], '!')
+            resolve.assert_not_called()
+
+            selector.select('dataset 1')
+            self.assertEqual(selector['description'], 'first')
+            self.assertEqual(selector['t_width'], 40)
+            selector['t_width'] = 10
+            self.assertEqual(selector['t_width'], 10)
+            self.assertEqual(resolve.call_count, 1)
+
+    def test_duplicates(self):
+        """Test that data sets may not appear in more than one file"""
+        self._write('more.yml',
+                    'dataset 1:\n'
+                    '    description: again\n')
+        with self.assertRaises(ValueError):
+            MetadataSelector(file=self.file)
+
+
+class LocalDataMarkersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix='neurotic-')
+        self.listings_patch = mock.patch.object(metadata, '_directory_listings', {})
+        self.listings_patch.start()
+
+        for directory in ['a', 'b']:
+            os.mkdir(os.path.join(self.temp_dir.name, directory))
+        for file in ['a/data.axgx', 'a/video.mp4', 'b/data.axgx']:
+            open(os.path.join(self.temp_dir.name, file), 'w').close()
+
+        def dataset(data_dir, **files):
+            return dict(data_dir=os.path.join(self.temp_dir.name, data_dir), description=None, video_offset=None, **files)
+
+        self.all_metadata = {
+            'all':      dataset('a', data_file='data.axgx', video_file='video.mp4'),
+            'some':     dataset('b', data_file='data.axgx', video_file='video.mp4'),
+            'none':     dataset('c', data_file='data.axgx'),
+            'no files': dataset('a', data_file=None),
+        }
+
+    def tearDown(self):
+        self.listings_patch.stop()
+        self.temp_dir.cleanup()
+
+    def test_markers(self):
+        """Test that markers indicate which datasets have local files"""
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            markers = metadata._local_data_markers(self.all_metadata)
+            self.assertEqual(markers, {'all': '◆', 'some': '⬖', 'none': '◇', 'no files': '◆'})
+
+            # each directory is listed once
+            self.assertEqual(scandir.call_count, 3)
+
+            # recent listings are reused
+            metadata._local_data_markers(self.all_metadata)
+            self.assertEqual(scandir.call_count, 3)
+
+        labels = metadata._selector_labels(self.all_metadata, markers)
+        self.assertEqual([label[0] for label in labels], ['◆', '⬖', '◇', '◆'])
+
+    def test_cached_only(self):
+        """Test that only recent listings are used if requested"""
+        metadata._list_directory(os.path.join(self.temp_dir.name, 'a'))
+        with mock.patch('os.scandir') as scandir:
+            markers = metadata._local_data_markers(self.all_metadata, cached_only=True)
+            scandir.assert_not_called()
+        self.assertEqual(markers, {'all': '◆', 'no files': '◆'})
+
+        labels = metadata._selector_labels(self.all_metadata, markers)
+        self.assertEqual([label[0] for label in labels], ['◆', ' ', ' ', '◆'])
+
+    def test_expiration(self):
+        """Test that listings expire and are forgotten after downloads"""
+        directory = os.path.join(self.temp_dir.name, 'c')
+        self.assertEqual(metadata._list_directory(directory), set())
+
+        os.mkdir(directory)
+        open(os.path.join(directory, 'data.axgx'), 'w').close()
+        self.assertEqual(metadata._list_directory(directory), set())
+
+        metadata._forget_directory_listing(directory)
+        self.assertEqual(metadata._list_directory(directory), {'data.axgx'})
+
+        with mock.patch.object(metadata, '_directory_listing_ttl', 0):
+            os.remove(os.path.join(directory, 'data.axgx'))
+            self.assertEqual(metadata._list_directory(directory), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
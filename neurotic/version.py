@@ -0,0 +1,4 @@
+"""THIS FILE WAS GENERATED BY SETUP.PY DURING BUILDING/PACKAGING"""
+version = '1.5.1.dev0+git.19e4617'
+git_revision = '19e46176909a3561d57738474e00115fd98a6bd9'
+git_dirty = False